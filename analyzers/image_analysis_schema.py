@@ -0,0 +1,448 @@
+"""Typed schema for image analysis output
+
+The models below are the single definition of the analysis JSON: they
+validate and coerce LLM responses, render the JSON skeleton embedded in
+the prompt, and produce the structured-output schema sent to the provider.
+"""
+
+import json
+from typing import Annotated, Any, Dict, List, Optional
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, ValidationError, create_model
+
+
+def _coerce_terms(value: Any) -> List[str]:
+    """Accept a list of terms, a single term, or null"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        return [str(key) for key in value]
+    return [item if isinstance(item, str) else str(item) for item in value if item is not None]
+
+
+def _coerce_scores(value: Any) -> Dict[str, float]:
+    """Accept {term: score} or the structured-output [{term, score}] form"""
+    if value is None:
+        return {}
+    if isinstance(value, list):
+        value = {
+            str(item['term']): item.get('score')
+            for item in value
+            if isinstance(item, dict) and 'term' in item
+        }
+    if not isinstance(value, dict):
+        raise ValueError("expected an object mapping terms to scores")
+    scores = {}
+    for key, score in value.items():
+        try:
+            scores[str(key)] = float(score)
+        except (TypeError, ValueError):
+            continue
+    return scores
+
+
+def _coerce_score(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+Terms = Annotated[List[str], BeforeValidator(_coerce_terms)]
+Scores = Annotated[Dict[str, float], BeforeValidator(_coerce_scores)]
+Score = Annotated[float, BeforeValidator(_coerce_score)]
+
+
+def terms(*examples: str) -> Any:
+    """A list of search terms; examples are shown in the prompt skeleton"""
+    return Field(default_factory=list, json_schema_extra={'kind': 'terms', 'skeleton': list(examples)})
+
+
+def scores(**examples: float) -> Any:
+    """A term -> score mapping; examples are shown in the prompt skeleton"""
+    return Field(default_factory=dict, json_schema_extra={'kind': 'scores', 'skeleton': examples})
+
+
+def score(example: float) -> Any:
+    """A single 0-1 score"""
+    return Field(default=0.0, json_schema_extra={'kind': 'score', 'skeleton': example})
+
+
+class _Node(BaseModel):
+    """Lenient base: unknown keys from the model are kept, not rejected"""
+    model_config = ConfigDict(extra='allow')
+
+
+# nlp_analysis
+
+class SemanticClusters(_Node):
+    primary_concepts: Terms = terms("Core", "semantic", "themes")
+    related_concepts: Terms = terms("Connected", "concepts")
+    contextual_meanings: Terms = terms("Context", "specific", "interpretations")
+    confidence_scores: Scores = scores(cluster1=0.95, cluster2=0.85)
+
+
+class LinguisticPatterns(_Node):
+    common_phrases: Terms = terms("Frequently", "used", "phrases")
+    word_combinations: Terms = terms("Common", "word", "pairs")
+    language_variations: Terms = terms("Different", "ways", "of", "saying")
+    regional_dialects: Terms = terms("Regional", "language", "variations")
+
+
+class QueryIntentAnalysis(_Node):
+    informational_patterns: Terms = terms("How", "users", "ask", "questions")
+    commercial_patterns: Terms = terms("Purchase", "intent", "patterns")
+    navigational_patterns: Terms = terms("Finding", "specific", "products")
+    pattern_confidence: Scores = scores(pattern1=0.9, pattern2=0.8)
+
+
+class SentimentMapping(_Node):
+    positive_associations: Terms = terms("Positive", "descriptors")
+    negative_concerns: Terms = terms("Problem", "statements")
+    neutral_descriptors: Terms = terms("Factual", "terms")
+
+
+class NLPAnalysis(_Node):
+    semantic_clusters: SemanticClusters
+    linguistic_patterns: LinguisticPatterns
+    query_intent_analysis: QueryIntentAnalysis
+    sentiment_mapping: SentimentMapping
+
+
+# long_tail_opportunities
+
+class SpecificFeatures(_Node):
+    detailed_attributes: Terms = terms("Specific", "feature", "searches")
+    unique_combinations: Terms = terms("Feature", "combination", "searches")
+    technical_specs: Terms = terms("Specification", "based", "searches")
+    confidence_scores: Scores = scores(tail1=0.8, tail2=0.7)
+
+
+class UseCaseVariations(_Node):
+    specific_scenarios: Terms = terms("Scenario", "based", "searches")
+    problem_solutions: Terms = terms("Problem", "specific", "searches")
+    situation_specific: Terms = terms("Situation", "based", "queries")
+
+
+class ModifierCombinations(_Node):
+    descriptive_modifiers: Terms = terms("Adjective", "combinations")
+    feature_modifiers: Terms = terms("Feature", "specifications")
+    intent_modifiers: Terms = terms("Purpose", "indicators")
+    priority_score: Scores = scores(mod1=0.85, mod2=0.75)
+
+
+class NicheTargeting(_Node):
+    demographic_niches: Terms = terms("Specific", "user", "groups")
+    geographic_niches: Terms = terms("Location", "specific", "terms")
+    interest_niches: Terms = terms("Interest", "based", "terms")
+
+
+class LongTailOpportunities(_Node):
+    specific_features: SpecificFeatures
+    use_case_variations: UseCaseVariations
+    modifier_combinations: ModifierCombinations
+    niche_targeting: NicheTargeting
+
+
+# keyword_intelligence
+
+class PrimaryKeywords(_Node):
+    head_terms: Terms = terms("Main", "search", "terms")
+    body_terms: Terms = terms("Secondary", "terms")
+    long_tail: Terms = terms("Specific", "detailed", "terms")
+    volume_scores: Scores = scores(term1=0.9, term2=0.7)
+
+
+class KeywordHierarchy(_Node):
+    parent_terms: Terms = terms("Broader", "categories")
+    child_terms: Terms = terms("Specific", "variants")
+
+
+class KeywordRelationships(_Node):
+    semantic_groups: Terms = terms("Related", "term", "clusters")
+    co_occurrence: Terms = terms("Terms", "used", "together")
+    hierarchy: KeywordHierarchy
+
+
+class QueryPatterns(_Node):
+    question_formats: Terms = terms("How", "what", "where", "patterns")
+    comparison_formats: Terms = terms("Versus", "alternative", "patterns")
+    specification_formats: Terms = terms("With", "without", "patterns")
+
+
+class KeywordIntelligence(_Node):
+    primary_keywords: PrimaryKeywords
+    keyword_relationships: KeywordRelationships
+    query_patterns: QueryPatterns
+
+
+# lsi_foundations
+
+class SemanticRelationships(_Node):
+    primary_concepts: Terms = terms("Core", "themes")
+    related_concepts: Terms = terms("Connected", "themes")
+    contextual_variations: Terms = terms("Context", "specific", "terms")
+
+
+class ContentSignals(_Node):
+    title_elements: Terms = terms("Key", "title", "terms")
+    description_components: Terms = terms("Description", "keywords")
+    contextual_markers: Terms = terms("Context", "signals")
+
+
+class TopicRelationships(_Node):
+    parent_topics: Terms = terms("Broader", "themes")
+    child_topics: Terms = terms("Specific", "themes")
+
+
+class TopicalRelevance(_Node):
+    main_topics: Terms = terms("Primary", "themes")
+    subtopics: Terms = terms("Related", "themes")
+    topic_relationships: TopicRelationships
+
+
+class LSISemanticClusters(_Node):
+    term_associations: Terms = terms("Related", "terms")
+    concept_groups: Terms = terms("Concept", "clusters")
+    relevance_scores: Scores = scores(cluster1=0.9, cluster2=0.8)
+
+
+class LSIFoundations(_Node):
+    semantic_relationships: SemanticRelationships
+    content_signals: ContentSignals
+    topical_relevance: TopicalRelevance
+    semantic_clusters: LSISemanticClusters
+
+
+# answer_engine_optimization
+
+class FeaturedSnippetOpportunities(_Node):
+    definition_patterns: Terms = terms("What is", "types of", "meaning of")
+    step_patterns: Terms = terms("How to", "steps to", "guide for")
+    list_patterns: Terms = terms("Best", "top", "essential", "checklist")
+    table_patterns: Terms = terms("Comparison", "vs", "specifications")
+    priority_score: Scores = scores(pattern1=0.9, pattern2=0.8)
+
+
+class KnowledgePanelSignals(_Node):
+    entity_information: Terms = terms("Key", "product", "facts")
+    specifications: Terms = terms("Technical", "details")
+    classifications: Terms = terms("Category", "markers")
+    relationships: Terms = terms("Related", "entities")
+
+
+class QuestionClusters(_Node):
+    informational: Terms = terms("What", "how", "why")
+    commercial: Terms = terms("Price", "buy", "best")
+    navigational: Terms = terms("Where", "find", "near")
+
+
+class QuestionOptimization(_Node):
+    direct_questions: Terms = terms("Common", "user", "questions")
+    implied_questions: Terms = terms("Implicit", "query", "patterns")
+    comparison_questions: Terms = terms("Versus", "better", "patterns")
+    question_clusters: QuestionClusters
+
+
+class RichResultTargets(_Node):
+    product_markup: Terms = terms("Essential", "product", "attributes")
+    review_signals: Terms = terms("Review", "rating", "patterns")
+    faq_opportunities: Terms = terms("Frequently", "asked", "questions")
+    priority_score: Scores = scores(target1=0.9, target2=0.8)
+
+
+class VoiceSearchPatterns(_Node):
+    natural_queries: Terms = terms("Conversational", "search", "patterns")
+    question_formats: Terms = terms("Voice", "query", "structures")
+    context_markers: Terms = terms("Situational", "indicators")
+    confidence_scores: Scores = scores(pattern1=0.85, pattern2=0.75)
+
+
+class AnswerEngineOptimization(_Node):
+    featured_snippet_opportunities: FeaturedSnippetOpportunities
+    knowledge_panel_signals: KnowledgePanelSignals
+    question_optimization: QuestionOptimization
+    rich_result_targets: RichResultTargets
+    voice_search_patterns: VoiceSearchPatterns
+
+
+# search_optimization (optional)
+
+class ContentGaps(_Node):
+    missing_topics: Terms = terms("Uncovered", "topics")
+    thin_content: Terms = terms("Weak", "coverage", "areas")
+    opportunity_score: Scores = scores(gap1=0.9, gap2=0.8)
+
+
+class MarketGaps(_Node):
+    underserved_queries: Terms = terms("Neglected", "search", "opportunities")
+    weak_coverage: Terms = terms("Poorly", "served", "intents")
+    emerging_trends: Terms = terms("Rising", "search", "patterns")
+    confidence_scores: Scores = scores(gap1=0.9, gap2=0.8)
+
+
+class CompetitorBlindspots(_Node):
+    content_gaps: Terms = terms("Missing", "content", "types")
+    intent_gaps: Terms = terms("Unaddressed", "user", "needs")
+    feature_gaps: Terms = terms("Unique", "product", "advantages")
+    priority_score: Scores = scores(blindspot1=0.85, blindspot2=0.75)
+
+
+class DifficultyScores(_Node):
+    head_terms: Scores = scores(term1=0.8, term2=0.7)
+    long_tail: Scores = scores(tail1=0.4, tail2=0.3)
+
+
+class CompetitionLevel(_Node):
+    direct: Score = score(0.8)
+    indirect: Score = score(0.6)
+    potential: Score = score(0.4)
+
+
+class GapValue(_Node):
+    traffic_potential: Score = score(0.9)
+    conversion_potential: Score = score(0.85)
+    ranking_potential: Score = score(0.75)
+
+
+class OpportunityMetrics(_Node):
+    difficulty_scores: DifficultyScores
+    competition_level: CompetitionLevel
+    gap_value: GapValue
+
+
+class ExploitationStrategy(_Node):
+    primary_targets: Terms = terms("High", "value", "gaps")
+    secondary_targets: Terms = terms("Supporting", "opportunities")
+    quick_wins: Terms = terms("Low", "competition", "terms")
+    priority_score: Scores = scores(target1=0.95, target2=0.85)
+
+
+class CompetitiveGapAnalysis(_Node):
+    market_gaps: MarketGaps
+    competitor_blindspots: CompetitorBlindspots
+    opportunity_metrics: OpportunityMetrics
+    exploitation_strategy: ExploitationStrategy
+
+
+class SearchIntentMapping(_Node):
+    early_funnel: Terms = terms("Discovery", "phase", "terms")
+    mid_funnel: Terms = terms("Consideration", "phase", "terms")
+    late_funnel: Terms = terms("Decision", "phase", "terms")
+
+
+class SearchOptimization(_Node):
+    content_gaps: ContentGaps
+    competitive_gap_analysis: CompetitiveGapAnalysis
+    search_intent_mapping: SearchIntentMapping
+
+
+class ImageAnalysisResult(_Node):
+    """Complete image analysis returned by the LLM"""
+    nlp_analysis: NLPAnalysis
+    long_tail_opportunities: LongTailOpportunities
+    keyword_intelligence: KeywordIntelligence
+    lsi_foundations: LSIFoundations
+    answer_engine_optimization: AnswerEngineOptimization
+    search_optimization: Optional[SearchOptimization] = None
+
+
+ANALYSIS_SECTIONS = list(ImageAnalysisResult.model_fields)
+REQUIRED_SECTIONS = [
+    name for name, field in ImageAnalysisResult.model_fields.items() if field.is_required()
+]
+
+
+def _model_type(annotation: Any) -> Optional[type]:
+    """The BaseModel class behind a field annotation, if any"""
+    for candidate in (annotation, *getattr(annotation, '__args__', ())):
+        if isinstance(candidate, type) and issubclass(candidate, BaseModel):
+            return candidate
+    return None
+
+
+def _skeleton(model: type) -> Dict[str, Any]:
+    skeleton = {}
+    for name, field in model.model_fields.items():
+        nested = _model_type(field.annotation)
+        skeleton[name] = _skeleton(nested) if nested else field.json_schema_extra['skeleton']
+    return skeleton
+
+
+def _provider_schema(model: type) -> Dict[str, Any]:
+    properties = {}
+    required = []
+    for name, field in model.model_fields.items():
+        # Sections that may be absent (default None) stay optional; leaf
+        # defaults only make validation lenient, so the model must fill them
+        if field.is_required() or field.default is not None:
+            required.append(name)
+        nested = _model_type(field.annotation)
+        if nested:
+            properties[name] = _provider_schema(nested)
+            continue
+        kind = field.json_schema_extra['kind']
+        if kind == 'terms':
+            properties[name] = {'type': 'array', 'items': {'type': 'string'}}
+        elif kind == 'score':
+            properties[name] = {'type': 'number'}
+        else:
+            # Free-form maps are not expressible; use [{term, score}] pairs
+            properties[name] = {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {'term': {'type': 'string'}, 'score': {'type': 'number'}},
+                    'required': ['term', 'score']
+                }
+            }
+    return {'type': 'object', 'properties': properties, 'required': required}
+
+
+# One-section documents ({section: {...}}) for sharded generation
+SECTION_MODELS = {
+    name: create_model(
+        f"{_model_type(field.annotation).__name__}Shard",
+        __base__=_Node,
+        **{name: (_model_type(field.annotation), ...)}
+    )
+    for name, field in ImageAnalysisResult.model_fields.items()
+}
+
+# Rendered once at import; the models never change at runtime
+PROMPT_SKELETON = json.dumps(_skeleton(ImageAnalysisResult), indent=4)
+RESPONSE_SCHEMA = _provider_schema(ImageAnalysisResult)
+SECTION_SKELETONS = {name: json.dumps(_skeleton(model), indent=4) for name, model in SECTION_MODELS.items()}
+SECTION_RESPONSE_SCHEMAS = {name: _provider_schema(model) for name, model in SECTION_MODELS.items()}
+
+
+def validate_analysis(data: Any) -> Dict[str, Any]:
+    """Validate and coerce a parsed LLM response
+
+    Raises:
+        pydantic.ValidationError: If required sections or subsections are missing
+    """
+    return ImageAnalysisResult.model_validate(data).model_dump(exclude_none=True)
+
+
+def validate_section(name: str, data: Any) -> Dict[str, Any]:
+    """Validate and coerce a one-section document produced by a sharded request
+
+    Raises:
+        pydantic.ValidationError: If the section or its subsections are missing
+    """
+    return SECTION_MODELS[name].model_validate(data).model_dump()
+
+
+def coerce_section(name: str, value: Any) -> Any:
+    """Coerce one top-level section as it streams in; unknown or invalid input is passed through"""
+    field = ImageAnalysisResult.model_fields.get(name)
+    model = _model_type(field.annotation) if field else None
+    if model is None:
+        return value
+    try:
+        return model.model_validate(value).model_dump()
+    except ValidationError:
+        return value
@@ -1,25 +1,82 @@
 """Image analysis service using vision LLMs"""
 
+import asyncio
+import functools
+import hashlib
 import logging
+import os
+import random
 import re
-from pathlib import Path
-from typing import Dict, Any, List, Optional, Union
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional, Tuple, Union
 from enum import Enum
-from pydantic import BaseModel
-from fastapi import FastAPI, HTTPException
+import aiohttp
+from pydantic import BaseModel, ValidationError
+from fastapi import APIRouter, FastAPI, HTTPException, Request
+from fastapi.responses import Response
 
-from utils.llm_base import LLMProvider
+from analyzers.image_analysis_schema import (
+    ANALYSIS_SECTIONS,
+    PROMPT_SKELETON,
+    REQUIRED_SECTIONS,
+    RESPONSE_SCHEMA,
+    SECTION_RESPONSE_SCHEMAS,
+    SECTION_SKELETONS,
+    coerce_section,
+    validate_analysis,
+    validate_section
+)
+from utils.http_client import create_http_session
+from utils.responses import FastJSONResponse, negotiated_response
+from utils.image_preprocess import get_image_preprocessor
+from utils.image_preprocess import PreparedImage
+from utils.json_stream import IncrementalJSONParser
+from utils.llm_base import LLMProvider, LLMError, ImageFetchError, ProviderError, ResponseFormatError
 from utils.llm_factory import LLMFactory
+from utils.logging_config import brief, sampled
+from utils.metrics import IN_FLIGHT, LLM_ATTEMPTS, RETRIES, observe_stage, stage
+from utils.prompt_registry import RenderedPrompt, get_prompt_registry
+from utils.result_cache import ResultCache
+from utils.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
-# Initialize FastAPI app
-app = FastAPI(
-    title="Image Analysis Service",
-    description="Analyze product images using vision LLMs",
-    version="1.0.0"
+ANALYSIS_PROMPT = "image_analysis_prompt"
+DEFAULT_ANALYSIS_PROMPT = "Please analyze this image in detail."
+
+# ANALYSIS_MODE: one request for the whole document, or one concurrent
+# request per schema section (each retried on its own) merged afterwards
+SINGLE_MODE = "single"
+SHARDED_MODE = "sharded"
+
+# Retry policy defaults, overridable through the environment
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_DEADLINE_SECONDS = 90.0
+DEFAULT_IMAGE_CONCURRENCY = 4
+# Seconds startup waits for warm-up (ANALYSIS_PREWARM=0 skips it)
+PREWARM_TIMEOUT_SECONDS = 10.0
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_CAP_SECONDS = 10.0
+
+REPAIR_PROMPT = (
+    "The following text was meant to be a single JSON object but is malformed or truncated. "
+    "Return ONLY the corrected, complete JSON object, preserving all existing content.\n\n"
 )
 
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given 0-based attempt"""
+    return random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+# Progress callback: on_event(event, data) with events
+#   'section' {'name', 'data'}: a top-level analysis section finished parsing
+#   'retry'   {'attempt', 'error'[, 'section']}: earlier sections (or the named
+#             section, in sharded mode) are superseded by a new attempt
+EventCallback = Callable[[str, Dict[str, Any]], None]
+
+class AnalysisFailed(LLMError):
+    """No valid response was produced within the attempt budget"""
+
 class Platform(str, Enum):
     """Supported platforms"""
     ALL = "all"
@@ -29,79 +86,71 @@ class ImageAnalysisRequest(BaseModel):
     image_urls: List[str]
     context: Optional[Dict[str, Any]] = None
     platform: Optional[str] = None
+    bypass_cache: bool = False
 
 class ImageAnalyzer:
     """Analyze product images using vision LLMs"""
     
-    def _validate_json(self, data: Dict[str, Any]) -> bool:
-        """Validate that we have a complete JSON structure"""
-        required_sections = [
-            'nlp_analysis',
-            'long_tail_opportunities',
-            'answer_engine_optimization'
-        ]
+    def __init__(self):
+        """Initialize the ImageAnalyzer"""
+        self.http_session: Optional[aiohttp.ClientSession] = None
+        self.llm = LLMFactory.from_env()
+        self.result_cache = ResultCache()
+        self.max_attempts = int(os.environ.get("ANALYSIS_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+        self.deadline = float(os.environ.get("ANALYSIS_DEADLINE_SECONDS", DEFAULT_DEADLINE_SECONDS))
         
-        # Check for required top-level sections
-        missing = [key for key in required_sections if key not in data]
-        if missing:
-            logger.warning(f"Missing required sections: {missing}")
-            return False
-            
-        # Check for required nested structures
-        validation_score = 0
-        max_score = 3  # One point for each main section being mostly complete
+        # Ask the provider for schema-constrained JSON (ANALYSIS_STRUCTURED_OUTPUT=0 to disable)
+        structured = os.environ.get("ANALYSIS_STRUCTURED_OUTPUT", "1").lower() not in ("0", "false", "no")
+        self.response_schema = RESPONSE_SCHEMA if structured else None
+        self.mode = os.environ.get("ANALYSIS_MODE", SINGLE_MODE).lower()
         
-        if 'nlp_analysis' in data:
-            required_nlp = ['semantic_clusters', 'linguistic_patterns', 'query_intent_analysis', 'sentiment_mapping']
-            present = sum(1 for key in required_nlp if key in data['nlp_analysis'])
-            if present >= len(required_nlp) * 0.75:  # 75% of required subsections
-                validation_score += 1
-            else:
-                logger.warning(f"NLP analysis missing too many sections: {[key for key in required_nlp if key not in data['nlp_analysis']]}")
-                
-        if 'long_tail_opportunities' in data:
-            required_tail = ['specific_features', 'use_case_variations', 'modifier_combinations']
-            present = sum(1 for key in required_tail if key in data['long_tail_opportunities'])
-            if present >= len(required_tail) * 0.75:
-                validation_score += 1
-            else:
-                logger.warning(f"Long tail missing too many sections: {[key for key in required_tail if key not in data['long_tail_opportunities']]}")
-                
-        if 'answer_engine_optimization' in data:
-            required_aeo = ['featured_snippet_opportunities', 'knowledge_panel_signals', 'rich_result_patterns']
-            present = sum(1 for key in required_aeo if key in data['answer_engine_optimization'])
-            if present >= len(required_aeo) * 0.66:  # 66% for AEO since it's less critical
-                validation_score += 1
-            else:
-                logger.warning(f"AEO missing sections: {[key for key in required_aeo if key not in data['answer_engine_optimization']]}")
+        # Identical concurrent analyses share one run; optionally across
+        # worker processes too, through leases in the shared result cache
+        self.single_flight = SingleFlight()
+        self.shared_single_flight = os.environ.get("ANALYSIS_SHARED_SINGLE_FLIGHT", "0").lower() in ("1", "true", "yes")
+        self.prewarm = os.environ.get("ANALYSIS_PREWARM", "1").lower() not in ("0", "false", "no")
         
-        # Return true if we have at least 2 out of 3 sections mostly complete
-        return validation_score >= 2
-                
-        return True
-    
-    def __init__(self):
-        """Initialize the ImageAnalyzer"""
-        self.llm = LLMFactory.create(LLMProvider.GEMINI)
+        # Fan-out limits for multi-image requests
+        self.image_concurrency = int(os.environ.get("ANALYSIS_IMAGE_CONCURRENCY", DEFAULT_IMAGE_CONCURRENCY))
+        self.image_timeout = float(os.environ.get("ANALYSIS_IMAGE_TIMEOUT_SECONDS", self.deadline))
         
-        # Load the prompt template
-        prompts_dir = Path(__file__).parent.parent / "prompts"
-        self.analysis_prompt = self._load_prompt(prompts_dir / "image_analysis_prompt.md")
+        # The schema skeleton is static, so it becomes part of the cacheable prompt prefix
+        self.prompts = get_prompt_registry()
+        if ANALYSIS_PROMPT not in self.prompts:
+            logger.warning(f"Prompt not found: {ANALYSIS_PROMPT}, using default")
+            self.prompts.add(ANALYSIS_PROMPT, DEFAULT_ANALYSIS_PROMPT)
+        self.prompts.bind(ANALYSIS_PROMPT, response_schema=PROMPT_SKELETON)
+        for section in ANALYSIS_SECTIONS:
+            self.prompts.derive(
+                f"{ANALYSIS_PROMPT}.{section}",
+                ANALYSIS_PROMPT,
+                response_schema=SECTION_SKELETONS[section]
+            )
         
         logger.info("ImageAnalyzer initialized")
         
-    def _load_prompt(self, path: Path) -> str:
-        """Load a prompt template from file"""
-        if not path.exists():
-            logger.warning(f"Prompt file not found: {path}, using default")
-            return "Please analyze this image in detail."
-            
-        with open(path, 'r') as f:
-            return f.read()
-        
     def set_llm_provider(self, provider: LLMProvider, api_key: Optional[str] = None) -> None:
         """Change LLM provider"""
-        self.llm = LLMFactory.create(provider, api_key)
+        self.llm = LLMFactory.create(provider, api_key, http_session=self.http_session)
+        
+    def set_http_session(self, http_session: Optional[aiohttp.ClientSession]) -> None:
+        """Share a pooled HTTP session with the LLM client"""
+        self.http_session = http_session
+        self.llm.set_http_session(http_session)
+        
+    async def warm_up(self) -> None:
+        """Start preprocessing workers and open provider connections before the first request"""
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(get_image_preprocessor().warm_up(), self.llm.warm_up()),
+                timeout=PREWARM_TIMEOUT_SECONDS
+            )
+        except Exception as e:
+            # Only the first requests pay for a failed warm-up
+            logger.warning(f"Warm-up failed: {str(e) or type(e).__name__}")
+            return
+        logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s")
         
     async def analyze(self, request: ImageAnalysisRequest) -> Dict[str, Any]:
         """Analyze product images"""
@@ -115,20 +164,29 @@ class ImageAnalyzer:
                     }
                 }
                 
-            results = []
-            for url in request.image_urls:
-                analysis = await self._analyze_single_image(
+            semaphore = asyncio.Semaphore(self.image_concurrency)
+            timed_results = await asyncio.gather(*[
+                self._analyze_image_timed(
                     url,
+                    semaphore,
                     context=request.context or {},
-                    platform=request.platform
+                    platform=request.platform,
+                    use_cache=not request.bypass_cache
                 )
-                results.append(analysis)
+                for url in request.image_urls
+            ])
+            results = [analysis for analysis, _ in timed_results]
+            images = [timing for _, timing in timed_results]
+            succeeded = sum(1 for timing in images if timing['status'] == 'success')
                 
             # For now, we'll skip the summary for multiple images
             # since our new structure is much more comprehensive
             return {
                 "analyses": results,
+                "images": images,
                 "summary": {
+                    "succeeded": succeeded,
+                    "failed": len(images) - succeeded,
                     "common_themes": {
                         "strengths": ["See individual analyses"],
                         "areas_for_improvement": ["See individual analyses"]
@@ -140,117 +198,466 @@ class ImageAnalyzer:
             logger.error(f"Image analysis failed: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
             
-    def _clean_json_string(self, json_str: str) -> str:
-        """Clean and normalize JSON string for parsing."""
-        # Remove any potential Unicode BOM and whitespace
-        json_str = json_str.strip().lstrip('\ufeff')
+    async def _analyze_image_timed(
+        self,
+        image_url: str,
+        semaphore: asyncio.Semaphore,
+        context: Dict[str, Any],
+        platform: Optional[str],
+        use_cache: bool
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Analyze one image of a multi-image request under the fan-out limit
         
-        # Remove any trailing commas before closing braces/brackets
-        json_str = re.sub(r',\s*([\]\}])', r'\1', json_str)
+        Never raises: failures and timeouts become error results so the
+        other images of the request still come back.
+        """
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async with asyncio.timeout(self.image_timeout):
+                    analysis = await self._analyze_single_image(
+                        image_url,
+                        context=context,
+                        platform=platform,
+                        use_cache=use_cache
+                    )
+            except TimeoutError:
+                analysis = {
+                    'status': 'error',
+                    'error_message': f'Image analysis exceeded the {self.image_timeout}s timeout',
+                    'image_url': image_url
+                }
+            except Exception as e:
+                logger.error(f"Image analysis failed for {image_url}: {str(e)}")
+                analysis = {
+                    'status': 'error',
+                    'error_message': str(e),
+                    'image_url': image_url
+                }
+            duration_ms = (time.perf_counter() - started) * 1000
+            
+        status = 'error' if analysis.get('status') == 'error' else 'success'
+        return analysis, {
+            'image_url': image_url,
+            'status': status,
+            'duration_ms': round(duration_ms, 1)
+        }
         
-        # Handle potential line breaks in strings
-        json_str = json_str.replace('\n', '\\n')
+    def _render_prompt(self, context: Dict[str, Any], section: Optional[str] = None) -> RenderedPrompt:
+        """Substitute request context into the analysis prompt, or one section's prompt"""
+        name = ANALYSIS_PROMPT if section is None else f"{ANALYSIS_PROMPT}.{section}"
+        return self.prompts.render(name, context)
         
-        # Fix common JSON formatting issues
-        json_str = re.sub(r'\s+', ' ', json_str)  # Normalize whitespace
-        json_str = re.sub(r',\s*,', ',', json_str)  # Fix double commas
-        json_str = re.sub(r'\}\s*\{', '},{', json_str)  # Fix adjacent objects
-        json_str = re.sub(r'\]\s*\[', '],[', json_str)  # Fix adjacent arrays
+    async def _prepare_image(self, image_url: str) -> PreparedImage:
+        """Fetch and preprocess an image, retrying only transient failures"""
+        for attempt in range(self.max_attempts):
+            try:
+                return await self.llm.prepare_image(image_url)
+            except ImageFetchError as e:
+                if not e.retryable or attempt == self.max_attempts - 1:
+                    raise
+                delay = backoff_delay(attempt)
+                RETRIES.inc(operation='image_fetch')
+                logger.warning(f"⚠️ Image fetch failed: {str(e)}. Retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+                
+    async def _generate_analysis(
+        self,
+        image_url: str,
+        prompt: RenderedPrompt,
+        image: PreparedImage,
+        on_event: Optional[EventCallback] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Run one LLM generation and parse it into a dict, reporting sections as they complete"""
+        logger.debug("Sending request to Gemini...")
+        response = None
+        parser = None
+        response_buffer = []
+        emitted = set()
+        started = time.perf_counter()
+        async for chunk in self.llm.analyze_image_stream(
+            image_url=image_url,
+            prompt=prompt,
+            image=image,
+            response_schema=response_schema
+        ):
+            if started is not None:
+                # Time to first output, whichever client or pool member produced it
+                observe_stage('analysis_first_output', time.perf_counter() - started)
+                started = None
+            if isinstance(chunk, str):
+                # Client streamed raw text; parse it as it arrives
+                parser = parser or IncrementalJSONParser()
+                for name, section in parser.feed(chunk):
+                    emitted.add(name)
+                    self._emit_section(on_event, name, section)
+                response_buffer.append(chunk)
+            elif isinstance(chunk, dict):
+                response = chunk
+                break
         
-        # Balance quotes
-        quote_count = json_str.count('"')
-        if quote_count % 2 == 1:  # Odd number of quotes
-            json_str = json_str.rstrip('"')  # Remove trailing quote if present
+        if parser is not None:
+            logger.debug("Received complete response from Gemini")
+            try:
+                with stage('json_parse'):
+                    response = parser.close()
+            except ValueError as e:
+                raise ResponseFormatError(str(e), ''.join(response_buffer)) from e
+            # Sections only close() finished (e.g. a truncated last one) were not reported yet
+            for name, section in response.items():
+                if name not in emitted:
+                    self._emit_section(on_event, name, section)
+        if response is None:
+            raise ResponseFormatError("Empty response from LLM")
+        logger.debug("JSON parsed successfully")
+        return response
         
-        return json_str
+    @staticmethod
+    def _emit_section(on_event: Optional[EventCallback], name: str, section: Any) -> None:
+        if on_event is not None:
+            on_event('section', {'name': name, 'data': coerce_section(name, section)})
+            
+    async def _repair_response(self, raw_text: str) -> Optional[Dict[str, Any]]:
+        """Ask the LLM to fix malformed JSON without re-sending the image"""
+        if not raw_text.strip():
+            return None
+        logger.info("Attempting JSON repair of malformed response...")
+        try:
+            with stage('json_repair'):
+                repaired = await self.llm.generate(REPAIR_PROMPT + raw_text, expect_json=True)
+        except (LLMError, ValueError) as e:
+            logger.warning(f"⚠️ JSON repair failed: {str(e)}")
+            return None
+        return repaired if isinstance(repaired, dict) else None
         
     async def _analyze_single_image(
         self,
         image_url: str,
         context: Dict[str, Any],
-        platform: Optional[str]
+        platform: Optional[str],
+        use_cache: bool = True,
+        on_event: Optional[EventCallback] = None
     ) -> Dict[str, Any]:
-        """Analyze a single product image"""
-        try:
-            logger.info(f"Starting analysis of image: {image_url}")
-            logger.info(f"Context: {context}")
-            if platform:
-                logger.info(f"Platform: {platform}")
-
-            # Build prompt with context
-            prompt = self.analysis_prompt
-            for key in ['description', 'occasion', 'platform', 'personalized', 'voice']:
-                placeholder = "${" + key + "}"
-                value = context.get(key, "Not specified")
-                prompt = prompt.replace(placeholder, value)
-            logger.info("Prompt template prepared")
+        """Analyze a single product image
+        
+        Validated results are cached on (image hash, rendered prompt, model,
+        generation config); pass use_cache=False to force a fresh analysis.
+        The whole analysis, including retries, is bounded by self.deadline.
+        on_event, if given, receives sections as they stream in.
+        """
+        # Per-request detail is sampled (LOG_SAMPLE_RATE) and the context kept brief
+        if sampled():
+            logger.info("Starting analysis of image: %s", image_url, extra={'context': brief(context), 'platform': platform})
             
-            # Analyze image with retries and validation
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    logger.info(f"Starting analysis attempt {attempt + 1} of {max_retries}")
-                    
-                    # Get response from LLM with streaming
-                    logger.info("Sending request to Gemini...")
-                    response_buffer = []
-                    async for chunk in self.llm.analyze_image_stream(
-                        image_url=image_url,
-                        prompt=prompt,
-                        expect_json=True
-                    ):
-                        if isinstance(chunk, str):
-                            response_buffer.append(chunk)
-                        elif isinstance(chunk, dict):
-                            response = chunk
-                            break
-                    
-                    # If we got string chunks, combine and parse
-                    if response_buffer:
-                        raw_response = ''.join(response_buffer)
-                        logger.info("Received complete response from Gemini")
-                        cleaned_json = self._clean_json_string(raw_response)
-                        response = self.llm.parse_json(cleaned_json)
-                    logger.info("JSON parsed successfully")
-                    
-                    # Validate JSON structure
-                    logger.info("Validating response structure...")
-                    if not self._validate_json(response):
-                        logger.warning(
-                            f"Invalid JSON structure on attempt {attempt + 1}. "
-                            f"Missing sections: {[k for k in ['nlp_analysis', 'long_tail_opportunities', 'answer_engine_optimization'] if k not in response]}"
-                        )
-                        if attempt == max_retries - 1:
-                            return {
-                                'status': 'error',
-                                'error_message': 'Failed to generate valid JSON structure after all retries',
-                                'image_url': image_url
-                            }
-                        continue
-                        
-                    logger.info("✨ Analysis completed successfully!")
-                    logger.info(f"Response sections: {list(response.keys())}")
-                    return response
-                    
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        logger.error(f"❌ All {max_retries} attempts failed. Last error: {str(e)}")
-                        return {
-                            'status': 'error',
-                            'error_message': f'Failed after {max_retries} attempts: {str(e)}',
-                            'image_url': image_url
-                        }
-                    logger.warning(f"⚠️ Attempt {attempt + 1} failed: {str(e)}. Retrying...")
-                    continue
+        # Rendered once: it keys the shared run below and is what gets sent
+        with stage('prompt_render'):
+            prompt = self._render_prompt(context)
+        logger.debug("Prompt template prepared")
             
+        # Requests for the same image and rendered prompt await one shared run
+        flight_key = hashlib.sha256('\0'.join([
+            image_url,
+            str(prompt),
+            self.mode,
+            str(use_cache)
+        ]).encode('utf-8')).hexdigest()
+        with stage('image_analysis'):
+            result = await self.single_flight.run(
+                flight_key,
+                lambda fanout: self._analyze_bounded(image_url, context, prompt, use_cache, fanout),
+                on_event
+            )
+        # Callers annotate their result (e.g. metadata); keep the shared one intact
+        return dict(result)
+        
+    async def _analyze_bounded(
+        self,
+        image_url: str,
+        context: Dict[str, Any],
+        prompt: RenderedPrompt,
+        use_cache: bool,
+        on_event: Optional[EventCallback] = None
+    ) -> Dict[str, Any]:
+        """Run one analysis under the deadline, turning expected failures into error results"""
+        try:
+            async with asyncio.timeout(self.deadline):
+                with IN_FLIGHT.track(operation='image_analysis'):
+                    return await self._analyze_with_retries(image_url, context, prompt, use_cache, on_event)
+        except TimeoutError:
+            logger.error(f"❌ Analysis of {image_url} exceeded the {self.deadline}s deadline")
+            return {
+                'status': 'error',
+                'error_message': f'Analysis exceeded the {self.deadline}s deadline',
+                'image_url': image_url
+            }
+        except ImageFetchError as e:
+            logger.error(f"❌ Failed to fetch image {image_url}: {str(e)}")
+            return {
+                'status': 'error',
+                'error_message': str(e),
+                'image_url': image_url
+            }
         except Exception as e:
             logger.error(f"❌ Failed to analyze image {image_url}: {str(e)}")
             raise
             
-# Initialize analyzer
-analyzer = ImageAnalyzer()
+    async def _analyze_with_retries(
+        self,
+        image_url: str,
+        context: Dict[str, Any],
+        prompt: RenderedPrompt,
+        use_cache: bool,
+        on_event: Optional[EventCallback] = None
+    ) -> Dict[str, Any]:
+        """Prepare the image once, then retry only the LLM stage"""
+        # Prepare the image once; it is reused by every attempt below
+        with stage('image_prepare'):
+            image = await self._prepare_image(image_url)
+        cache_key = ResultCache.make_key(
+            image.data,
+            str(prompt),
+            self.llm.model_name,
+            {
+                **self.llm.generation_config,
+                'response_schema': self.response_schema,
+                'analysis_mode': self.mode
+            }
+        )
+        if use_cache:
+            with stage('result_cache_lookup'):
+                cached = await self.result_cache.get(cache_key)
+            if cached is not None:
+                logger.debug("Returning cached analysis result")
+                for name, section in cached.items():
+                    self._emit_section(on_event, name, section)
+                return cached
+                
+        if not (use_cache and self.shared_single_flight):
+            return await self._run_analysis(image_url, context, prompt, image, cache_key, on_event)
+            
+        # Another worker may already be analyzing this exact image and prompt
+        if not await self.result_cache.acquire_lease(cache_key, self.deadline):
+            logger.info("Identical analysis running in another worker, waiting for its result")
+            cached = await self.result_cache.wait_for(cache_key)
+            if cached is not None:
+                for name, section in cached.items():
+                    self._emit_section(on_event, name, section)
+                return cached
+            # That worker failed; compute it here
+            await self.result_cache.acquire_lease(cache_key, self.deadline)
+        try:
+            return await self._run_analysis(image_url, context, prompt, image, cache_key, on_event)
+        finally:
+            await self.result_cache.release_lease(cache_key)
+            
+    async def _run_analysis(
+        self,
+        image_url: str,
+        context: Dict[str, Any],
+        prompt: RenderedPrompt,
+        image: PreparedImage,
+        cache_key: str,
+        on_event: Optional[EventCallback] = None
+    ) -> Dict[str, Any]:
+        """Generate, validate and cache the analysis of a prepared image"""
+        try:
+            if self.mode == SHARDED_MODE:
+                response = await self._analyze_sharded(image_url, context, image, on_event)
+            else:
+                response = await self._generate_validated(
+                    image_url,
+                    prompt,
+                    image,
+                    self.response_schema,
+                    validate_analysis,
+                    on_event
+                )
+        except AnalysisFailed as e:
+            logger.error(f"❌ Analysis of {image_url} failed: {str(e)}")
+            return {
+                'status': 'error',
+                'error_message': str(e),
+                'image_url': image_url
+            }
+            
+        logger.info("✨ Analysis completed successfully: %s", image_url)
+        logger.debug("Response sections: %s", list(response))
+        with stage('result_cache_store'):
+            await self.result_cache.put(cache_key, response)
+        return response
+        
+    async def _analyze_sharded(
+        self,
+        image_url: str,
+        context: Dict[str, Any],
+        image: PreparedImage,
+        on_event: Optional[EventCallback] = None
+    ) -> Dict[str, Any]:
+        """Generate every schema section concurrently and merge the results
+        
+        Each section is retried on its own. A failed optional section is
+        dropped; a failed required section cancels the others.
+        """
+        async def run(section: str) -> Optional[Dict[str, Any]]:
+            try:
+                return await self._generate_validated(
+                    image_url,
+                    self._render_prompt(context, section),
+                    image,
+                    SECTION_RESPONSE_SCHEMAS[section] if self.response_schema else None,
+                    functools.partial(validate_section, section),
+                    on_event,
+                    section=section
+                )
+            except AnalysisFailed as e:
+                if section in REQUIRED_SECTIONS:
+                    raise AnalysisFailed(f"Section {section}: {str(e)}") from e
+                logger.warning(f"⚠️ Dropping optional section {section}: {str(e)}")
+                return None
+                
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = {section: group.create_task(run(section)) for section in ANALYSIS_SECTIONS}
+        except* Exception as failures:
+            # Fail as single mode does: with the first error, unexpected ones as AnalysisFailed
+            error = failures.exceptions[0]
+            if isinstance(error, LLMError):
+                raise error
+            raise AnalysisFailed(f"Section failed: {type(error).__name__}: {str(error)}") from error
+            
+        merged = {
+            section: task.result()[section]
+            for section, task in tasks.items()
+            if task.result() is not None
+        }
+        return validate_analysis(merged)
+        
+    async def _generate_validated(
+        self,
+        image_url: str,
+        prompt: RenderedPrompt,
+        image: PreparedImage,
+        response_schema: Optional[Dict[str, Any]],
+        validate: Callable[[Dict[str, Any]], Dict[str, Any]],
+        on_event: Optional[EventCallback] = None,
+        section: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Generate until validate() accepts a response, retrying only what is worth retrying
+        
+        Raises:
+            AnalysisFailed: If the attempts run out or the provider rejects the request
+        """
+        label = f"[{section}] " if section else ""
+        last_error = "no attempts made"
+        for attempt in range(self.max_attempts):
+            logger.debug("%sStarting analysis attempt %d of %d", label, attempt + 1, self.max_attempts)
+            if attempt > 0:
+                RETRIES.inc(operation='analysis')
+            if attempt > 0 and on_event is not None:
+                retry = {'attempt': attempt + 1, 'error': last_error}
+                if section:
+                    retry['section'] = section
+                on_event('retry', retry)
+            try:
+                with stage('llm_generate'):
+                    response = await self._generate_analysis(image_url, prompt, image, on_event, response_schema)
+            except ResponseFormatError as e:
+                LLM_ATTEMPTS.inc(outcome='malformed')
+                last_error = str(e)
+                logger.warning(f"⚠️ {label}Attempt {attempt + 1} returned malformed JSON: {str(e)}")
+                response = await self._repair_response(e.raw_text)
+                if response is None:
+                    continue
+                # Re-send everything; sections seen before the break may have changed
+                for name, value in response.items():
+                    self._emit_section(on_event, name, value)
+            except ProviderError as e:
+                LLM_ATTEMPTS.inc(outcome='provider_error')
+                last_error = str(e)
+                if not e.retryable:
+                    logger.error(f"❌ {label}Provider rejected the request: {str(e)}")
+                    break
+                if attempt < self.max_attempts - 1:
+                    delay = backoff_delay(attempt)
+                    logger.warning(f"⚠️ {label}Attempt {attempt + 1} failed: {str(e)}. Retrying in {delay:.1f}s...")
+                    await asyncio.sleep(delay)
+                continue
+            except LLMError:
+                raise
+            except Exception as e:
+                # A bug, not a provider hiccup: not retried, but reported as an
+                # error result rather than escaping to the caller
+                LLM_ATTEMPTS.inc(outcome='error')
+                last_error = f"{type(e).__name__}: {str(e)}"
+                logger.exception(f"❌ {label}Attempt {attempt + 1} failed unexpectedly: {last_error}")
+                break
+                
+            # Validate and coerce against the analysis schema
+            logger.debug("%sValidating response structure...", label)
+            try:
+                with stage('validation'):
+                    validated = validate(response)
+                LLM_ATTEMPTS.inc(outcome='success')
+                return validated
+            except ValidationError as e:
+                LLM_ATTEMPTS.inc(outcome='invalid')
+                last_error = 'Failed to generate valid JSON structure'
+                missing = sorted({'.'.join(map(str, err['loc'])) for err in e.errors() if err['type'] == 'missing'})
+                logger.warning(f"{label}Invalid JSON structure on attempt {attempt + 1}. Missing: {missing}")
+                continue
+                
+        raise AnalysisFailed(f'Failed after {attempt + 1} attempts: {last_error}')
+            
+_default_analyzer: Optional[ImageAnalyzer] = None
+
+def get_image_analyzer() -> ImageAnalyzer:
+    """Process-wide analyzer, built on first use rather than at import"""
+    global _default_analyzer
+    if _default_analyzer is None:
+        _default_analyzer = ImageAnalyzer()
+    return _default_analyzer
 
-@app.post("/analyze")
-async def analyze_images(request: ImageAnalysisRequest) -> Dict[str, Any]:
+@asynccontextmanager
+async def analyzer_lifespan() -> AsyncIterator[ImageAnalyzer]:
+    """Build the analyzer and its HTTP connection pool, warm them up, and tear them down"""
+    analyzer = get_image_analyzer()
+    http_session = create_http_session()
+    analyzer.set_http_session(http_session)
+    if analyzer.prewarm:
+        await analyzer.warm_up()
+    try:
+        yield analyzer
+    finally:
+        analyzer.set_http_session(None)
+        await http_session.close()
+        get_image_preprocessor().shutdown()
+
+router = APIRouter()
+
+@router.post("/analyze")
+async def analyze_images(request: ImageAnalysisRequest, http_request: Request) -> Response:
     """Analyze product images"""
-    return await analyzer.analyze(request)
\ No newline at end of file
+    return negotiated_response(http_request, await get_image_analyzer().analyze(request))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Share one analyzer and HTTP connection pool for the lifetime of the service"""
+    async with analyzer_lifespan():
+        yield
+
+def create_app() -> FastAPI:
+    """The analysis endpoint as a service of its own
+    
+    Run with: uvicorn --factory analyzers.image_analyzer:create_app
+    (the main app serves /analyze as well).
+    """
+    app = FastAPI(
+        title="Image Analysis Service",
+        description="Analyze product images using vision LLMs",
+        version="1.0.0",
+        lifespan=lifespan,
+        default_response_class=FastJSONResponse
+    )
+    app.include_router(router)
+    return app
\ No newline at end of file
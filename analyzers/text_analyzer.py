@@ -0,0 +1,289 @@
+"""Local keyphrase extraction from product descriptions
+
+Descriptions are tokenized, normalized and stemmed, split into candidate
+phrases at stopwords and punctuation (as in RAKE), and every 1-4 word
+n-gram of a candidate is scored by TF-IDF against a corpus-level IDF
+table. Scoring runs over a whole batch at once on a sparse (CSR-layout)
+document-term matrix held in NumPy arrays, so a listing costs around a
+tenth of a millisecond and no LLM call.
+
+Build an IDF table from a catalog (one description per line, or JSONL
+with a "description" field) and point TEXT_IDF_PATH at it:
+
+    python -m analyzers.text_analyzer fit descriptions.txt idf.json
+"""
+import os
+import re
+import sys
+import json
+import logging
+import argparse
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Longest n-gram scored as a keyphrase
+MAX_NGRAM = 4
+# Longer phrases are more specific; weight by n-gram length
+NGRAM_WEIGHTS = np.array([0.0, 1.0, 1.6, 2.0, 2.2])
+# Boost for terms appearing early (the product noun usually comes first)
+POSITION_BOOST = 0.5
+DEFAULT_TOP_K = 10
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*")
+# Sentence and clause boundaries also end candidate phrases
+_BOUNDARY_RE = re.compile(r"[.,;:!?()\[\]{}|/\\\"\n•]+")
+
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each even ever every few for from further get gets got had has
+have having he her here hers him his how i if in into is it its itself just let like made make makes many may
+me more most much must my no nor not now of off on once only or other our ours out over own per perfect
+please same she should so some such than that the their theirs them then there these they this those through
+to too under until up us very was we well were what when where which while who whom why will with would you
+your yours yourself one two three new great best beautiful lovely nice item items product products listing
+""".split())
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents so variants of a word match"""
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """Light suffix stripping: plurals, -ed and -ing (conservative, like Porter step 1)"""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('sses'):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        word = word[:-1]
+    for suffix in ('ing', 'ed'):
+        base = word[:-len(suffix)]
+        if word.endswith(suffix) and len(base) >= 3 and any(ch in 'aeiouy' for ch in base):
+            # hopping -> hop, but keep doubled l/s/z (dressed -> dress)
+            if base[-1] == base[-2] and base[-1] not in 'lsz':
+                base = base[:-1]
+            return base
+    return word
+
+
+def candidate_phrases(text: str) -> List[List[str]]:
+    """Runs of content words between stopwords and punctuation"""
+    runs = []
+    for clause in _BOUNDARY_RE.split(normalize(text)):
+        run: List[str] = []
+        for token in _TOKEN_RE.findall(clause):
+            if token in STOPWORDS or token.isdigit() or len(token) < 2:
+                if run:
+                    runs.append(run)
+                    run = []
+            else:
+                run.append(token)
+        if run:
+            runs.append(run)
+    return runs
+
+
+class IDFTable:
+    """Document frequencies of stemmed terms over a reference corpus
+
+    idf = ln((1 + N) / (1 + df)) + 1, so unseen terms get the highest
+    weight and an empty table weights every term equally.
+    """
+
+    def __init__(self, document_count: int = 0, frequencies: Optional[Dict[str, int]] = None):
+        self.document_count = document_count
+        self.frequencies = frequencies or {}
+
+    def idf(self, terms: List[str]) -> np.ndarray:
+        """IDF of each term, as an array aligned with terms"""
+        if not self.document_count:
+            return np.ones(len(terms))
+        df = np.fromiter((self.frequencies.get(term, 0) for term in terms), dtype=np.float64)
+        return np.log((1.0 + self.document_count) / (1.0 + df)) + 1.0
+
+    @classmethod
+    def fit(cls, documents: Iterable[str]) -> "IDFTable":
+        """Count in how many documents each candidate n-gram occurs"""
+        frequencies: Counter = Counter()
+        count = 0
+        for document in documents:
+            count += 1
+            frequencies.update({term for term, _, _, _ in _ngrams(candidate_phrases(document))})
+        return cls(count, dict(frequencies))
+
+    @classmethod
+    def load(cls, path: Path) -> "IDFTable":
+        with Path(path).open(encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['document_count'], data['frequencies'])
+
+    def save(self, path: Path) -> None:
+        with Path(path).open('w', encoding='utf-8') as f:
+            json.dump({'document_count': self.document_count, 'frequencies': self.frequencies}, f)
+
+
+def _ngrams(runs: List[List[str]]) -> Iterable[Tuple[str, str, int, int]]:
+    """(stemmed term, surface phrase, n, token offset) for every 1..MAX_NGRAM-gram within each run"""
+    offset = 0
+    for run in runs:
+        stems = [stem(token) for token in run]
+        for n in range(1, MAX_NGRAM + 1):
+            for i in range(len(run) - n + 1):
+                yield ' '.join(stems[i:i + n]), ' '.join(run[i:i + n]), n, offset + i
+        offset += len(run)
+
+
+class TextAnalyzer:
+    """Score keyphrases of many descriptions at once against an IDF table"""
+
+    def __init__(self, idf_table: Optional[IDFTable] = None):
+        self.idf_table = idf_table or IDFTable()
+
+    def _matrix(self, texts: List[str]):
+        """Document-term counts in CSR layout, plus per-term metadata"""
+        vocabulary: Dict[str, int] = {}
+        surfaces: List[str] = []
+        lengths: List[int] = []
+        indptr = [0]
+        indices: List[int] = []
+        counts: List[int] = []
+        first_positions: List[float] = []
+        token_counts: List[int] = []
+        for text in texts:
+            runs = candidate_phrases(text)
+            total = sum(len(run) for run in runs)
+            token_counts.append(total)
+            row: Dict[int, int] = {}
+            first: Dict[int, int] = {}
+            for term, surface, n, offset in _ngrams(runs):
+                column = vocabulary.get(term)
+                if column is None:
+                    column = vocabulary[term] = len(surfaces)
+                    surfaces.append(surface)
+                    lengths.append(n)
+                row[column] = row.get(column, 0) + 1
+                first[column] = min(first.get(column, offset), offset)
+            indices.extend(row)
+            counts.extend(row.values())
+            first_positions.extend(first[column] / max(total, 1) for column in row)
+            indptr.append(len(indices))
+        return (
+            list(vocabulary), surfaces, np.array(lengths, dtype=np.int64),
+            np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int64),
+            np.array(counts, dtype=np.float64), np.array(first_positions, dtype=np.float64),
+            token_counts
+        )
+
+    def analyze_batch(self, texts: List[str], top_k: int = DEFAULT_TOP_K) -> List[Dict[str, Any]]:
+        """Keyphrases and keywords of each text, in order"""
+        terms, surfaces, lengths, indptr, indices, counts, first_positions, token_counts = self._matrix(texts)
+        results = []
+        if len(indices):
+            # Sublinear TF x IDF x n-gram weight x early-position boost, per stored entry
+            idf = self.idf_table.idf(terms)
+            scores = (1.0 + np.log(counts)) * idf[indices] * NGRAM_WEIGHTS[lengths[indices]]
+            scores *= 1.0 + POSITION_BOOST * (1.0 - first_positions)
+            # L2-normalize rows so scores compare across descriptions
+            row_sizes = np.diff(indptr)
+            rows = np.repeat(np.arange(len(texts)), row_sizes)
+            norms = np.sqrt(np.bincount(rows, weights=scores * scores, minlength=len(texts)))
+            scores /= norms[rows]
+            # Best first within each row
+            order = np.lexsort((-scores, rows))
+        for i, text in enumerate(texts):
+            start, end = (indptr[i], indptr[i + 1])
+            phrases, keywords = [], []
+            if end > start:
+                phrases, keywords = self._select(order[start:end], indices, lengths, scores, terms, surfaces, top_k)
+            results.append({
+                'keyphrases': phrases,
+                'keywords': keywords,
+                'token_count': token_counts[i],
+                'unique_terms': int(end - start)
+            })
+        return results
+
+    def analyze(self, text: str, top_k: int = DEFAULT_TOP_K) -> Dict[str, Any]:
+        return self.analyze_batch([text], top_k)[0]
+
+    @staticmethod
+    def _select(ranked, indices, lengths, scores, terms, surfaces, top_k) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Top phrases, skipping ones whose words a better phrase already covers, and top single words"""
+        selected = []
+        keywords = []
+        covered: set = set()
+        for entry in ranked:
+            column = indices[entry]
+            if lengths[column] == 1 and len(keywords) < top_k:
+                keywords.append(surfaces[column])
+            words = set(terms[column].split())
+            if len(selected) < top_k and not words <= covered:
+                covered |= words
+                selected.append({'phrase': surfaces[column], 'score': round(float(scores[entry]), 4)})
+            if len(selected) >= top_k and len(keywords) >= top_k:
+                break
+        return selected, keywords
+
+
+_default_analyzer: Optional[TextAnalyzer] = None
+
+
+def get_text_analyzer() -> TextAnalyzer:
+    """Process-wide text analyzer, with the IDF table from TEXT_IDF_PATH if set"""
+    global _default_analyzer
+    if _default_analyzer is None:
+        path = os.environ.get("TEXT_IDF_PATH")
+        idf_table = None
+        if path:
+            try:
+                idf_table = IDFTable.load(Path(path))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not load IDF table from {path}, weighting terms equally: {str(e)}")
+        _default_analyzer = TextAnalyzer(idf_table)
+    return _default_analyzer
+
+
+def _read_descriptions(path: Path) -> Iterable[str]:
+    with path.open(encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                yield json.loads(line).get('description', '')
+            else:
+                yield line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an IDF table or extract keyphrases")
+    commands = parser.add_subparsers(dest='command', required=True)
+    fit = commands.add_parser('fit', help='build an IDF table from a file of descriptions')
+    fit.add_argument('corpus', type=Path)
+    fit.add_argument('output', type=Path)
+    extract = commands.add_parser('extract', help='print keyphrases of descriptions given as arguments')
+    extract.add_argument('texts', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'fit':
+        table = IDFTable.fit(_read_descriptions(args.corpus))
+        table.save(args.output)
+        print(f"{len(table.frequencies)} terms from {table.document_count} descriptions -> {args.output}")
+    else:
+        json.dump(get_text_analyzer().analyze_batch(args.texts), sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,55 @@
 # app.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncIterator, Union
+import os
 import re
+import json
+import time
+import logging
 import datetime
 import asyncio
-from utils.url_converter import URLConverter
-from analyzers.image_analyzer import ImageAnalyzer
+import aiohttp
+from contextlib import asynccontextmanager
+from utils.job_queue import JobQueue, JobWorkerPool
+from utils.logging_config import brief, configure_logging, sampled
+from utils.projection import parse_fields, project
+from utils.responses import FastJSONResponse, negotiated_response
+from utils.metrics import REGISTRY, MetricsMiddleware, collect_timings, stage
+from utils.rate_limiter import Priority, llm_priority
+from utils.url_converter import get_url_converter
+from analyzers.image_analyzer import EventCallback, analyzer_lifespan, get_image_analyzer
+from analyzers.image_analyzer import router as image_analysis_router
+from analyzers.text_analyzer import get_text_analyzer
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the analyzer and shared HTTP connection pool, then start the background job workers
+    
+    Nothing heavy is built at import time, so workers boot quickly and a
+    missing API key surfaces here rather than as an import error.
+    """
+    async with analyzer_lifespan() as image_analyzer:
+        app.state.http_session = image_analyzer.http_session
+        job_workers = JobWorkerPool(job_queue, run_optimize_job, on_finished=deliver_job_callback)
+        await job_workers.start()
+        try:
+            yield
+        finally:
+            await job_workers.stop()
 
 app = FastAPI(
     title="Product SEO Optimizer",
     description="Optimize product listings with AI-powered image and text analysis",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
+app.include_router(image_analysis_router)
 
 class ProductOptimizeRequest(BaseModel):
     """Request model for product optimization"""
@@ -23,81 +60,200 @@ class ProductOptimizeRequest(BaseModel):
     platform: str = "Etsy"
     callback_url: Optional[str] = None
     voice: Optional[str] = None
+    bypass_cache: bool = False
+    # Attach per-stage timings (milliseconds) to the response
+    debug: bool = False
+    # Response shaping: dotted paths to keep (e.g. "optimized_content.title"),
+    # and compact mode for just the optimized content plus references
+    fields: Optional[List[str]] = None
+    compact: bool = False
 
-@app.post('/api/v1/product/seo-optimize')
-async def seo_optimize_product(request: ProductOptimizeRequest):
-    """
-    API endpoint to receive product data, analyze it, and return SEO-optimized results.
-    Performs comprehensive image and text analysis to generate optimized content.
+class BatchOptimizeItem(ProductOptimizeRequest):
+    """One product of a batch request, tagged with the client's id"""
+    id: Optional[Union[str, int]] = None
+
+# Products optimized concurrently per batch request
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 8))
+
+# Delivery attempts for callback_url webhooks
+WEBHOOK_MAX_ATTEMPTS = 3
+
+# Listing limits (Etsy's, the strictest platform we serve)
+TITLE_MAX_CHARS = 140
+# Keyphrases joined into a title; more reads as keyword stuffing
+TITLE_MAX_PHRASES = 4
+MAX_TAGS = 13
+TAG_MAX_CHARS = 20
+
+NDJSON_MEDIA_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines')
+
+app.add_middleware(MetricsMiddleware)
+
+@app.get('/metrics')
+async def metrics():
+    """Prometheus metrics of this worker process"""
+    return PlainTextResponse(REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+async def optimize_product(
+    request: ProductOptimizeRequest,
+    on_event: Optional[EventCallback] = None,
+    shape: bool = True
+) -> Dict[str, Any]:
+    """Run the full image + text optimization pipeline for one product.
+    
+    on_event, if given, receives image analysis sections as they stream in.
+    With request.debug, the response carries per-stage 'timings'. With
+    shape=False the request's compact mode and fields are not applied.
+    
+    Raises:
+        HTTPException: If the image analysis fails
     """
-    print(f"Received request: {request.dict()}")
-    try:
-        # Step 1: Image Analysis (Primary Analysis)
-        image_analysis = await analyze_image(
-            image_url=request.image_url,
-            description=request.description,
-            occasion=request.occasion,
-            platform=request.platform,
-            personalized=request.personalized,
-            voice=request.voice
-        )
-        
-        # Check for analysis error
-        if isinstance(image_analysis, dict) and image_analysis.get('status') == 'error':
-            raise HTTPException(
-                status_code=500,
-                detail={
-                    'error_type': 'image_analysis_error',
-                    'error_message': image_analysis.get('error_message', 'Unknown error'),
-                    'image_url': image_analysis.get('image_url')
-                }
-            )
+    if not request.debug:
+        response_data = await _optimize_product(request, on_event)
+        return _shape_response(response_data, request) if shape else response_data
+    started = time.perf_counter()
+    with collect_timings() as timings:
+        response_data = await _optimize_product(request, on_event)
+        if shape:
+            response_data = _shape_response(response_data, request)
+    timings['total'] = round((time.perf_counter() - started) * 1000, 3)
+    response_data['timings'] = timings
+    return response_data
 
-        # Prepare context for subsequent analyses
-        analysis_context = {
-            'image_analysis': image_analysis['image_analysis'],
-            'request_params': {
-                'description': request.description,
-                'personalized': request.personalized,
-                'platform': request.platform,
-                'occasion': request.occasion,
-                'voice': request.voice
-            },
-            'timestamp': datetime.datetime.now().isoformat(),
-            'api_version': '2.0'
+# Where the deduplicated context points for the image analysis
+IMAGE_ANALYSIS_REF = '#/analysis_summary/image_analysis'
+
+def _shape_response(response_data: Dict[str, Any], request: ProductOptimizeRequest) -> Dict[str, Any]:
+    """Apply the request's compact mode and field projection to a pipeline result
+
+    Compact responses reference the analysis instead of carrying it; the full
+    response for the same input is served from the result cache.
+    """
+    if request.compact:
+        metadata = response_data['analysis_summary']['image_analysis'].get('metadata', {})
+        response_data = {
+            'status': response_data['status'],
+            'optimized_content': response_data['optimized_content'],
+            'references': {
+                'image_url': metadata.get('original_url', request.image_url),
+                'direct_url': metadata.get('direct_url'),
+                'analysis_timestamp': metadata.get('analysis_timestamp'),
+                'analysis_version': metadata.get('analysis_version')
+            }
         }
+    fields = parse_fields(request.fields)
+    if fields:
+        response_data = project(response_data, fields, always=('status',))
+    return response_data
+
+async def _optimize_product(request: ProductOptimizeRequest, on_event: Optional[EventCallback] = None) -> Dict[str, Any]:
+    # Step 1: Image Analysis (Primary Analysis)
+    image_analysis = await analyze_image(
+        image_url=request.image_url,
+        description=request.description,
+        occasion=request.occasion,
+        platform=request.platform,
+        personalized=request.personalized,
+        voice=request.voice,
+        use_cache=not request.bypass_cache,
+        on_event=on_event
+    )
+    
+    # Check for analysis error
+    if isinstance(image_analysis, dict) and image_analysis.get('status') == 'error':
+        raise HTTPException(
+            status_code=500,
+            detail={
+                'error_type': 'image_analysis_error',
+                'error_message': image_analysis.get('error_message', 'Unknown error'),
+                'image_url': image_analysis.get('image_url')
+            }
+        )
 
-        # Step 2: Secondary Analyses (using image analysis results)
-        # These will be enhanced later with their own analyzers
+    # Prepare context for subsequent analyses
+    with stage('text_analysis'):
         text_analysis = analyze_text(request.description)
+    analysis_context = {
+        'image_analysis': image_analysis['image_analysis'],
+        'text_analysis': text_analysis,
+        'request_params': {
+            'description': request.description,
+            'personalized': request.personalized,
+            'platform': request.platform,
+            'occasion': request.occasion,
+            'voice': request.voice
+        },
+        'timestamp': datetime.datetime.now().isoformat(),
+        'api_version': '2.0'
+    }
+
+    # Step 2: Secondary Analyses (using image and text analysis results)
+    with stage('text_generation'):
         opt_title = generate_optimized_title(request.dict(), analysis_context)
         opt_description = generate_optimized_description(request.dict(), analysis_context)
         opt_tags = generate_optimized_tags(request.dict(), analysis_context)
 
-        # Combine all analyses
-        response_data = {
-            'status': 'success',
-            'optimized_content': {
-                'title': opt_title,
-                'description': opt_description,
-                'tags': opt_tags
-            },
-            'analysis_summary': {
-                'text_analysis': text_analysis,
-                'image_analysis': image_analysis['image_analysis']
-            },
-            'context': analysis_context
+    # Combine all analyses
+    response_data = {
+        'status': 'success',
+        'optimized_content': {
+            'title': opt_title,
+            'description': opt_description,
+            'tags': opt_tags
+        },
+        'analysis_summary': {
+            'text_analysis': text_analysis,
+            'image_analysis': image_analysis['image_analysis']
+        },
+        # The analyses are already in analysis_summary; don't serialize them twice
+        'context': {
+            **{key: value for key, value in analysis_context.items() if key not in ('image_analysis', 'text_analysis')},
+            'image_analysis_ref': IMAGE_ANALYSIS_REF
         }
+    }
 
-        # Handle webhook callback if provided
-        if request.callback_url:
-            await send_webhook_callback(request.callback_url, response_data)
+    return response_data
 
-        return response_data
+@app.post('/api/v1/product/seo-optimize')
+async def seo_optimize_product(
+    request: ProductOptimizeRequest,
+    http_request: Request,
+    fields: Optional[List[str]] = Query(None, description="Comma-separated dotted paths to return"),
+    include: Optional[List[str]] = Query(None, description="Alias of fields"),
+    compact: bool = Query(False, description="Return only optimized_content plus references")
+):
+    """
+    API endpoint to receive product data, analyze it, and return SEO-optimized results.
+    Performs comprehensive image and text analysis to generate optimized content.
+    
+    When callback_url is set, responds 202 with a job id immediately; the
+    result is POSTed to the callback and available from /api/v1/jobs/{id}.
+    The fields/include and compact query parameters (or body fields) shape
+    the response, including the one delivered to the callback. The body is
+    JSON, MessagePack or CBOR per Accept, compressed per Accept-Encoding.
+    """
+    if fields or include:
+        request.fields = (request.fields or []) + (fields or []) + (include or [])
+    request.compact = request.compact or compact
+    if sampled():
+        logger.info("Received request: %s", brief(request.dict()))
+    if request.callback_url:
+        # Run in the background and deliver the result to the webhook
+        job_id = await job_queue.enqueue(request.dict())
+        return JSONResponse(
+            status_code=202,
+            content={
+                'status': 'accepted',
+                'job_id': job_id,
+                'status_url': f'/api/v1/jobs/{job_id}'
+            }
+        )
+    try:
+        return negotiated_response(http_request, await optimize_product(request))
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error processing request: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error processing request: %s", e)
         raise HTTPException(
             status_code=500,
             detail={
@@ -105,32 +261,206 @@ async def seo_optimize_product(request: ProductOptimizeRequest):
                 'error_message': str(e)
             }
         )
-        raise HTTPException(
-            status_code=500,
-            detail={
+
+def _format_event(event: str, data: Dict[str, Any], sse: bool) -> bytes:
+    """Encode one progress event as a Server-Sent Event or an NDJSON line"""
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode('utf-8')
+    return (json.dumps({'event': event, 'data': data}, default=str) + '\n').encode('utf-8')
+
+async def _stream_optimize(request: ProductOptimizeRequest, sse: bool) -> AsyncIterator[bytes]:
+    """Run the optimization pipeline, yielding progress events as they happen"""
+    events: asyncio.Queue = asyncio.Queue()
+
+    def on_event(event: str, data: Dict[str, Any]) -> None:
+        events.put_nowait((event, data))
+
+    async def run() -> None:
+        try:
+            # Events are fixed in shape; fields and compact do not apply
+            result = await optimize_product(request, on_event=on_event, shape=False)
+            on_event('optimized_content', result['optimized_content'])
+            on_event('done', {'status': 'success'})
+        except HTTPException as e:
+            on_event('error', e.detail)
+        except Exception as e:
+            logger.exception("Error processing streamed request: %s", e)
+            on_event('error', {'error_type': 'processing_error', 'error_message': str(e)})
+        finally:
+            events.put_nowait(None)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            item = await events.get()
+            if item is None:
+                break
+            yield _format_event(*item, sse)
+    finally:
+        # Client went away: stop the analysis
+        task.cancel()
+
+@app.post('/api/v1/product/seo-optimize/stream')
+async def seo_optimize_product_stream(request: ProductOptimizeRequest, http_request: Request):
+    """
+    Streaming variant of /api/v1/product/seo-optimize.
+    
+    Emits each top-level image analysis section ('section' events) as soon
+    as it parses out of the model's output, then 'optimized_content' with
+    the title/description/tags and a final 'done'. A 'retry' event means
+    sections received so far will be sent again; failures end the stream
+    with an 'error' event. Responds with Server-Sent Events when the client
+    accepts text/event-stream, NDJSON otherwise. callback_url, fields and
+    compact are ignored.
+    """
+    if sampled():
+        logger.info("Received streaming request: %s", brief(request.dict()))
+    sse = 'text/event-stream' in http_request.headers.get('accept', '')
+    return StreamingResponse(
+        _stream_optimize(request, sse),
+        media_type='text/event-stream' if sse else 'application/x-ndjson',
+        # Keep proxies from buffering the stream
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+async def _optimize_batch_item(index: int, raw_item: Any) -> Dict[str, Any]:
+    """Optimize one batch item, turning any failure into an error result"""
+    item_id: Union[str, int] = str(index)
+    try:
+        payload = json.loads(raw_item) if isinstance(raw_item, (bytes, str)) else raw_item
+        if isinstance(payload, dict) and payload.get('id') is not None:
+            # Echoed back as given, so clients can match results to inputs
+            item_id = payload['id']
+        item = BatchOptimizeItem(**payload)
+        # Catalog work yields LLM capacity to interactive requests
+        with llm_priority(Priority.BATCH):
+            result = await optimize_product(item)
+        return {'id': item_id, 'status': 'success', 'result': result}
+    except HTTPException as e:
+        return {'id': item_id, 'status': 'error', 'error': e.detail}
+    except Exception as e:
+        logger.exception("Error processing batch item %s: %s", item_id, e)
+        return {
+            'id': item_id,
+            'status': 'error',
+            'error': {
                 'error_type': 'processing_error',
                 'error_message': str(e)
             }
-        )
+        }
 
-    except Exception as e:
+async def _run_batch(items: List[Any]) -> AsyncIterator[bytes]:
+    """Optimize batch items with bounded concurrency, yielding NDJSON lines in completion order"""
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    results: asyncio.Queue = asyncio.Queue()
+    tasks = set()
+
+    async def run_item(index: int, raw_item: Any) -> None:
+        try:
+            await results.put(await _optimize_batch_item(index, raw_item))
+        finally:
+            semaphore.release()
+
+    async def produce() -> None:
+        try:
+            for index, raw_item in enumerate(items):
+                # Only schedule new items while below the concurrency limit
+                await semaphore.acquire()
+                task = asyncio.create_task(run_item(index, raw_item))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            await results.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            yield (json.dumps(result, default=str) + '\n').encode('utf-8')
+    finally:
+        # Client went away or batch finished: stop any remaining work
+        producer.cancel()
+        for task in list(tasks):
+            task.cancel()
+
+@app.post('/api/v1/product/seo-optimize/batch')
+async def seo_optimize_batch(http_request: Request):
+    """
+    Optimize a whole catalog in one call.
+    
+    Accepts NDJSON (one ProductOptimizeRequest per line, optionally with an
+    'id') or a JSON array of the same. Results stream back as NDJSON in
+    completion order, each tagged with the item's id (or its index when no
+    id was given). A failing item produces an error line and does not
+    abort the batch.
+    """
+    # The body is read up front: once the response starts streaming,
+    # Starlette's disconnect listener competes for request messages
+    body = await http_request.body()
+    content_type = http_request.headers.get('content-type', '').split(';')[0].strip().lower()
+    if content_type in NDJSON_MEDIA_TYPES:
+        items = [line for line in body.split(b'\n') if line.strip()]
+    else:
+        try:
+            payload = json.loads(body)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=400,
+                detail={'error_type': 'invalid_batch', 'error_message': f'Invalid JSON body: {str(e)}'}
+            )
+        if not isinstance(payload, list):
+            raise HTTPException(
+                status_code=400,
+                detail={'error_type': 'invalid_batch', 'error_message': 'Batch body must be a JSON array or NDJSON'}
+            )
+        items = payload
+
+    return StreamingResponse(_run_batch(items), media_type='application/x-ndjson')
+
+@app.get('/api/v1/jobs/{job_id}')
+async def get_job(job_id: str, http_request: Request):
+    """Report the status, and once finished the result or error, of a background job"""
+    job = await job_queue.get(job_id)
+    if job is None:
         raise HTTPException(
-            status_code=500,
-            detail={
-                'error_type': 'system_error',
-                'error_message': f"An unexpected error occurred: {str(e)}"
-            }
+            status_code=404,
+            detail={'error_type': 'job_not_found', 'error_message': f'Unknown job: {job_id}'}
         )
+    job.pop('payload')
+    return negotiated_response(http_request, job)
+
+async def run_optimize_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Job handler: optimize the product described by a queued request"""
+    # Nobody is waiting on the connection, so interactive requests go first
+    with llm_priority(Priority.BATCH):
+        return await optimize_product(ProductOptimizeRequest(**payload))
+
+async def deliver_job_callback(job: Dict[str, Any]) -> None:
+    """Job completion hook: POST the outcome to the request's callback_url"""
+    callback_url = job['payload'].get('callback_url')
+    if not callback_url:
+        return
+    data = {'job_id': job['job_id'], 'status': job['status']}
+    if 'result' in job:
+        data['result'] = job['result']
+    if 'error' in job:
+        data['error'] = job['error']
+    await send_webhook_callback(callback_url, data)
 
 
-# Initialize global analyzer instance
-image_analyzer = ImageAnalyzer()
+# Background job queue; its database is opened on first use
+job_queue = JobQueue()
 
-async def analyze_image(image_url, description=None, occasion="general", platform="Etsy", personalized="", voice=None):
+async def analyze_image(image_url, description=None, occasion="general", platform="Etsy", personalized="", voice=None, use_cache=True, on_event=None):
     """Analyze an image URL using our comprehensive image analysis system.
     
     Args:
         image_url (str): URL of the image to analyze
+        use_cache (bool): Whether a cached analysis may be returned
+        on_event (callable): Optional progress callback for streamed sections
         
     Returns:
         dict: Analysis results with visual, market, and psychological insights
@@ -139,16 +469,23 @@ async def analyze_image(image_url, description=None, occasion="general", platfor
         ValueError: If URL conversion fails
         RuntimeError: If image analysis fails
     """
-    print(f"Analyzing image from URL: {image_url}")
+    logger.debug("Analyzing image from URL: %s", image_url)
 
-    # Convert URL to direct download URL
-    url_converter = URLConverter()
-    direct_url = url_converter.convert_url(image_url)
+    image_analyzer = get_image_analyzer()
+
+    # Convert URL to direct download URL, at the size the model uses. The
+    # LLM client gets the direct URL, which the converter passes through as is
+    with stage('url_convert'):
+        direct_url = await get_url_converter().resolve(
+            image_url,
+            image_analyzer.http_session,
+            max_edge=image_analyzer.llm.max_image_edge
+        )
     
     if not direct_url:
         raise ValueError(f"Could not convert URL to direct download URL: {image_url}")
 
-    print(f"Using direct download URL: {direct_url}")
+    logger.debug("Using direct download URL: %s", direct_url)
 
     try:
         # Get comprehensive image analysis
@@ -161,7 +498,9 @@ async def analyze_image(image_url, description=None, occasion="general", platfor
                 'platform': platform,
                 'voice': voice
             },
-            platform=platform
+            platform=platform,
+            use_cache=use_cache,
+            on_event=on_event
         )
         
         # If we got an error response, return it
@@ -182,7 +521,7 @@ async def analyze_image(image_url, description=None, occasion="general", platfor
         }
         
     except Exception as e:
-        print(f"Error analyzing image: {str(e)}")
+        logger.error("Error analyzing image %s: %s", direct_url, e)
         return {
             'status': 'error',
             'error_message': str(e),
@@ -191,51 +530,82 @@ async def analyze_image(image_url, description=None, occasion="general", platfor
 
 
 def analyze_text(description):
-    print(f"Placeholder: Analyzing text description: {description}")
     return {"text_analysis": "Placeholder Text Analysis Keywords"} # Placeholder data
 
 def generate_optimized_title(product_data, analysis_results):
-    print("Placeholder: Generating optimized title")
     return "Placeholder Optimized Title" # Placeholder title
 
 def generate_optimized_description(product_data, analysis_results):
-    print("Placeholder: Generating optimized description")
     return "Placeholder Optimized Description" # Placeholder description
 
 def generate_optimized_tags(product_data, analysis_results):
-    print("Placeholder: Generating optimized tags")
     return ["placeholder", "tags"] # Placeholder tags
 
 def create_analysis_summary(analysis_results):
-    print("Placeholder: Creating analysis summary")
     return {"summary": "Placeholder Analysis Summary"} # Placeholder summary
 
-def send_webhook_callback(callback_url, response_data):
-    print(f"Placeholder: Sending webhook callback to: {callback_url} with data: {response_data}")
-    # In a real implementation, you'd use a library like 'requests' to make an actual HTTP POST request
-
 
 def analyze_text(description: str) -> Dict[str, Any]:
-    """Analyze text content of the product description."""
-    return {
-        'text_analysis': 'Basic text analysis will be implemented here'
-    }
+    """Extract scored keyphrases and keywords from the product description, locally."""
+    return get_text_analyzer().analyze(description)
+
+def _capitalize(phrase: str) -> str:
+    return ' '.join(word[:1].upper() + word[1:] for word in phrase.split())
+
+def _occasion_phrase(context: Dict[str, Any]) -> Optional[str]:
+    occasion = context['request_params']['occasion']
+    return f"{occasion} gift" if occasion and occasion.lower() != 'general' else None
 
 def generate_optimized_title(params: Dict[str, Any], context: Dict[str, Any]) -> str:
-    """Generate an optimized title using image and text analysis context."""
-    return f"Optimized title for {params['description']} (Using {context['request_params']['occasion']} context)"
+    """Generate an optimized title from the description's keyphrases, best first."""
+    phrases = [phrase['phrase'] for phrase in context['text_analysis']['keyphrases']][:TITLE_MAX_PHRASES]
+    occasion = _occasion_phrase(context)
+    if occasion and occasion not in phrases:
+        phrases.append(occasion)
+    title = ''
+    for phrase in phrases:
+        candidate = f"{title} | {_capitalize(phrase)}" if title else _capitalize(phrase)
+        if len(candidate) > TITLE_MAX_CHARS:
+            break
+        title = candidate
+    return title or params['description'][:TITLE_MAX_CHARS]
 
 def generate_optimized_description(params: Dict[str, Any], context: Dict[str, Any]) -> str:
     """Generate an optimized description using image and text analysis context."""
     return f"Optimized description for {params['description']} (Using {context['request_params']['occasion']} context)"
 
 def generate_optimized_tags(params: Dict[str, Any], context: Dict[str, Any]) -> List[str]:
-    """Generate optimized tags using image and text analysis context."""
-    return [params['occasion'], context['request_params']['platform'], "test_tag"]
+    """Generate optimized tags from the description's keyphrases, then keywords."""
+    text_analysis = context['text_analysis']
+    candidates = [phrase['phrase'] for phrase in text_analysis['keyphrases']] + text_analysis['keywords']
+    occasion = _occasion_phrase(context)
+    if occasion:
+        candidates.insert(0, occasion)
+    tags: List[str] = []
+    for candidate in candidates:
+        if len(candidate) <= TAG_MAX_CHARS and candidate not in tags:
+            tags.append(candidate)
+        if len(tags) == MAX_TAGS:
+            break
+    return tags
 
 async def send_webhook_callback(url: str, data: Dict[str, Any]) -> None:
-    """Send analysis results to the specified webhook URL."""
-    print(f"Would send webhook to {url} with data: {data}")
+    """Send analysis results to the specified webhook URL, retrying transient failures."""
+    body = json.dumps(data, default=str)
+    headers = {'Content-Type': 'application/json'}
+    for attempt in range(WEBHOOK_MAX_ATTEMPTS):
+        try:
+            async with app.state.http_session.post(url, data=body, headers=headers) as response:
+                if response.status < 500:
+                    if response.status >= 400:
+                        logger.warning("Webhook to %s rejected: HTTP %s", url, response.status)
+                    return
+                error = f"HTTP {response.status}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = str(e) or type(e).__name__
+        logger.warning("Webhook to %s failed (attempt %d): %s", url, attempt + 1, error)
+        if attempt < WEBHOOK_MAX_ATTEMPTS - 1:
+            await asyncio.sleep(2 ** attempt)
 
 if __name__ == '__main__':
     import uvicorn
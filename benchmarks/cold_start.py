@@ -0,0 +1,137 @@
+"""Cold-start benchmark: import time, time to ready, and first-request latency
+
+Each run starts a fresh interpreter, so nothing is shared between runs:
+
+    python -m benchmarks.cold_start --runs 5
+
+reports how long `import app` takes, how long uvicorn takes until it
+accepts requests (lifespan startup included) and the latency of the first
+request, against the fake LLM provider and a local image server. With
+--max-import / --max-ready the exit status is 1 when the median exceeds
+the budget, so scale-out time can be guarded in CI. --importtime lists
+the slowest imports (python -X importtime).
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+import aiohttp
+from benchmarks.fake_image_server import start_server, server_port
+from benchmarks.load_test import DEFAULT_PATH, ROOT, free_port, service_env, start_service, wait_ready
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)"
+
+
+def measure_import(env: Dict[str, str]) -> float:
+    """Seconds a fresh interpreter spends importing the app module"""
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_SNIPPET],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env: Dict[str, str], count: int) -> List[Tuple[float, str]]:
+    """Cumulative seconds of the slowest top-level imports under app"""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stderr
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        timings.append((int(cumulative) / 1e6, name.rstrip()))
+    return sorted(timings, reverse=True)[:count]
+
+
+async def measure_startup(state_dir: Path, image_base: str) -> Tuple[float, float]:
+    """Seconds until the service accepts requests, and the first request's latency"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    process = start_service(port, state_dir, workers=1)
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_ready(session, url, process)
+            ready = time.monotonic() - started
+            payload = {'description': 'Handmade ceramic mug', 'image_url': f"{image_base}/images/0.jpg"}
+            request_started = time.monotonic()
+            async with session.post(url + DEFAULT_PATH, json=payload) as response:
+                await response.read()
+                if response.status != 200:
+                    raise RuntimeError(f"First request failed with HTTP {response.status}")
+            return ready, time.monotonic() - request_started
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    return {'median': statistics.median(values), 'min': min(values), 'max': max(values)}
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    imports, readies, firsts = [], [], []
+    image_runner = await start_server()
+    image_base = f"http://127.0.0.1:{server_port(image_runner)}"
+    try:
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory(prefix='cold-start-') as state_dir:
+                imports.append(measure_import(service_env(Path(state_dir))))
+                ready, first = await measure_startup(Path(state_dir), image_base)
+                readies.append(ready)
+                firsts.append(first)
+    finally:
+        await image_runner.cleanup()
+    report: Dict[str, Any] = {
+        'runs': args.runs,
+        'import_seconds': _summary(imports),
+        'ready_seconds': _summary(readies),
+        'first_request_seconds': _summary(firsts)
+    }
+    if args.importtime:
+        with tempfile.TemporaryDirectory(prefix='cold-start-') as state_dir:
+            env = service_env(Path(state_dir))
+            report['slowest_imports'] = [
+                {'module': name.strip(), 'seconds': seconds}
+                for seconds, name in slowest_imports(env, args.importtime)
+            ]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes to measure')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N', help='also list the N slowest imports')
+    parser.add_argument('--max-import', type=float, help='fail if the median import time exceeds this (s)')
+    parser.add_argument('--max-ready', type=float, help='fail if the median time to ready exceeds this (s)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, label in (('import_seconds', 'Import'), ('ready_seconds', 'Ready'), ('first_request_seconds', 'First request')):
+            values = report[key]
+            print(f"{label + ' (s):':<19} median {values['median']:.3f}  min {values['min']:.3f}  max {values['max']:.3f}")
+        for entry in report.get('slowest_imports', []):
+            print(f"  {entry['seconds']:.3f}s  {entry['module']}")
+
+    over_budget = (
+        (args.max_import is not None and report['import_seconds']['median'] > args.max_import)
+        or (args.max_ready is not None and report['ready_seconds']['median'] > args.max_ready)
+    )
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Local image server for load tests: deterministic JPEGs with simulated latency
+
+Serves /images/{n}.jpg (any n) as a size x size JPEG generated from n, with
+ETag and Cache-Control headers so the service's image cache behaves as it
+would against a real CDN.
+
+    python -m benchmarks.fake_image_server --port 8081 --latency 0.05
+"""
+import io
+import asyncio
+import hashlib
+import argparse
+import functools
+from aiohttp import web
+from PIL import Image, ImageDraw
+
+DEFAULT_PORT = 8081
+DEFAULT_SIZE = 1024
+DEFAULT_LATENCY = 0.0
+DEFAULT_MAX_AGE = 3600
+
+
+@functools.lru_cache(maxsize=256)
+def render_image(n: int, size: int) -> bytes:
+    """A gradient with a few shapes, different for every n"""
+    seed = hashlib.sha256(str(n).encode()).digest()
+    image = Image.new('RGB', (size, size), tuple(seed[:3]))
+    draw = ImageDraw.Draw(image)
+    for i in range(0, 24, 4):
+        x0, y0 = seed[i] * size // 256, seed[i + 1] * size // 256
+        x1, y1 = x0 + seed[i + 2] * size // 512 + 1, y0 + seed[i + 3] * size // 512 + 1
+        draw.rectangle((x0, y0, x1, y1), fill=tuple(seed[i + 4:i + 7]))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def create_app(size: int = DEFAULT_SIZE, latency: float = DEFAULT_LATENCY, max_age: int = DEFAULT_MAX_AGE) -> web.Application:
+    async def serve_image(request: web.Request) -> web.Response:
+        try:
+            n = int(request.match_info['n'])
+        except ValueError:
+            raise web.HTTPNotFound()
+        if latency:
+            await asyncio.sleep(latency)
+        data = render_image(n, size)
+        etag = f'"{hashlib.sha256(data).hexdigest()[:16]}"'
+        headers = {'ETag': etag, 'Cache-Control': f'max-age={max_age}'}
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=data, content_type='image/jpeg', headers=headers)
+
+    app = web.Application()
+    app.router.add_get('/images/{n}.jpg', serve_image)
+    return app
+
+
+async def start_server(port: int = 0, **options) -> web.AppRunner:
+    """Start the server in the running loop; port 0 picks a free port"""
+    runner = web.AppRunner(create_app(**options), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner
+
+
+def server_port(runner: web.AppRunner) -> int:
+    return runner.addresses[0][1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--size', type=int, default=DEFAULT_SIZE, help='image edge in pixels')
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY, help='seconds before each response')
+    parser.add_argument('--max-age', type=int, default=DEFAULT_MAX_AGE, help='Cache-Control max-age')
+    args = parser.parse_args()
+    web.run_app(
+        create_app(args.size, args.latency, args.max_age),
+        host='127.0.0.1',
+        port=args.port,
+        access_log=None
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""Open-loop load test for the product SEO endpoint
+
+Sends requests at a fixed rate regardless of how fast they complete (so
+queueing shows up in the latencies) and reports latency percentiles and
+throughput. With --start-server the service is started locally against
+the fake LLM provider and a local image server, so no quota is spent:
+
+    python -m benchmarks.load_test --start-server --rps 20 --duration 30
+
+FAKE_LLM_* variables in the environment shape the fake provider (see
+utils/llm_fake.py). Without --start-server, point --url at a running
+service and --image-base at images it can reach.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import aiohttp
+from benchmarks.fake_image_server import start_server, server_port
+
+ROOT = Path(__file__).parent.parent
+DEFAULT_PATH = '/api/v1/product/seo-optimize'
+STARTUP_TIMEOUT_SECONDS = 60.0
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of values"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(session: aiohttp.ClientSession, url: str, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Service exited during startup with code {process.returncode}")
+        try:
+            async with session.get(f"{url}/openapi.json") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Service did not start within {STARTUP_TIMEOUT_SECONDS:.0f}s")
+
+
+def service_env(state_dir: Path) -> Dict[str, str]:
+    """Environment running the app with the fake provider and throwaway caches"""
+    return {
+        **os.environ,
+        'LLM_PROVIDERS': os.environ.get('LLM_PROVIDERS', 'fake'),
+        'FAKE_LLM_FETCH_IMAGES': os.environ.get('FAKE_LLM_FETCH_IMAGES', '1'),
+        'RESULT_CACHE_PATH': str(state_dir / 'results.sqlite3'),
+        'IMAGE_CACHE_DIR': str(state_dir / 'images'),
+        'JOB_QUEUE_PATH': str(state_dir / 'jobs.sqlite3')
+    }
+
+
+def start_service(port: int, state_dir: Path, workers: int) -> subprocess.Popen:
+    """Run the app under uvicorn with the fake provider and throwaway caches"""
+    env = service_env(state_dir)
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning'],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL
+    )
+
+
+async def _send(
+    session: aiohttp.ClientSession,
+    url: str,
+    payload: Dict[str, Any],
+    results: List[Tuple[float, float, Any]]
+) -> None:
+    started = time.monotonic()
+    try:
+        async with session.post(url, json=payload) as response:
+            await response.read()
+            outcome: Any = response.status
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        outcome = type(e).__name__
+    results.append((started, time.monotonic(), outcome))
+
+
+async def run_load(
+    url: str,
+    image_base: str,
+    rps: float,
+    duration: float,
+    warmup: float,
+    images: int,
+    bypass_cache: bool,
+    timeout: float
+) -> Dict[str, Any]:
+    """Drive url at rps for warmup + duration seconds and summarize the measured part"""
+    results: List[Tuple[float, float, Any]] = []
+    total = int((warmup + duration) * rps)
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        start = time.monotonic()
+        tasks = []
+        for i in range(total):
+            # Open loop: keep to the schedule even while earlier requests are pending
+            delay = start + i / rps - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            payload = {
+                'description': f"Handmade ceramic mug, design {i % images}",
+                'image_url': f"{image_base}/images/{i % images}.jpg",
+                'bypass_cache': bypass_cache
+            }
+            tasks.append(asyncio.create_task(_send(session, url, payload, results)))
+        await asyncio.gather(*tasks)
+
+    measured = [r for r in results if r[0] - start >= warmup]
+    latencies = [end - begin for begin, end, outcome in measured if outcome == 200]
+    outcomes = Counter(str(outcome) for _, _, outcome in measured)
+    elapsed = max(end for _, end, _ in measured) - min(begin for begin, _, _ in measured) if measured else 0.0
+    return {
+        'target_rps': rps,
+        'requests': len(measured),
+        'succeeded': len(latencies),
+        'outcomes': dict(outcomes),
+        'offered_rps': len(measured) / duration if duration else 0.0,
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+        'latency_seconds': {
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies) if latencies else float('nan')
+        }
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    latency = report['latency_seconds']
+    print(f"Target rate:  {report['target_rps']:.1f} req/s ({report['requests']} requests measured)")
+    print(f"Throughput:   {report['throughput_rps']:.1f} req/s succeeded")
+    print(f"Outcomes:     {', '.join(f'{k}: {v}' for k, v in sorted(report['outcomes'].items()))}")
+    print(
+        f"Latency (s):  p50 {latency['p50']:.3f}  p95 {latency['p95']:.3f}  "
+        f"p99 {latency['p99']:.3f}  max {latency['max']:.3f}"
+    )
+
+
+async def main_async(args: argparse.Namespace) -> Dict[str, Any]:
+    image_runner = None
+    process: Optional[subprocess.Popen] = None
+    url = args.url
+    image_base = args.image_base
+    with tempfile.TemporaryDirectory(prefix='load-test-') as state_dir:
+        try:
+            if image_base is None:
+                image_runner = await start_server(size=args.image_size, latency=args.image_latency)
+                image_base = f"http://127.0.0.1:{server_port(image_runner)}"
+            if args.start_server:
+                port = free_port()
+                process = start_service(port, Path(state_dir), args.workers)
+                url = f"http://127.0.0.1:{port}"
+                async with aiohttp.ClientSession() as session:
+                    await wait_ready(session, url, process)
+            return await run_load(
+                url + args.path,
+                image_base,
+                args.rps,
+                args.duration,
+                args.warmup,
+                args.images,
+                args.bypass_cache,
+                args.timeout
+            )
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+            if image_runner is not None:
+                await image_runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='service base URL')
+    parser.add_argument('--path', default=DEFAULT_PATH)
+    parser.add_argument('--start-server', action='store_true', help='start the service locally with the fake provider')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers with --start-server')
+    parser.add_argument('--rps', type=float, default=10.0, help='target request rate')
+    parser.add_argument('--duration', type=float, default=30.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5.0, help='seconds of load before measuring')
+    parser.add_argument('--images', type=int, default=50, help='distinct images to cycle through')
+    parser.add_argument('--image-base', help='image server base URL (default: start one locally)')
+    parser.add_argument('--image-size', type=int, default=1024)
+    parser.add_argument('--image-latency', type=float, default=0.0)
+    parser.add_argument('--bypass-cache', action='store_true', help='skip the result cache on every request')
+    parser.add_argument('--timeout', type=float, default=120.0, help='per-request timeout in seconds')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 import asyncio
 import logging
 from utils.llm_gemini import GeminiClient
+from utils.prompt_registry import get_prompt_registry
+from analyzers.image_analysis_schema import PROMPT_SKELETON
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -12,13 +14,13 @@ async def test_image_analysis():
     # Test image URL (Google Drive)
     image_url = "https://drive.google.com/open?id=1ZKWCBLpA91cOK0kw6NbPm8q9tk8V9fL5&usp=drive_fs"
     
-    # Load prompt
-    with open('prompts/image_analysis_prompt.md', 'r') as f:
-        prompt = f.read()
-    
-    # Replace placeholders
-    prompt = prompt.replace('${platform}', 'Amazon')
-    prompt = prompt.replace('${product_description}', 'High-end coffee maker')
+    # Render prompt
+    prompts = get_prompt_registry()
+    prompts.bind('image_analysis_prompt', response_schema=PROMPT_SKELETON)
+    prompt = prompts.render('image_analysis_prompt', {
+        'platform': 'Amazon',
+        'description': 'High-end coffee maker'
+    })
     
     try:
         # Analyze image
@@ -0,0 +1,53 @@
+import asyncio
+from utils.url_converter import URLConverter
+
+# Redirects as the share services answer them, so no network is needed
+REDIRECTS = {
+    'https://db.tt/AbCdEf': 'https://www.dropbox.com/s/abc123/mug.jpg?dl=0',
+    'https://www.dropbox.com/s/abc123/mug.jpg?dl=1': 'https://dl.dropboxusercontent.com/s/abc123/mug.jpg'
+}
+
+
+def make_converter():
+    converter = URLConverter()
+    requests = []
+
+    async def follow_redirects(url, session):
+        requests.append(url)
+        return REDIRECTS.get(url, url)
+
+    converter._follow_redirects = follow_redirects
+    return converter, requests
+
+
+def test_short_link_resolves_to_file():
+    converter, requests = make_converter()
+    direct_url = asyncio.run(converter.resolve('https://db.tt/AbCdEf'))
+    assert direct_url == 'https://dl.dropboxusercontent.com/s/abc123/mug.jpg'
+    assert requests == ['https://db.tt/AbCdEf', 'https://www.dropbox.com/s/abc123/mug.jpg?dl=1']
+
+    # Cached: resolving again sends no request
+    assert asyncio.run(converter.resolve('https://db.tt/AbCdEf')) == direct_url
+    assert len(requests) == 2
+
+
+def test_share_link_resolves_to_file():
+    converter, requests = make_converter()
+    direct_url = asyncio.run(converter.resolve('https://www.dropbox.com/s/abc123/mug.jpg?dl=0'))
+    assert direct_url == 'https://dl.dropboxusercontent.com/s/abc123/mug.jpg'
+    assert requests == ['https://www.dropbox.com/s/abc123/mug.jpg?dl=1']
+
+
+def test_direct_url_passes_through_uncached():
+    converter, requests = make_converter()
+    url = 'https://dl.dropboxusercontent.com/s/abc123/mug.jpg'
+    assert asyncio.run(converter.resolve(url)) == url
+    assert requests == []
+    assert not converter._resolved
+
+
+if __name__ == "__main__":
+    test_short_link_resolves_to_file()
+    test_share_link_resolves_to_file()
+    test_direct_url_passes_through_uncached()
+    print("URL converter tests passed")
@@ -1,53 +1,73 @@
 """Gemini LLM client implementation"""
-import json
+import asyncio
 import logging
-from typing import Dict, Any, Union, AsyncGenerator
+from typing import Dict, Any, Union, AsyncGenerator, Optional
 import aiohttp
 import google.generativeai as genai
-from google.generativeai.types import content_types
 
 from .llm_base import BaseLLMClient
+from .image_preprocess import PreparedImage
+from .json_stream import IncrementalJSONParser, parse_json_text
+from .prompt_registry import RenderedPrompt
 
 logger = logging.getLogger(__name__)
 
 class GeminiClient(BaseLLMClient):
     """Client for Google's Gemini API"""
     
-    def __init__(self, api_key: str):
-        super().__init__(api_key)
+    def __init__(self, api_key: str, http_session: Optional[aiohttp.ClientSession] = None):
+        super().__init__(api_key, http_session)
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-pro-vision')
+        self.model_name = 'gemini-pro-vision'
+        self.generation_config = {"temperature": 0.7}
+        self.model = genai.GenerativeModel(self.model_name)
+        
+    async def _download_image(self, image_url: str, timeout: float) -> bytes:
+        """Download image bytes, reusing the shared connection pool when available"""
+        timeout_client = aiohttp.ClientTimeout(total=timeout)
+        if self.http_session is not None:
+            async with self.http_session.get(image_url, timeout=timeout_client) as response:
+                return await response.read()
+                
+        async with aiohttp.ClientSession(timeout=timeout_client) as session:
+            async with session.get(image_url) as response:
+                return await response.read()
+        
+    async def fetch_image(self, image_url: str) -> bytes:
+        """Download the image bytes that would be sent to Gemini"""
+        return await self._download_image(image_url, 30.0)
         
     def parse_json(self, text: str) -> Dict[str, Any]:
-        """Parse JSON from text, with error handling"""
+        """Parse JSON from text, tolerating fences, trailing commas and truncation"""
         try:
-            return json.loads(text)
-        except json.JSONDecodeError as e:
+            return parse_json_text(text)
+        except ValueError as e:
             logger.error(f"JSON parse error: {str(e)}")
             raise
             
     async def analyze_image(
         self,
         image_url: str,
-        prompt: str,
-        expect_json: bool = False
+        prompt: Union[str, RenderedPrompt],
+        expect_json: bool = False,
+        image: Optional[PreparedImage] = None,
+        response_schema: Optional[Dict[str, Any]] = None  # not supported by gemini-pro-vision
     ) -> Union[str, Dict[str, Any]]:
         timeout = 30.0  # 30 second default timeout
         """Analyze an image using Gemini"""
         try:
-            # Download image with timeout
-            timeout_client = aiohttp.ClientTimeout(total=timeout)
-            async with aiohttp.ClientSession(timeout=timeout_client) as session:
-                async with session.get(image_url) as response:
-                    image_data = await response.read()
+            # Download and preprocess image with timeout
+            if image is None:
+                image_data = await self._download_image(image_url, timeout)
+                image = await self.preprocessor.prepare(image_data)
                     
             # Convert to Gemini image format
-            image = content_types.ImageContent.from_bytes(image_data)
+            image_part = {"mime_type": image.mime_type, "data": image.data}
             
             # Get response
             response = await self.model.generate_content_async(
-                contents=[prompt, image],
-                generation_config={"temperature": 0.7}
+                contents=[str(prompt), image_part],
+                generation_config=self.generation_config
             )
             
             text = response.text
@@ -62,49 +82,50 @@ class GeminiClient(BaseLLMClient):
     async def analyze_image_stream(
         self,
         image_url: str,
-        prompt: str,
-        expect_json: bool = False
+        prompt: Union[str, RenderedPrompt],
+        expect_json: bool = False,
+        image: Optional[PreparedImage] = None,
+        response_schema: Optional[Dict[str, Any]] = None  # not supported by gemini-pro-vision
     ) -> AsyncGenerator[Union[str, Dict[str, Any]], None]:
         timeout = 30.0  # 30 second default timeout
         """Stream image analysis results from Gemini"""
         try:
-            # Download image with timeout
-            timeout_client = aiohttp.ClientTimeout(total=timeout)
-            async with aiohttp.ClientSession(timeout=timeout_client) as session:
-                async with session.get(image_url) as response:
-                    image_data = await response.read()
+            # Download and preprocess image with timeout
+            if image is None:
+                image_data = await self._download_image(image_url, timeout)
+                image = await self.preprocessor.prepare(image_data)
                     
             # Convert to Gemini image format
-            image = content_types.ImageContent.from_bytes(image_data)
+            image_part = {"mime_type": image.mime_type, "data": image.data}
             
             # Get streaming response with timeout
-            import asyncio
-            try:
-                response = await asyncio.wait_for(
-                    self.model.generate_content_async(
-                        contents=[prompt, image],
-                        generation_config={"temperature": 0.7},
-                        stream=True
-                    ),
-                    timeout=timeout
-                )
+            response = await asyncio.wait_for(
+                self.model.generate_content_async(
+                    contents=[str(prompt), image_part],
+                    generation_config=self.generation_config,
+                    stream=True
+                ),
+                timeout=timeout
+            )
             
             # Stream chunks with safety limits
             MAX_BUFFER_SIZE = 1024 * 1024  # 1MB limit
             MAX_CHUNKS = 1000  # Maximum number of chunks to process
             CHUNK_TIMEOUT = 5.0  # 5 second timeout per chunk
             
-            buffer = []
+            parser = IncrementalJSONParser() if expect_json else None
             buffer_size = 0
             chunk_count = 0
-            last_progress = 0  # Track last successful parse attempt
             
-            async for chunk in response:
+            chunks = response.__aiter__()
+            while True:
+                # Apply timeout per chunk
                 try:
-                    # Apply timeout per chunk
-                    chunk = await asyncio.wait_for(anext(response.__aiter__()), CHUNK_TIMEOUT)
-                    chunk_count += 1
-                    if chunk_count > MAX_CHUNKS:
+                    chunk = await asyncio.wait_for(anext(chunks), CHUNK_TIMEOUT)
+                except StopAsyncIteration:
+                    break
+                chunk_count += 1
+                if chunk_count > MAX_CHUNKS:
                     logger.error(f"Exceeded maximum chunk count: {MAX_CHUNKS}")
                     raise ValueError(f"Response exceeded {MAX_CHUNKS} chunks")
                     
@@ -113,36 +134,18 @@ class GeminiClient(BaseLLMClient):
                     if buffer_size + chunk_size > MAX_BUFFER_SIZE:
                         logger.error(f"Buffer would exceed size limit: {MAX_BUFFER_SIZE} bytes")
                         raise ValueError(f"Response would exceed {MAX_BUFFER_SIZE} bytes")
-                        
-                    buffer.append(chunk.text)
                     buffer_size += chunk_size
                     
-                    if expect_json:
-                        try:
-                            complete_text = ''.join(buffer)
-                            json_response = self.parse_json(complete_text)
-                            yield json_response
-                            # Success! Clear buffer
-                            buffer = []
-                            buffer_size = 0
-                            last_progress = chunk_count
-                        except json.JSONDecodeError:
-                            # Check if we're making progress
-                            if chunk_count - last_progress > 100:
-                                logger.error("No parsing progress in last 100 chunks")
-                                raise ValueError("Failed to make progress parsing JSON")
-                            continue
+                    if parser is not None:
+                        # Single pass: each chunk is scanned exactly once
+                        parser.feed(chunk.text)
+                        if parser.done:
+                            break
                     else:
                         yield chunk.text
                         
-            # Yield any remaining buffer content
-            if buffer and expect_json:
-                try:
-                    complete_text = ''.join(buffer)
-                    json_response = self.parse_json(complete_text)
-                    yield json_response
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse final buffer: {str(e)}")
+            if parser is not None:
+                yield parser.close()
                     
         except Exception as e:
             logger.error(f"Gemini streaming image analysis failed: {str(e)}")
@@ -157,7 +160,7 @@ class GeminiClient(BaseLLMClient):
         try:
             response = await self.model.generate_content_async(
                 contents=prompt,
-                generation_config={"temperature": 0.7}
+                generation_config=self.generation_config
             )
             
             text = response.text
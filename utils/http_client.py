@@ -0,0 +1,55 @@
+"""Shared HTTP connection pool for outbound requests"""
+import os
+import logging
+from typing import Optional
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Connection pool defaults, overridable through the environment
+DEFAULT_POOL_LIMIT = 100
+DEFAULT_POOL_LIMIT_PER_HOST = 20
+DEFAULT_DNS_CACHE_TTL = 300
+DEFAULT_KEEPALIVE_TIMEOUT = 30.0
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_TOTAL_TIMEOUT = 60.0
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def create_http_session(
+    limit: Optional[int] = None,
+    limit_per_host: Optional[int] = None,
+    dns_cache_ttl: Optional[int] = None,
+    keepalive_timeout: Optional[float] = None,
+    connect_timeout: Optional[float] = None,
+    read_timeout: Optional[float] = None,
+    total_timeout: Optional[float] = None
+) -> aiohttp.ClientSession:
+    """Create a pooled client session with keep-alive and a DNS cache
+
+    Must be called from within a running event loop. The caller owns the
+    session and is responsible for closing it.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit if limit is not None else _env_int("HTTP_POOL_LIMIT", DEFAULT_POOL_LIMIT),
+        limit_per_host=limit_per_host if limit_per_host is not None else _env_int("HTTP_POOL_LIMIT_PER_HOST", DEFAULT_POOL_LIMIT_PER_HOST),
+        ttl_dns_cache=dns_cache_ttl if dns_cache_ttl is not None else _env_int("HTTP_DNS_CACHE_TTL", DEFAULT_DNS_CACHE_TTL),
+        keepalive_timeout=keepalive_timeout if keepalive_timeout is not None else _env_float("HTTP_KEEPALIVE_TIMEOUT", DEFAULT_KEEPALIVE_TIMEOUT)
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=total_timeout if total_timeout is not None else _env_float("HTTP_TOTAL_TIMEOUT", DEFAULT_TOTAL_TIMEOUT),
+        connect=connect_timeout if connect_timeout is not None else _env_float("HTTP_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT),
+        sock_read=read_timeout if read_timeout is not None else _env_float("HTTP_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)
+    )
+    logger.info(
+        f"Created HTTP session (limit={connector.limit}, limit_per_host={connector.limit_per_host})"
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
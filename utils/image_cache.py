@@ -0,0 +1,302 @@
+"""Two-tier content-addressed cache for downloaded images"""
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cache defaults, overridable through the environment
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent / ".cache" / "images"
+DEFAULT_MEMORY_BYTES = 256 * 1024 * 1024
+DEFAULT_DISK_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 10000
+# Disk eviction frees space down to this fraction of the budget, so it
+# does not rescan the store on every new image
+DISK_LOW_WATERMARK = 0.9
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+@dataclass
+class CacheEntry:
+    """Validators and content address recorded for a URL"""
+    url: str
+    sha256: str
+    size: int
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    expires_at: float = 0.0
+
+    def is_fresh(self) -> bool:
+        """Whether the origin allowed reuse without revalidation"""
+        return time.time() < self.expires_at
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Headers for a conditional GET against the origin"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+def expires_from_headers(headers) -> float:
+    """Absolute expiry time from Cache-Control max-age, or 0 if absent"""
+    cache_control = headers.get('Cache-Control', '')
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return 0.0
+    match = _MAX_AGE_RE.search(cache_control)
+    return time.time() + int(match.group(1)) if match else 0.0
+
+
+class ImageCache:
+    """In-memory LRU bounded by bytes, backed by an on-disk SHA-256 store
+
+    Blobs live under ``blobs/<sha[:2]>/<sha>`` so identical images fetched
+    from different URLs are stored once. A per-URL index entry keeps the
+    ETag/Last-Modified validators used for conditional revalidation.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        max_memory_bytes: Optional[int] = None,
+        max_disk_bytes: Optional[int] = None,
+        max_entries: Optional[int] = None
+    ):
+        self.cache_dir = Path(cache_dir or os.environ.get("IMAGE_CACHE_DIR", DEFAULT_CACHE_DIR))
+        self.max_memory_bytes = max_memory_bytes if max_memory_bytes is not None else int(
+            os.environ.get("IMAGE_CACHE_MEMORY_BYTES", DEFAULT_MEMORY_BYTES)
+        )
+        self.max_disk_bytes = max_disk_bytes if max_disk_bytes is not None else int(
+            os.environ.get("IMAGE_CACHE_DISK_BYTES", DEFAULT_DISK_BYTES)
+        )
+        self.max_entries = max_entries or int(os.environ.get("IMAGE_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        self._blobs_dir = self.cache_dir / "blobs"
+        self._index_dir = self.cache_dir / "index"
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        # Recently used index entries; the rest are re-read from disk on demand
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        # Bytes of blobs on disk, counted on first store (other processes
+        # sharing the directory make it an estimate between evictions)
+        self._disk_bytes: Optional[int] = None
+        self._evicting = False
+
+    def _blob_path(self, sha256: str) -> Path:
+        return self._blobs_dir / sha256[:2] / sha256
+
+    def _index_path(self, url: str) -> Path:
+        return self._index_dir / (hashlib.sha256(url.encode('utf-8')).hexdigest() + ".json")
+
+    def _remember(self, sha256: str, data: bytes) -> None:
+        """Insert into the memory tier, evicting least recently used blobs"""
+        if len(data) > self.max_memory_bytes:
+            return
+        if sha256 in self._memory:
+            self._memory.move_to_end(sha256)
+            return
+        self._memory[sha256] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _remember_entry(self, url: str, entry: CacheEntry) -> None:
+        self._entries[url] = entry
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_entry(self, url: str) -> Optional[CacheEntry]:
+        path = self._index_path(url)
+        try:
+            with open(path, 'r') as f:
+                return CacheEntry(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Discarding corrupt image cache entry {path}: {str(e)}")
+            return None
+
+    def _write_entry(self, entry: CacheEntry) -> None:
+        path = self._index_path(entry.url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(asdict(entry), f)
+        os.replace(tmp_path, path)
+
+    def _read_blob(self, sha256: str) -> Optional[bytes]:
+        path = self._blob_path(sha256)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Disk eviction is least recently used by mtime
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        if hashlib.sha256(data).hexdigest() != sha256:
+            logger.warning(f"Image cache blob {sha256} failed integrity check")
+            return None
+        return data
+
+    def _write_blob(self, sha256: str, data: bytes) -> int:
+        """Write a blob unless present; returns the bytes added to the disk tier"""
+        path = self._blob_path(sha256)
+        if path.exists():
+            os.utime(path)
+            return 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def _scan_blobs(self) -> List[Tuple[float, int, Path]]:
+        """(mtime, size, path) of every blob on disk"""
+        blobs = []
+        for path in self._blobs_dir.glob("*/*"):
+            if path.suffix == ".tmp":
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            blobs.append((stat.st_mtime, stat.st_size, path))
+        return blobs
+
+    def _disk_usage(self) -> int:
+        return sum(size for _, size, _ in self._scan_blobs())
+
+    def _evict_disk(self) -> int:
+        """Delete orphaned blobs, then least recently used ones, down to the low watermark
+
+        Index entries whose blob is gone are removed too. Returns the bytes
+        left on disk.
+        """
+        referenced = {}
+        for index_path in self._index_dir.glob("*.json"):
+            try:
+                with open(index_path, 'r') as f:
+                    referenced.setdefault(json.load(f)['sha256'], []).append(index_path)
+            except (OSError, ValueError, KeyError):
+                continue
+        blobs = self._scan_blobs()
+        total = sum(size for _, size, _ in blobs)
+        target = self.max_disk_bytes * DISK_LOW_WATERMARK
+        # Orphans (no URL points at them) go first, then oldest first
+        blobs.sort(key=lambda blob: (blob[2].name in referenced, blob[0]))
+        removed = 0
+        for _, size, path in blobs:
+            if total <= target and path.name in referenced:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+            for index_path in referenced.get(path.name, []):
+                try:
+                    index_path.unlink()
+                except FileNotFoundError:
+                    pass
+        logger.info(f"Evicted {removed} images from the disk cache ({total} bytes left)")
+        return total
+
+    async def _account_disk(self, added: int) -> None:
+        """Track disk usage and evict once over budget"""
+        if self._disk_bytes is None:
+            self._disk_bytes = await asyncio.to_thread(self._disk_usage)
+        else:
+            self._disk_bytes += added
+        if self._disk_bytes <= self.max_disk_bytes or self._evicting:
+            return
+        self._evicting = True
+        try:
+            self._disk_bytes = await asyncio.to_thread(self._evict_disk)
+            # Remembered entries whose blob is gone read as misses and are
+            # replaced by the next download
+        finally:
+            self._evicting = False
+
+    async def lookup(self, url: str) -> Optional[CacheEntry]:
+        """Return the cache entry recorded for a URL, if any"""
+        entry = self._entries.get(url)
+        if entry is None:
+            entry = await asyncio.to_thread(self._read_entry, url)
+            if entry is not None:
+                self._remember_entry(url, entry)
+        else:
+            self._entries.move_to_end(url)
+        return entry
+
+    async def read(self, sha256: str) -> Optional[bytes]:
+        """Return blob bytes by content hash, checking memory before disk"""
+        data = self._memory.get(sha256)
+        if data is not None:
+            self._memory.move_to_end(sha256)
+            return data
+        data = await asyncio.to_thread(self._read_blob, sha256)
+        if data is not None:
+            self._remember(sha256, data)
+        return data
+
+    async def store(
+        self,
+        url: str,
+        data: bytes,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        expires_at: float = 0.0
+    ) -> CacheEntry:
+        """Store downloaded bytes and the validators returned with them"""
+        sha256 = hashlib.sha256(data).hexdigest()
+        entry = CacheEntry(
+            url=url,
+            sha256=sha256,
+            size=len(data),
+            etag=etag,
+            last_modified=last_modified,
+            expires_at=expires_at
+        )
+        self._remember(sha256, data)
+        self._remember_entry(url, entry)
+        try:
+            added = await asyncio.to_thread(self._write_blob, sha256, data)
+            await asyncio.to_thread(self._write_entry, entry)
+            await self._account_disk(added)
+        except OSError as e:
+            # The memory tier still serves the image; disk is best effort
+            logger.warning(f"Failed to persist cached image for {url}: {str(e)}")
+        return entry
+
+    async def refresh(self, entry: CacheEntry, expires_at: float) -> None:
+        """Record a successful revalidation (HTTP 304) for an entry"""
+        entry.expires_at = expires_at
+        try:
+            await asyncio.to_thread(self._write_entry, entry)
+        except OSError as e:
+            logger.warning(f"Failed to persist image cache entry for {entry.url}: {str(e)}")
+
+
+_default_cache: Optional[ImageCache] = None
+
+
+def get_image_cache() -> ImageCache:
+    """Process-wide image cache shared by all LLM clients"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ImageCache()
+    return _default_cache
@@ -0,0 +1,184 @@
+"""Image preprocessing between download and LLM upload"""
+import io
+import os
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+from .metrics import stage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; images are then sent as downloaded
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# Preprocessing defaults, overridable through the environment
+DEFAULT_MAX_EDGE = 1536
+DEFAULT_JPEG_QUALITY = 85
+DEFAULT_WORKERS = 2
+
+# Formats the vision models accept as-is
+SUPPORTED_MIME_TYPES = {'image/jpeg', 'image/png', 'image/webp', 'image/heic', 'image/heif'}
+
+
+@dataclass
+class PreparedImage:
+    """Image bytes ready for upload, with their real MIME type"""
+    data: bytes
+    mime_type: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    source_size: int = 0
+
+    @property
+    def sha256(self) -> str:
+        return hashlib.sha256(self.data).hexdigest()
+
+
+def sniff_mime(data: bytes) -> str:
+    """Detect the image format from its magic bytes"""
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    if data[4:8] == b'ftyp':
+        brand = data[8:12]
+        if brand in (b'heic', b'heix', b'hevc', b'hevx'):
+            return 'image/heic'
+        if brand in (b'mif1', b'msf1'):
+            return 'image/heif'
+        if brand == b'avif':
+            return 'image/avif'
+    if data.startswith(b'BM'):
+        return 'image/bmp'
+    return 'application/octet-stream'
+
+
+def preprocess_image(data: bytes, max_edge: int, quality: int) -> PreparedImage:
+    """Downscale to max_edge and re-encode as metadata-free JPEG
+
+    Runs in a worker process. The original bytes are kept when they are
+    already a supported format, small enough and smaller than the
+    re-encoded result.
+    """
+    mime_type = sniff_mime(data)
+    if Image is None:
+        return PreparedImage(data, mime_type, source_size=len(data))
+
+    with Image.open(io.BytesIO(data)) as img:
+        width, height = img.size
+        # Judged on the original size: draft() below may already shrink a
+        # JPEG, and an oversized original must never be passed through
+        resized = max(width, height) > max_edge
+        # Let the JPEG decoder skip detail we are about to throw away
+        img.draft('RGB', (max_edge, max_edge))
+        img = ImageOps.exif_transpose(img)
+        if max(img.size) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel('A'))
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        out = io.BytesIO()
+        img.save(out, format='JPEG', quality=quality, optimize=True)
+        encoded = out.getvalue()
+        prepared_width, prepared_height = img.size
+
+    if not resized and mime_type in SUPPORTED_MIME_TYPES and len(data) <= len(encoded):
+        return PreparedImage(data, mime_type, width, height, source_size=len(data))
+    return PreparedImage(
+        encoded,
+        'image/jpeg',
+        prepared_width,
+        prepared_height,
+        source_size=len(data)
+    )
+
+
+class ImagePreprocessor:
+    """Run image preprocessing off the event loop in a process pool"""
+
+    def __init__(
+        self,
+        max_edge: Optional[int] = None,
+        quality: Optional[int] = None,
+        max_workers: Optional[int] = None
+    ):
+        self.max_edge = max_edge or int(os.environ.get("IMAGE_MAX_EDGE", DEFAULT_MAX_EDGE))
+        self.quality = quality or int(os.environ.get("IMAGE_JPEG_QUALITY", DEFAULT_JPEG_QUALITY))
+        self.max_workers = max_workers or int(os.environ.get("IMAGE_PREPROCESS_WORKERS", DEFAULT_WORKERS))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        if Image is None:
+            logger.warning("Pillow not installed; images will be uploaded without preprocessing")
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn avoids forking a process that owns an event loop and threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._pool
+
+    async def prepare(self, data: bytes, max_edge: Optional[int] = None) -> PreparedImage:
+        """Sniff, downscale and re-encode image bytes for upload"""
+        max_edge = max_edge or self.max_edge
+        if Image is None:
+            return preprocess_image(data, max_edge, self.quality)
+
+        loop = asyncio.get_running_loop()
+        try:
+            with stage('image_preprocess'):
+                prepared = await loop.run_in_executor(
+                    self._get_pool(), preprocess_image, data, max_edge, self.quality
+                )
+        except Exception as e:
+            # Undecodable input is still worth sending; the model may cope
+            logger.warning(f"Image preprocessing failed, sending original bytes: {str(e)}")
+            return PreparedImage(data, sniff_mime(data), source_size=len(data))
+
+        logger.debug(
+            f"Prepared image: {prepared.source_size} -> {len(prepared.data)} bytes "
+            f"({prepared.mime_type}, {prepared.width}x{prepared.height})"
+        )
+        return prepared
+
+    async def warm_up(self) -> None:
+        """Start the worker processes now rather than on the first image"""
+        if Image is None:
+            return
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        # Submitted together, so each task gets a worker of its own
+        await asyncio.gather(*[loop.run_in_executor(pool, os.getpid) for _ in range(self.max_workers)])
+
+    def shutdown(self) -> None:
+        """Stop the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_default_preprocessor: Optional[ImagePreprocessor] = None
+
+
+def get_image_preprocessor() -> ImagePreprocessor:
+    """Process-wide preprocessor shared by all LLM clients"""
+    global _default_preprocessor
+    if _default_preprocessor is None:
+        _default_preprocessor = ImagePreprocessor()
+    return _default_preprocessor
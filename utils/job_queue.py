@@ -0,0 +1,308 @@
+"""Durable local job queue for asynchronous (callback) requests"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional, Callable, Awaitable, List
+
+logger = logging.getLogger(__name__)
+
+# Queue defaults, overridable through the environment
+DEFAULT_QUEUE_PATH = Path(__file__).parent.parent / ".cache" / "jobs.sqlite3"
+DEFAULT_WORKERS = 4
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+# A running job belongs to the worker holding its lease; the lease is
+# renewed while the job runs and, once expired (the worker died), the job
+# is taken over by another worker (JOB_LEASE_SECONDS)
+DEFAULT_LEASE_SECONDS = 60.0
+# Claims of a job before it is failed instead of retried, so a job whose
+# worker keeps dying does not loop forever (JOB_MAX_ATTEMPTS)
+DEFAULT_MAX_ATTEMPTS = 3
+POLL_INTERVAL_SECONDS = 5.0
+# Pause after an unexpected worker error (e.g. a locked database)
+ERROR_BACKOFF_SECONDS = 1.0
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class JobQueue:
+    """SQLite-backed FIFO of jobs that survives process restarts
+
+    Several processes may share the database; each claims jobs under its
+    own worker id with a lease, so only jobs of dead workers are retried.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        lease_seconds: Optional[float] = None,
+        max_attempts: Optional[int] = None
+    ):
+        self.path = Path(path or os.environ.get("JOB_QUEUE_PATH", DEFAULT_QUEUE_PATH))
+        self.lease_seconds = lease_seconds or float(os.environ.get("JOB_LEASE_SECONDS", DEFAULT_LEASE_SECONDS))
+        self.max_attempts = max_attempts or int(os.environ.get("JOB_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._available = asyncio.Event()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, "
+                "result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "owner TEXT, lease_expires REAL)"
+            )
+            # Databases created before leases existed
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if 'owner' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            if 'lease_expires' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = {
+            'job_id': row['id'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+            'payload': json.loads(row['payload'])
+        }
+        if row['result'] is not None:
+            job['result'] = json.loads(row['result'])
+        if row['error'] is not None:
+            job['error'] = json.loads(row['error'])
+        return job
+
+    async def enqueue(self, payload: Dict[str, Any]) -> str:
+        """Persist a new job and wake a worker"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO jobs (id, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, QUEUED, json.dumps(payload), now, now)
+        )
+        self._available.set()
+        return job_id
+
+    async def claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest queued job (or one whose worker's lease expired), leasing it to us
+
+        Jobs that used up their attempts are left to fail_exhausted().
+        """
+        now = time.time()
+        rows = await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ?, owner = ?, lease_expires = ? "
+            "WHERE id = (SELECT id FROM jobs WHERE attempts < ? AND (status = ? "
+            "OR (status = ? AND (lease_expires IS NULL OR lease_expires < ?))) ORDER BY created_at LIMIT 1) "
+            "RETURNING *",
+            (RUNNING, now, self.worker_id, now + self.lease_seconds, self.max_attempts, QUEUED, RUNNING, now)
+        )
+        return self._to_dict(rows[0]) if rows else None
+
+    async def fail_exhausted(self) -> List[Dict[str, Any]]:
+        """Fail abandoned jobs that used up their attempts; return them"""
+        now = time.time()
+        error = {
+            'error_type': 'attempts_exhausted',
+            'error_message': f'Job was interrupted on each of its {self.max_attempts} attempts'
+        }
+        rows = await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ?, owner = NULL, lease_expires = NULL "
+            "WHERE attempts >= ? AND (status = ? OR (status = ? AND (lease_expires IS NULL OR lease_expires < ?))) "
+            "RETURNING *",
+            (FAILED, json.dumps(error), now, self.max_attempts, QUEUED, RUNNING, now)
+        )
+        return [self._to_dict(row) for row in rows]
+
+    async def renew(self, job_id: str) -> bool:
+        """Extend our lease on a running job; False if it is no longer ours"""
+        rows = await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = ? AND owner = ? RETURNING id",
+            (time.time() + self.lease_seconds, job_id, RUNNING, self.worker_id)
+        )
+        return bool(rows)
+
+    async def complete(self, job_id: str, result: Dict[str, Any]) -> bool:
+        """Record the result of a job we hold; False if another worker took it over"""
+        return await self._finish(job_id, SUCCEEDED, 'result', result)
+
+    async def fail(self, job_id: str, error: Dict[str, Any]) -> bool:
+        """Record the error of a job we hold; False if another worker took it over"""
+        return await self._finish(job_id, FAILED, 'error', error)
+
+    async def _finish(self, job_id: str, status: str, column: str, value: Dict[str, Any]) -> bool:
+        rows = await asyncio.to_thread(
+            self._execute,
+            f"UPDATE jobs SET status = ?, {column} = ?, updated_at = ?, lease_expires = NULL "
+            "WHERE id = ? AND status = ? AND owner = ? RETURNING id",
+            (status, json.dumps(value, default=str), time.time(), job_id, RUNNING, self.worker_id)
+        )
+        return bool(rows)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = await asyncio.to_thread(self._execute, "SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._to_dict(rows[0]) if rows else None
+
+    async def recover(self, retention_seconds: float = DEFAULT_RETENTION_SECONDS) -> None:
+        """Requeue jobs whose worker died (lease expired) and purge old finished jobs
+
+        Jobs still leased by live workers, in this or other processes, are left
+        alone, as are ones out of attempts (fail_exhausted() reports those).
+        """
+        now = time.time()
+        requeued = await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET status = ?, updated_at = ?, owner = NULL, lease_expires = NULL "
+            "WHERE status = ? AND (lease_expires IS NULL OR lease_expires < ?) AND attempts < ? RETURNING id",
+            (QUEUED, now, RUNNING, now, self.max_attempts)
+        )
+        await asyncio.to_thread(
+            self._execute,
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (SUCCEEDED, FAILED, now - retention_seconds)
+        )
+        if requeued:
+            logger.info(f"Requeued {len(requeued)} interrupted jobs")
+            self._available.set()
+
+    async def wait_for_jobs(self, timeout: float) -> None:
+        """Sleep until a job is enqueued or the timeout passes"""
+        try:
+            await asyncio.wait_for(self._available.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._available.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class JobWorkerPool:
+    """Background tasks that drain a JobQueue through a handler
+
+    The handler receives the job payload and returns the result dict; an
+    exception marks the job failed. on_finished, if given, is awaited with
+    the final job record (e.g. to deliver a webhook).
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        on_finished: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        workers: Optional[int] = None
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.on_finished = on_finished
+        self.workers = workers or int(os.environ.get("JOB_WORKERS", DEFAULT_WORKERS))
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        await self.queue.recover()
+        self._tasks = [
+            asyncio.create_task(self._run(), name=f"job-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Started {self.workers} job workers")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                for job in await self.queue.fail_exhausted():
+                    logger.error(f"Job {job['job_id']} failed: {job['error']}")
+                    await self._finished(job)
+                job = await self.queue.claim()
+                if job is None:
+                    await self.queue.wait_for_jobs(POLL_INTERVAL_SECONDS)
+                    continue
+                await self._process(job)
+            except Exception as e:
+                # Keep the worker alive; a job left running is retried once its lease expires
+                logger.exception(f"Job worker error, retrying in {ERROR_BACKOFF_SECONDS}s: {str(e)}")
+                await asyncio.sleep(ERROR_BACKOFF_SECONDS)
+
+    async def _renew_lease(self, job_id: str) -> None:
+        """Keep the job's lease alive while its handler runs"""
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                if not await self.queue.renew(job_id):
+                    logger.warning(f"Job {job_id} is no longer leased to this worker")
+                    return
+            except sqlite3.Error as e:
+                logger.warning(f"Renewing the lease on job {job_id} failed: {str(e)}")
+
+    async def _process(self, job: Dict[str, Any]) -> None:
+        job_id = job['job_id']
+        logger.info(f"Running job {job_id} (attempt {job['attempts']})")
+        renewer = asyncio.create_task(self._renew_lease(job_id))
+        try:
+            result = await self.handler(job['payload'])
+        except asyncio.CancelledError:
+            # Left in 'running'; once the lease expires another worker takes it
+            raise
+        except Exception as e:
+            error = getattr(e, 'detail', None) or {
+                'error_type': 'processing_error',
+                'error_message': str(e)
+            }
+            logger.error(f"Job {job_id} failed: {error}")
+            recorded = await self.queue.fail(job_id, error)
+            job.update(status=FAILED, error=error)
+        else:
+            recorded = await self.queue.complete(job_id, result)
+            job.update(status=SUCCEEDED, result=result)
+        finally:
+            renewer.cancel()
+
+        if not recorded:
+            # Another worker owns the job now and will report it
+            logger.warning(f"Lost the lease on job {job_id}; discarding its outcome")
+            return
+        await self._finished(job)
+
+    async def _finished(self, job: Dict[str, Any]) -> None:
+        if self.on_finished is not None:
+            try:
+                await self.on_finished(job)
+            except Exception as e:
+                logger.error(f"Job {job['job_id']} completion hook failed: {str(e)}")
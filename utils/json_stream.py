@@ -0,0 +1,233 @@
+"""Incremental, tolerant JSON parser for streamed LLM output"""
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+_LITERAL_END = re.compile(r'[\s,:\[\]{}"]')
+# Whitespace and separators carry no information for the tolerant parser
+_SKIP = re.compile(r'[\s,:]+')
+
+_ESCAPES = {
+    '"': '"',
+    '\\': '\\',
+    '/': '/',
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t'
+}
+
+_CONSTANTS = {
+    'true': True,
+    'false': False,
+    'null': None,
+    # Python spellings occasionally produced by models
+    'True': True,
+    'False': False,
+    'None': None
+}
+
+_SURROGATES = re.compile('[\ud800-\udfff]')
+
+
+def _literal_value(text: str) -> Any:
+    """Convert a bare token to a JSON scalar, keeping unknown tokens as text"""
+    if text in _CONSTANTS:
+        return _CONSTANTS[text]
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+class IncrementalJSONParser:
+    """Parse a JSON object from text chunks in a single pass
+
+    Text before the first ``{`` (markdown fences, prose) and after the
+    matching ``}`` is ignored. Missing or trailing commas, missing colons,
+    unquoted keys and raw newlines in strings are tolerated, and close()
+    closes any strings, arrays and objects left open by a truncated
+    response.
+
+    feed() returns the top-level (key, value) pairs completed by that
+    chunk, so callers can act on sections before the stream finishes.
+    """
+
+    def __init__(self):
+        self.root: Optional[Dict[str, Any]] = None
+        self.done = False
+        # Open containers: [container, pending key, key of container in its parent]
+        self._stack: List[list] = []
+        self._string: Optional[List[str]] = None
+        self._escape = ''
+        self._literal: Optional[List[str]] = None
+        self._completed: List[Tuple[str, Any]] = []
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk of text; return top-level sections it completed"""
+        i = 0
+        n = len(chunk)
+        while i < n and not self.done:
+            if self._string is not None:
+                i = self._consume_string(chunk, i)
+            elif self._literal is not None:
+                i = self._consume_literal(chunk, i)
+            elif self.root is None:
+                start = chunk.find('{', i)
+                if start < 0:
+                    break
+                self._open({}, None)
+                i = start + 1
+            else:
+                skip = _SKIP.match(chunk, i)
+                if skip is not None:
+                    i = skip.end()
+                    if i >= n:
+                        break
+                c = chunk[i]
+                i += 1
+                if c == '"':
+                    self._string = []
+                elif c == '{':
+                    self._open({}, self._attach_container())
+                elif c == '[':
+                    self._open([], self._attach_container())
+                elif c == '}' or c == ']':
+                    self._close()
+                else:
+                    self._literal = [c]
+        completed, self._completed = self._completed, []
+        return completed
+
+    def close(self) -> Dict[str, Any]:
+        """Finish parsing, closing anything left open, and return the object
+
+        Raises:
+            ValueError: If no JSON object was found in the input
+        """
+        if self._string is not None:
+            self._finish_string()
+        if self._literal is not None:
+            self._finish_literal()
+        while self._stack:
+            self._close()
+        if self.root is None:
+            raise ValueError("Could not find JSON object in response")
+        self._completed = []
+        return self.root
+
+    def _consume_string(self, chunk: str, i: int) -> int:
+        n = len(chunk)
+        while i < n:
+            if self._escape:
+                self._escape += chunk[i]
+                i += 1
+                if self._escape[1] == 'u':
+                    if len(self._escape) < 6:
+                        continue
+                    try:
+                        self._string.append(chr(int(self._escape[2:], 16)))
+                    except ValueError:
+                        self._string.append(self._escape)
+                else:
+                    self._string.append(_ESCAPES.get(self._escape[1], self._escape[1]))
+                self._escape = ''
+                continue
+            match = _STRING_SPECIAL.search(chunk, i)
+            if match is None:
+                self._string.append(chunk[i:])
+                return n
+            end = match.start()
+            if end > i:
+                self._string.append(chunk[i:end])
+            if chunk[end] == '"':
+                self._finish_string()
+                return end + 1
+            self._escape = '\\'
+            i = end + 1
+        return n
+
+    def _finish_string(self) -> None:
+        if self._escape:
+            self._escape = ''
+        value = ''.join(self._string)
+        if _SURROGATES.search(value):
+            value = value.encode('utf-16', 'surrogatepass').decode('utf-16', 'replace')
+        self._string = None
+        self._value(value)
+
+    def _consume_literal(self, chunk: str, i: int) -> int:
+        match = _LITERAL_END.search(chunk, i)
+        if match is None:
+            self._literal.append(chunk[i:])
+            return len(chunk)
+        self._literal.append(chunk[i:match.start()])
+        self._finish_literal()
+        return match.start()
+
+    def _finish_literal(self) -> None:
+        text = ''.join(self._literal)
+        self._literal = None
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and isinstance(frame[0], dict) and frame[1] is None:
+            # Unquoted object key
+            frame[1] = text
+        else:
+            self._value(_literal_value(text))
+
+    def _value(self, value: Any) -> None:
+        """Attach a completed scalar to the innermost open container"""
+        if not self._stack:
+            return
+        frame = self._stack[-1]
+        container = frame[0]
+        if isinstance(container, list):
+            container.append(value)
+            return
+        if frame[1] is None:
+            frame[1] = value if isinstance(value, str) else str(value)
+            return
+        key = frame[1]
+        container[key] = value
+        frame[1] = None
+        if len(self._stack) == 1:
+            self._completed.append((key, value))
+
+    def _attach_container(self) -> Optional[str]:
+        """Reserve the slot for a nested container; return its key in the parent"""
+        frame = self._stack[-1]
+        if isinstance(frame[0], list):
+            return None
+        key = frame[1]
+        frame[1] = None
+        return key
+
+    def _open(self, container: Any, key: Optional[str]) -> None:
+        if not self._stack:
+            self.root = container
+        else:
+            parent = self._stack[-1][0]
+            if isinstance(parent, list):
+                parent.append(container)
+            elif key is not None:
+                parent[key] = container
+        self._stack.append([container, None, key])
+
+    def _close(self) -> None:
+        container, _, key = self._stack.pop()
+        if not self._stack:
+            self.done = True
+        elif len(self._stack) == 1 and key is not None:
+            self._completed.append((key, container))
+
+
+def parse_json_text(text: str) -> Dict[str, Any]:
+    """Parse a complete LLM response into a JSON object"""
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    return parser.close()
@@ -2,33 +2,103 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional, Union
 from enum import Enum
+import aiohttp
+from .image_preprocess import ImagePreprocessor, PreparedImage, get_image_preprocessor
+from .prompt_registry import RenderedPrompt
+
+def is_retryable_status(status: Optional[int]) -> bool:
+    """Whether an HTTP status (None for network errors) is worth retrying"""
+    return status is None or status in (408, 429) or status >= 500
+
+class LLMError(Exception):
+    """Base class for errors raised by LLM clients"""
+    retryable = False
+
+class ImageFetchError(LLMError):
+    """The image could not be downloaded"""
+    
+    def __init__(self, message: str, status: Optional[int] = None, retryable: Optional[bool] = None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = is_retryable_status(status) if retryable is None else retryable
+
+class ProviderError(LLMError):
+    """The LLM provider rejected or failed the request"""
+    
+    def __init__(self, message: str, status: Optional[int] = None, retryable: Optional[bool] = None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = is_retryable_status(status) if retryable is None else retryable
+
+class ResponseFormatError(LLMError, ValueError):
+    """The LLM response could not be parsed; raw_text keeps it for repair"""
+    
+    def __init__(self, message: str, raw_text: str = ""):
+        super().__init__(message)
+        self.raw_text = raw_text
 
 class LLMProvider(str, Enum):
     """Supported LLM providers"""
     GEMINI = "gemini"
+    FAKE = "fake"
     
 class BaseLLMClient(ABC):
     """Base class for LLM clients"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    # Identify what the provider is asked to do, e.g. for result caching
+    model_name: str = ""
+    generation_config: Dict[str, Any] = {}
+    
+    # Longest image edge worth uploading; None uses the preprocessor default
+    max_image_edge: Optional[int] = None
+    
+    def __init__(self, api_key: Optional[str] = None, http_session: Optional[aiohttp.ClientSession] = None):
         self.api_key = api_key
+        self.http_session = http_session
+        self.preprocessor: ImagePreprocessor = get_image_preprocessor()
+        
+    def set_http_session(self, http_session: Optional[aiohttp.ClientSession]) -> None:
+        """Use a shared connection pool for outbound HTTP requests"""
+        self.http_session = http_session
+        
+    async def warm_up(self) -> None:
+        """Open connections ahead of the first request (no-op by default)"""
+        
+    @abstractmethod
+    async def fetch_image(self, image_url: str) -> bytes:
+        """Download the raw image bytes from a URL"""
+        pass
+        
+    async def prepare_image(self, image_url: str) -> PreparedImage:
+        """Download and preprocess an image for upload to this LLM"""
+        image_data = await self.fetch_image(image_url)
+        return await self.preprocessor.prepare(image_data, self.max_image_edge)
         
     @abstractmethod
     async def analyze_image(
         self,
         image_url: str,
-        prompt: str,
-        expect_json: bool = False
+        prompt: Union[str, RenderedPrompt],
+        expect_json: bool = False,
+        image: Optional[PreparedImage] = None,
+        response_schema: Optional[Dict[str, Any]] = None
     ) -> Union[str, Dict[str, Any]]:
-        """Analyze an image using the LLM"""
+        """Analyze an image using the LLM
+        
+        Pass image to reuse an image already prepared for image_url, and
+        response_schema to request structured output where supported. A
+        RenderedPrompt lets providers cache its static prefix.
+        """
         pass
         
     @abstractmethod
     async def analyze_image_stream(
         self,
         image_url: str,
-        prompt: str,
-        expect_json: bool = False
+        prompt: Union[str, RenderedPrompt],
+        expect_json: bool = False,
+        image: Optional[PreparedImage] = None,
+        response_schema: Optional[Dict[str, Any]] = None
     ):
         """Stream image analysis results from the LLM"""
         pass
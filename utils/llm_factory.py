@@ -1,15 +1,64 @@
 """Factory for creating LLM clients"""
-from typing import Optional
+import os
+from typing import List, Optional
+import aiohttp
 from .llm_base import BaseLLMClient, LLMProvider
-from .llm_gemini import GeminiClient
+from .llm_fake import FakeLLMClient, RecordingLLMClient
+from .llm_pool import LLMPool
 
 class LLMFactory:
     """Factory for creating LLM clients"""
-    
+
     @staticmethod
-    def create(provider: LLMProvider, api_key: Optional[str] = None) -> BaseLLMClient:
+    def create(
+        provider: LLMProvider,
+        api_key: Optional[str] = None,
+        http_session: Optional[aiohttp.ClientSession] = None,
+        model_name: Optional[str] = None
+    ) -> BaseLLMClient:
         """Create an LLM client"""
         if provider == LLMProvider.GEMINI:
-            return GeminiClient(api_key)
+            # The Gemini SDK takes most of a second to import; only pay for it when used
+            from .llm_gemini import GeminiClient
+            return GeminiClient(api_key, http_session=http_session, model_name=model_name)
+        elif provider == LLMProvider.FAKE:
+            return FakeLLMClient(api_key, http_session=http_session, name=model_name or "fake")
         else:
             raise ValueError(f"Unsupported LLM provider: {provider}")
+
+    @staticmethod
+    def create_pool(
+        members: List[str],
+        http_session: Optional[aiohttp.ClientSession] = None
+    ) -> BaseLLMClient:
+        """Create a client per "provider[:model]" spec, pooled if there are several
+
+        Gemini specs expand to one client per key in GEMINI_API_KEYS
+        (comma-separated), falling back to GEMINI_API_KEY.
+        """
+        gemini_keys = [key.strip() for key in os.environ.get("GEMINI_API_KEYS", "").split(",") if key.strip()]
+        clients = []
+        for spec in members:
+            provider, _, model_name = spec.strip().partition(":")
+            provider = LLMProvider(provider.lower())
+            keys = gemini_keys if provider == LLMProvider.GEMINI and gemini_keys else [None]
+            for key in keys:
+                clients.append(LLMFactory.create(provider, key, http_session, model_name or None))
+        if len(clients) == 1:
+            return clients[0]
+        return LLMPool(clients, http_session=http_session)
+
+    @staticmethod
+    def from_env(http_session: Optional[aiohttp.ClientSession] = None) -> BaseLLMClient:
+        """Create the client configured by LLM_PROVIDERS (default "gemini")
+
+        e.g. LLM_PROVIDERS="gemini,gemini:gemini-1.5-flash" pools two models.
+        With LLM_RECORD_PATH set, replies are also recorded there for
+        replaying through the fake provider.
+        """
+        members = [spec for spec in os.environ.get("LLM_PROVIDERS", LLMProvider.GEMINI.value).split(",") if spec.strip()]
+        client = LLMFactory.create_pool(members, http_session)
+        record_path = os.environ.get("LLM_RECORD_PATH")
+        if record_path:
+            client = RecordingLLMClient(client, record_path)
+        return client
@@ -0,0 +1,337 @@
+"""Local fake LLM client for exercising the service offline"""
+import os
+import json
+import random
+import asyncio
+import hashlib
+import logging
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Any, List, Union, Optional, AsyncGenerator
+import aiohttp
+from .llm_base import BaseLLMClient, ImageFetchError, ProviderError, ResponseFormatError
+from .image_preprocess import PreparedImage
+from .json_stream import parse_json_text
+from .prompt_registry import RenderedPrompt
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'fake'
+
+# Simulated provider behaviour, overridable through the environment:
+# seconds before the first chunk (FAKE_LLM_LATENCY, plus up to
+# FAKE_LLM_LATENCY_JITTER), a slow tail (FAKE_LLM_SLOW_RATE of calls take
+# FAKE_LLM_SLOW_LATENCY instead), replies streamed FAKE_LLM_CHUNK_SIZE
+# characters at a time every FAKE_LLM_CHUNK_INTERVAL seconds, and failures
+# (FAKE_LLM_FAILURE_RATE of calls fail with HTTP FAKE_LLM_FAILURE_STATUS
+# before any output; FAKE_LLM_TRUNCATE_RATE stop halfway through).
+# FAKE_LLM_SEED makes every draw a function of the request, so a replayed
+# workload behaves identically however its calls interleave.
+DEFAULT_LATENCY = 0.05
+DEFAULT_CHUNK_SIZE = 256
+DEFAULT_FAILURE_STATUS = 503
+
+# Served for every image URL unless fetching is enabled: a 1x1 white PNG
+PLACEHOLDER_PNG = (
+    b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00\x90wS'
+    b'\xde\x00\x00\x00\x0cIDATx\x9cc\xf8\xff\xff?\x00\x05\xfe\x02\xfe\r\xefF\xb8\x00\x00\x00\x00IEND'
+    b'\xaeB`\x82'
+)
+
+
+def sample_from_schema(schema: Dict[str, Any]) -> Any:
+    """Build a minimal value that satisfies a provider response schema"""
+    kind = str(schema.get('type', 'string')).lower()
+    if kind == 'object':
+        return {name: sample_from_schema(sub) for name, sub in schema.get('properties', {}).items()}
+    if kind == 'array':
+        return [sample_from_schema(schema.get('items', {}))]
+    if kind in ('number', 'integer'):
+        return 1
+    if kind == 'boolean':
+        return True
+    return 'sample'
+
+
+def _digest(value: Union[str, bytes]) -> str:
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return hashlib.sha256(value).hexdigest()
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+class FakeLLMClient(BaseLLMClient):
+    """LLM client that answers locally after a simulated delay
+
+    Replies come from a recording (see RecordingLLMClient) when one is
+    given, preferring an exact prompt and image match, then the same
+    prompt, then any recorded reply. Otherwise they match the requested
+    response schema, or echo the JSON example embedded in the prompt.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        http_session: Optional[aiohttp.ClientSession] = None,
+        latency: Optional[float] = None,
+        latency_jitter: Optional[float] = None,
+        slow_rate: Optional[float] = None,
+        slow_latency: Optional[float] = None,
+        failure_rate: Optional[float] = None,
+        failure_status: Optional[int] = None,
+        truncate_rate: Optional[float] = None,
+        chunk_size: Optional[int] = None,
+        chunk_interval: Optional[float] = None,
+        replay_path: Optional[Path] = None,
+        fetch_images: Optional[bool] = None,
+        seed: Optional[str] = None,
+        name: str = MODEL_NAME
+    ):
+        super().__init__(api_key, http_session)
+        self.model_name = name
+        self.generation_config = {}
+        self.latency = latency if latency is not None else _env_float("FAKE_LLM_LATENCY", DEFAULT_LATENCY)
+        self.latency_jitter = latency_jitter if latency_jitter is not None else _env_float("FAKE_LLM_LATENCY_JITTER", 0)
+        self.slow_rate = slow_rate if slow_rate is not None else _env_float("FAKE_LLM_SLOW_RATE", 0)
+        self.slow_latency = slow_latency if slow_latency is not None else _env_float("FAKE_LLM_SLOW_LATENCY", 0)
+        self.failure_rate = failure_rate if failure_rate is not None else _env_float("FAKE_LLM_FAILURE_RATE", 0)
+        self.failure_status = failure_status or int(os.environ.get("FAKE_LLM_FAILURE_STATUS", DEFAULT_FAILURE_STATUS))
+        self.truncate_rate = truncate_rate if truncate_rate is not None else _env_float("FAKE_LLM_TRUNCATE_RATE", 0)
+        self.chunk_size = chunk_size or int(os.environ.get("FAKE_LLM_CHUNK_SIZE", DEFAULT_CHUNK_SIZE))
+        self.chunk_interval = chunk_interval if chunk_interval is not None else _env_float("FAKE_LLM_CHUNK_INTERVAL", 0)
+        # Download images from their URLs (e.g. a local image server) instead of the placeholder
+        if fetch_images is None:
+            fetch_images = os.environ.get("FAKE_LLM_FETCH_IMAGES", "0").lower() in ("1", "true", "yes")
+        self.fetch_images = fetch_images
+        self.seed = seed if seed is not None else os.environ.get("FAKE_LLM_SEED")
+        self.calls = 0
+        self._call_counts: Dict[str, int] = defaultdict(int)
+
+        # Recorded replies by (prompt, image) digest and by prompt digest
+        self._replies: Dict[str, List[str]] = defaultdict(list)
+        self._all_replies: List[str] = []
+        replay_path = replay_path or os.environ.get("FAKE_LLM_REPLAY_PATH")
+        if replay_path:
+            self._load_replay(Path(replay_path))
+
+    def _load_replay(self, path: Path) -> None:
+        with path.open(encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                reply = record['response']
+                self._replies[f"{record['prompt_sha256']}:{record.get('image_sha256')}"].append(reply)
+                self._replies[record['prompt_sha256']].append(reply)
+                self._all_replies.append(reply)
+        logger.info(f"Loaded {len(self._all_replies)} recorded replies from {path}")
+
+    def _rng(self, key: str) -> random.Random:
+        """Randomness for one call: seeded by the request itself when FAKE_LLM_SEED is set"""
+        count = self._call_counts[key]
+        self._call_counts[key] += 1
+        if self.seed is None:
+            return random.Random()
+        return random.Random(f"{self.seed}:{key}:{count}")
+
+    def _reply(
+        self,
+        prompt: Union[str, RenderedPrompt],
+        image: Optional[PreparedImage],
+        response_schema: Optional[Dict[str, Any]],
+        rng: random.Random
+    ) -> str:
+        text = str(prompt)
+        prompt_key = _digest(text)
+        for key in (f"{prompt_key}:{image.sha256 if image else None}", prompt_key):
+            if self._replies.get(key):
+                return rng.choice(self._replies[key])
+        if self._all_replies:
+            return rng.choice(self._all_replies)
+        if response_schema is not None:
+            return json.dumps(sample_from_schema(response_schema))
+        start, end = text.find('{'), text.rfind('}')
+        if 0 <= start < end:
+            try:
+                return json.dumps(parse_json_text(text[start:end + 1]))
+            except ValueError:
+                pass
+        return f"Fake response from {self.model_name}"
+
+    async def _stream(
+        self,
+        prompt: Union[str, RenderedPrompt],
+        image: Optional[PreparedImage] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> AsyncGenerator[str, None]:
+        """Wait out the simulated latency, then stream the reply in chunks"""
+        self.calls += 1
+        rng = self._rng(f"{_digest(str(prompt))}:{image.sha256 if image else None}")
+        reply = self._reply(prompt, image, response_schema, rng)
+        if rng.random() < self.slow_rate:
+            delay = self.slow_latency
+        else:
+            delay = self.latency + rng.uniform(0, self.latency_jitter)
+        await asyncio.sleep(delay)
+        if rng.random() < self.failure_rate:
+            raise ProviderError(f"{self.model_name} request failed: simulated error", status=self.failure_status)
+        if rng.random() < self.truncate_rate:
+            reply = reply[:len(reply) // 2]
+        for i in range(0, len(reply), self.chunk_size):
+            if i:
+                await asyncio.sleep(self.chunk_interval)
+            yield reply[i:i + self.chunk_size]
+
+    async def _collect(self, stream: AsyncGenerator[str, None], expect_json: bool) -> Union[str, Dict[str, Any]]:
+        text = ''.join([chunk async for chunk in stream])
+        if not expect_json:
+            return text
+        try:
+            return parse_json_text(text)
+        except ValueError as e:
+            raise ResponseFormatError(str(e), text) from e
+
+    async def fetch_image(self, image_url: str) -> bytes:
+        """Download the image if fetching is enabled, else return a placeholder"""
+        if not self.fetch_images:
+            return PLACEHOLDER_PNG
+        try:
+            if self.http_session is not None:
+                return await self._download(self.http_session, image_url)
+            async with aiohttp.ClientSession() as session:
+                return await self._download(session, image_url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise ImageFetchError(f"Failed to fetch image: {str(e) or type(e).__name__}") from e
+
+    async def _download(self, session: aiohttp.ClientSession, url: str) -> bytes:
+        async with session.get(url) as response:
+            if response.status != 200:
+                raise ImageFetchError(f"Failed to fetch image: HTTP {response.status}", status=response.status)
+            return await response.read()
+
+    async def analyze_image(
+        self,
+        image_url: str,
+        prompt: Union[str, RenderedPrompt],
+        expect_json: bool = False,
+        image: Optional[PreparedImage] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> Union[str, Dict[str, Any]]:
+        """Answer an image analysis request locally"""
+        if image is None:
+            image = await self.prepare_image(image_url)
+        return await self._collect(self._stream(prompt, image, response_schema), expect_json)
+
+    async def analyze_image_stream(
+        self,
+        image_url: str,
+        prompt: Union[str, RenderedPrompt],
+        expect_json: bool = False,
+        image: Optional[PreparedImage] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> AsyncGenerator[Union[str, Dict[str, Any]], None]:
+        """Stream a local answer in chunks, or the parsed object if expect_json"""
+        if image is None:
+            image = await self.prepare_image(image_url)
+        stream = self._stream(prompt, image, response_schema)
+        if expect_json:
+            yield await self._collect(stream, True)
+        else:
+            async for text in stream:
+                yield text
+
+    async def generate(
+        self,
+        prompt: str,
+        expect_json: bool = False
+    ) -> Union[str, Dict[str, Any]]:
+        """Generate text locally"""
+        return await self._collect(self._stream(prompt), expect_json)
+
+
+class RecordingLLMClient(BaseLLMClient):
+    """Pass calls through to a real client, appending its replies to a JSONL file
+
+    The file can be replayed with FakeLLMClient (FAKE_LLM_REPLAY_PATH).
+    """
+
+    def __init__(self, client: BaseLLMClient, path: Path):
+        super().__init__(None, client.http_session)
+        self.client = client
+        self.path = Path(path)
+        self.model_name = client.model_name
+        self.generation_config = client.generation_config
+        self.max_image_edge = client.max_image_edge
+        self._lock = asyncio.Lock()
+
+    def set_http_session(self, http_session: Optional[aiohttp.ClientSession]) -> None:
+        self.http_session = http_session
+        self.client.set_http_session(http_session)
+
+    async def warm_up(self) -> None:
+        await self.client.warm_up()
+
+    async def fetch_image(self, image_url: str) -> bytes:
+        return await self.client.fetch_image(image_url)
+
+    async def prepare_image(self, image_url: str) -> PreparedImage:
+        return await self.client.prepare_image(image_url)
+
+    def _append(self, line: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open('a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+    async def _record(self, prompt: Union[str, RenderedPrompt], image: Optional[PreparedImage], reply: Any) -> None:
+        record = {
+            'prompt_sha256': _digest(str(prompt)),
+            'image_sha256': image.sha256 if image else None,
+            'response': reply if isinstance(reply, str) else json.dumps(reply)
+        }
+        async with self._lock:
+            await asyncio.to_thread(self._append, json.dumps(record))
+
+    async def analyze_image(
+        self,
+        image_url: str,
+        prompt: Union[str, RenderedPrompt],
+        expect_json: bool = False,
+        image: Optional[PreparedImage] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> Union[str, Dict[str, Any]]:
+        if image is None:
+            image = await self.prepare_image(image_url)
+        result = await self.client.analyze_image(image_url, prompt, expect_json, image, response_schema)
+        await self._record(prompt, image, result)
+        return result
+
+    async def analyze_image_stream(
+        self,
+        image_url: str,
+        prompt: Union[str, RenderedPrompt],
+        expect_json: bool = False,
+        image: Optional[PreparedImage] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> AsyncGenerator[Union[str, Dict[str, Any]], None]:
+        if image is None:
+            image = await self.prepare_image(image_url)
+        received = []
+        async for item in self.client.analyze_image_stream(image_url, prompt, expect_json, image, response_schema):
+            received.append(item)
+            yield item
+        if not expect_json:
+            await self._record(prompt, image, ''.join(received))
+        elif received:
+            await self._record(prompt, image, received[0])
+
+    async def generate(
+        self,
+        prompt: str,
+        expect_json: bool = False
+    ) -> Union[str, Dict[str, Any]]:
+        result = await self.client.generate(prompt, expect_json)
+        await self._record(prompt, None, result)
+        return result
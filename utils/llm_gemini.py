@@ -1,98 +1,100 @@
 """Gemini LLM client"""
 import os
-import json
+import time
+import asyncio
+import hashlib
 import logging
-from typing import Dict, Any, Union, Optional
+from typing import Dict, Any, Union, Optional, AsyncGenerator, Tuple
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from google.generativeai import caching
+from google.generativeai.types import BlockedPromptException, StopCandidateException
+from google.api_core import exceptions as google_exceptions
 import aiohttp
-from .llm_base import BaseLLMClient
-from .url_converter import URLConverter
+from .llm_base import BaseLLMClient, ImageFetchError, ProviderError, ResponseFormatError
+from .image_preprocess import PreparedImage
+from .image_cache import ImageCache, get_image_cache, expires_from_headers
+from .json_stream import IncrementalJSONParser, parse_json_text
+from .metrics import BYTES_TOTAL, CACHE_LOOKUPS, IN_FLIGHT, observe_stage, stage
+from .prompt_registry import RenderedPrompt
+from .rate_limiter import AdaptiveRateLimiter, DEFAULT_INITIAL_CONCURRENCY
+from .url_converter import get_url_converter
 
 logger = logging.getLogger(__name__)
 
+MODEL_NAME = 'gemini-2.0-flash-001'
+
+# The SDK's default clients (and so context caching) use the first key
+# configured; clients with another key talk to Gemini through their own
+_default_api_key: Optional[str] = None
+
+# Gemini tiles images into 768px crops; larger inputs only add upload time
+DEFAULT_MAX_IMAGE_EDGE = 1536
+
+# Ceiling for the adaptive number of concurrent Gemini generations per
+# process (GEMINI_MAX_IN_FLIGHT); it starts at GEMINI_INITIAL_IN_FLIGHT.
+# GEMINI_REQUESTS_PER_MINUTE / GEMINI_TOKENS_PER_MINUTE set quota budgets
+# (0 = unlimited).
+DEFAULT_MAX_IN_FLIGHT = 50
+
+# Rough token costs for budgeting until the response reports real usage
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS_ESTIMATE = 1032  # four 258-token tiles
+
+# Seconds to keep static prompt prefixes in Gemini's context cache
+# (GEMINI_CONTEXT_CACHE_TTL); 0 disables. Gemini only caches contexts above
+# a minimum token count, so this pays off for long instruction prefixes.
+DEFAULT_CONTEXT_CACHE_TTL = 0
+# Recreate a cached context once this fraction of its TTL has passed
+CONTEXT_CACHE_REFRESH_FRACTION = 0.9
+
+GENERATION_CONFIG = {
+    "temperature": 0.1,
+    "top_p": 0.99,
+    "top_k": 10,
+    "max_output_tokens": 2048,
+    "candidate_count": 1
+}
+
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_ONLY_HIGH"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_ONLY_HIGH"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_ONLY_HIGH"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_ONLY_HIGH"
+    }
+]
+
 class GeminiClient(BaseLLMClient):
     """Client for Google's Gemini API"""
     
-    def _process_json_stream(self, chunks: list) -> Dict[str, Any]:
-        """Process a stream of chunks into a JSON object with enhanced cleaning"""
-        # Join all chunks into a single string
-        text = ''.join(chunks)
-        logger.debug(f"Raw text length: {len(text)}")
-        
-        # Remove markdown if present
-        if '```' in text:
-            parts = text.split('```')
-            if len(parts) >= 3:
-                text = parts[1]
-                if text.startswith('json'):
-                    text = text[4:]
-                logger.debug("Removed markdown formatting")
-        
-        # Clean up whitespace and find JSON boundaries
-        text = text.strip()
-        start = text.find('{')
-        end = text.rfind('}')
-        
-        if start >= 0 and end >= 0:
-            text = text[start:end + 1]
-            logger.debug(f"Found JSON object from index {start} to {end}")
-            
-            # First try direct parse
-            try:
-                data = json.loads(text)
-                if not isinstance(data, dict):
-                    raise ValueError("Response is not a JSON object")
-                logger.debug("Successfully parsed JSON on first attempt")
-                return data
-            except json.JSONDecodeError as e:
-                logger.warning(f"Initial JSON parse failed: {str(e)}")
-                
-                # Enhanced JSON cleaning
-                # 1. Basic cleanup
-                text = text.replace('\n', ' ')  # Remove newlines
-                text = ' '.join(text.split())   # Normalize whitespace
-                
-                # 2. Fix common JSON structural issues
-                text = text.replace(',}', '}')  # Fix trailing commas in objects
-                text = text.replace(',]', ']')  # Fix trailing commas in arrays
-                text = text.replace('}"', '}, "')  # Fix missing commas between objects
-                text = text.replace(']"', '], "')  # Fix missing commas between arrays
-                text = text.replace('}{', '}, {')  # Fix missing commas between objects
-                text = text.replace('][', '], [')  # Fix missing commas between arrays
-                
-                # 3. Fix quote issues
-                text = text.replace('\\"', '"')  # Fix escaped quotes
-                text = text.replace('""', '"')    # Fix double quotes
-                
-                # 4. Balance brackets and braces
-                open_curly = text.count('{')
-                close_curly = text.count('}')
-                open_square = text.count('[')
-                close_square = text.count(']')
-                
-                # Add missing closing braces/brackets
-                if open_curly > close_curly:
-                    text += '}' * (open_curly - close_curly)
-                if open_square > close_square:
-                    text += ']' * (open_square - close_square)
-                
-                logger.debug("Attempting JSON parse with enhanced cleaning")
-                try:
-                    data = json.loads(text)
-                    if not isinstance(data, dict):
-                        raise ValueError("Response is not a JSON object")
-                    logger.debug("Successfully parsed JSON after cleaning")
-                    return data
-                except (json.JSONDecodeError, ValueError) as e:
-                    logger.error(f"Failed to parse JSON after cleaning: {str(e)}")
-                    logger.debug(f"Failed text: {text[:500]}...")
-                    raise ValueError("LLM response was not valid JSON") from e
-        
-        logger.error("Could not find JSON object markers in response")
-        raise ValueError("Could not find JSON object in response")
+    def parse_json(self, text: str) -> Dict[str, Any]:
+        """Parse a complete response text into a JSON object"""
+        try:
+            return parse_json_text(text)
+        except ValueError as e:
+            raise ResponseFormatError(str(e), text) from e
     
-    def __init__(self, api_key: Optional[str] = None):
-        super().__init__(api_key)
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        max_in_flight: Optional[int] = None,
+        http_session: Optional[aiohttp.ClientSession] = None,
+        image_cache: Optional[ImageCache] = None,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+        model_name: Optional[str] = None
+    ):
+        super().__init__(api_key, http_session)
         
         # Use provided API key or get from environment
         self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
@@ -100,12 +102,68 @@ class GeminiClient(BaseLLMClient):
             raise ValueError("GEMINI_API_KEY not provided or found in environment")
             
         # Configure and initialize the model
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-001')
+        global _default_api_key
+        if _default_api_key is None:
+            genai.configure(api_key=self.api_key)
+            _default_api_key = self.api_key
+        self._async_client: Optional[glm.GenerativeServiceAsyncClient] = None
+        self.model_name = model_name or os.environ.get("GEMINI_MODEL", MODEL_NAME)
+        self.generation_config = GENERATION_CONFIG
+        self.max_image_edge = int(os.environ.get("GEMINI_MAX_IMAGE_EDGE", DEFAULT_MAX_IMAGE_EDGE))
+        self.model = genai.GenerativeModel(self.model_name)
+        
+        # Adaptive concurrency and quota budgets for every generation
+        if max_in_flight is None:
+            max_in_flight = int(os.environ.get("GEMINI_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT))
+        self.max_in_flight = max_in_flight
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter(
+            max_concurrency=max_in_flight,
+            initial_concurrency=int(os.environ.get("GEMINI_INITIAL_IN_FLIGHT", DEFAULT_INITIAL_CONCURRENCY)),
+            requests_per_minute=float(os.environ.get("GEMINI_REQUESTS_PER_MINUTE", 0)),
+            tokens_per_minute=float(os.environ.get("GEMINI_TOKENS_PER_MINUTE", 0)),
+            name="gemini"
+        )
+        
+        # Initialize URL converter and the shared image cache
+        self.url_converter = get_url_converter()
+        self.image_cache = image_cache or get_image_cache()
         
-        # Initialize URL converter
-        self.url_converter = URLConverter()
+        # Models bound to cached prompt prefixes: sha256(prefix) -> (model, refresh at)
+        self.context_cache_ttl = int(os.environ.get("GEMINI_CONTEXT_CACHE_TTL", DEFAULT_CONTEXT_CACHE_TTL))
+        self._context_models: Dict[str, Tuple[genai.GenerativeModel, float]] = {}
+        self._context_lock = asyncio.Lock()
         
+    async def _download(self, session: aiohttp.ClientSession, url: str, headers: Dict[str, str]) -> bytes:
+        """Download a URL body, revalidating any cached copy with a conditional GET"""
+        entry = await self.image_cache.lookup(url)
+        cached = await self.image_cache.read(entry.sha256) if entry else None
+        if entry and cached is not None:
+            if entry.is_fresh():
+                logger.debug("Image cache hit (fresh): %s", url)
+                CACHE_LOOKUPS.inc(cache='image', outcome='hit')
+                return cached
+            headers = {**headers, **entry.conditional_headers()}
+            
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304 and cached is not None:
+                logger.debug("Image cache hit (revalidated): %s", url)
+                CACHE_LOOKUPS.inc(cache='image', outcome='revalidated')
+                await self.image_cache.refresh(entry, expires_from_headers(response.headers))
+                return cached
+            if response.status != 200:
+                raise ImageFetchError(f"Failed to fetch image: HTTP {response.status}", status=response.status)
+            data = await response.read()
+            CACHE_LOOKUPS.inc(cache='image', outcome='miss')
+            BYTES_TOTAL.inc(len(data), direction='download', peer='image')
+            await self.image_cache.store(
+                url,
+                data,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+                expires_at=expires_from_headers(response.headers)
+            )
+            return data
+            
     async def _fetch_image(self, image_url: str) -> bytes:
         """Fetch image data from URL with browser-like headers"""
         headers = {
@@ -118,91 +176,250 @@ class GeminiClient(BaseLLMClient):
         }
         
         try:
-            # Convert URL if needed (e.g. Google Drive)
-            direct_url = self.url_converter.convert_url(image_url)
+            # Convert share links (e.g. Google Drive) at the size we upload;
+            # direct URLs, like the ones the app already resolved, pass through
+            with stage('url_convert'):
+                direct_url = await self.url_converter.resolve(image_url, self.http_session, self.max_image_edge)
             if not direct_url:
-                raise ValueError(f"Could not convert URL: {image_url}")
+                raise ImageFetchError(f"Could not convert URL: {image_url}", retryable=False)
+                
+            logger.debug("Fetching image from: %s", direct_url)
+            with stage('image_download'):
+                if self.http_session is not None:
+                    return await self._download(self.http_session, direct_url, headers)
                 
-            logger.debug(f"Fetching image from: {direct_url}")
-            async with aiohttp.ClientSession() as session:
-                async with session.get(direct_url, headers=headers) as response:
-                    if response.status != 200:
-                        raise ValueError(f"Failed to fetch image: HTTP {response.status}")
-                    return await response.read()
+                # No shared pool injected (e.g. standalone scripts)
+                async with aiohttp.ClientSession() as session:
+                    return await self._download(session, direct_url, headers)
                     
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Error fetching image from {image_url}: {str(e)}")
+            raise ImageFetchError(f"Failed to fetch image: {str(e) or type(e).__name__}") from e
         except Exception as e:
             logger.error(f"Error fetching image from {image_url}: {str(e)}")
             raise
             
+    async def _parse_stream(self, stream: AsyncGenerator[str, None]) -> Dict[str, Any]:
+        """Parse streamed text into a JSON object in a single pass"""
+        parser = IncrementalJSONParser()
+        received = []
+        async for text in stream:
+            received.append(text)
+            parser.feed(text)
+        try:
+            return parser.close()
+        except ValueError as e:
+            raise ResponseFormatError(str(e), ''.join(received)) from e
+            
+    async def _model_for_prefix(self, prefix: str) -> Optional[genai.GenerativeModel]:
+        """A model whose cached context already holds prefix, or None to send it inline"""
+        if not self.context_cache_ttl or not prefix or self.api_key != _default_api_key:
+            return None
+        key = hashlib.sha256(prefix.encode('utf-8')).hexdigest()
+        async with self._context_lock:
+            now = time.monotonic()
+            cached = self._context_models.get(key)
+            if cached is not None and cached[1] > now:
+                return cached[0]
+            try:
+                content = await asyncio.to_thread(
+                    caching.CachedContent.create,
+                    model=f"models/{self.model_name}",
+                    display_name=f"prompt-{key[:16]}",
+                    contents=[prefix],
+                    ttl=self.context_cache_ttl
+                )
+            except google_exceptions.InvalidArgument as e:
+                # e.g. prefix below the minimum cacheable size; stop trying
+                logger.warning(f"Context caching rejected, sending full prompts: {str(e)}")
+                self.context_cache_ttl = 0
+                return None
+            except google_exceptions.GoogleAPICallError as e:
+                logger.warning(f"Context cache creation failed: {str(e)}")
+                return None
+            model = genai.GenerativeModel.from_cached_content(content)
+            self._context_models = {k: v for k, v in self._context_models.items() if v[1] > now}
+            self._context_models[key] = (model, now + self.context_cache_ttl * CONTEXT_CACHE_REFRESH_FRACTION)
+            logger.info(f"Cached prompt prefix in Gemini context cache: {content.name}")
+            return model
+            
+    def _bind_client(self, model: genai.GenerativeModel) -> genai.GenerativeModel:
+        """Send model's requests with this client's key rather than the default one"""
+        if self.api_key != _default_api_key:
+            if self._async_client is None:
+                # Created on first use, inside the event loop it will run on
+                self._async_client = glm.GenerativeServiceAsyncClient(client_options={"api_key": self.api_key})
+            # The SDK has no public hook for this; models pick a client lazily
+            model._async_client = self._async_client
+        return model
+        
+    def _estimate_tokens(self, contents: Any) -> int:
+        """Approximate prompt plus maximum output tokens of a request"""
+        tokens = self.generation_config.get("max_output_tokens", 0)
+        for part in contents if isinstance(contents, list) else [contents]:
+            if isinstance(part, str):
+                tokens += len(part) // CHARS_PER_TOKEN
+            elif "text" in part:
+                tokens += len(part["text"]) // CHARS_PER_TOKEN
+            elif "data" in part:
+                tokens += IMAGE_TOKENS_ESTIMATE
+        return tokens
+        
+    async def _stream_content(
+        self,
+        contents: Any,
+        model: Optional[genai.GenerativeModel] = None,
+        **kwargs
+    ) -> AsyncGenerator[str, None]:
+        """Stream text chunks from Gemini without blocking the event loop"""
+        model = self._bind_client(model or self.model)
+        queued = time.perf_counter()
+        async with self.rate_limiter.acquire(tokens=self._estimate_tokens(contents)) as permit:
+            started = time.perf_counter()
+            observe_stage('llm_queue', started - queued)
+            first = True
+            try:
+                with IN_FLIGHT.track(operation='gemini_request'):
+                    response = await model.generate_content_async(
+                        contents=contents,
+                        stream=True,
+                        **kwargs
+                    )
+                    async for chunk in response:
+                        usage = getattr(chunk, 'usage_metadata', None)
+                        if usage is not None and usage.total_token_count:
+                            permit.tokens_used = usage.total_token_count
+                        text = self._chunk_text(chunk)
+                        if text:
+                            if first:
+                                observe_stage('llm_first_token', time.perf_counter() - started)
+                                first = False
+                            BYTES_TOTAL.inc(len(text.encode('utf-8')), direction='download', peer='llm')
+                            logger.debug("Received chunk: %.100s...", text)
+                            yield text
+            except google_exceptions.GoogleAPICallError as e:
+                raise ProviderError(f"Gemini request failed: {str(e)}", status=e.code) from e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise ProviderError(f"Gemini request failed: {str(e) or type(e).__name__}") from e
+            except BlockedPromptException as e:
+                raise ProviderError(f"Gemini blocked the prompt: {str(e)}", retryable=False) from e
+            except StopCandidateException as e:
+                raise ProviderError(f"Gemini stopped the response: {str(e)}") from e
+
+    @staticmethod
+    def _chunk_text(chunk: Any) -> str:
+        """Text of a streamed chunk; a blocked or empty candidate is a retryable ProviderError"""
+        try:
+            return chunk.text
+        except ValueError as e:
+            # The SDK's accessor raises ValueError when the candidate has no text parts
+            raise ProviderError(f"Gemini returned an unusable response: {str(e)}") from e
+    
+    async def fetch_image(self, image_url: str) -> bytes:
+        """Download the raw image bytes from a URL"""
+        return await self._fetch_image(image_url)
+        
+    async def warm_up(self) -> None:
+        """Open the API channel with a token count, which costs no generation quota"""
+        try:
+            await self._bind_client(self.model).count_tokens_async("ping")
+        except google_exceptions.GoogleAPICallError as e:
+            raise ProviderError(f"Gemini warm-up failed: {str(e)}", status=e.code) from e
+        
+    async def _stream_image_analysis(
+        self,
+        image_url: str,
+        prompt: Union[str, RenderedPrompt],
+        image: Optional[PreparedImage] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> AsyncGenerator[str, None]:
+        """Stream Gemini's analysis of an image, preparing it unless provided"""
+        if image is None:
+            image = await self.prepare_image(image_url)
+        
+        generation_config = self.generation_config
+        if response_schema is not None:
+            # Constrained decoding: the reply is JSON matching the schema
+            generation_config = {
+                **generation_config,
+                "response_mime_type": "application/json",
+                "response_schema": response_schema
+            }
+        
+        # Send only the per-request tail when the static prefix is cached
+        model = None
+        text = str(prompt)
+        if isinstance(prompt, RenderedPrompt):
+            model = await self._model_for_prefix(prompt.prefix)
+            if model is not None:
+                text = prompt.tail
+        
+        # Create content parts
+        content = [
+            {"text": text},
+            {"mime_type": image.mime_type, "data": image.data}
+        ]
+        
+        BYTES_TOTAL.inc(len(text.encode('utf-8')) + len(image.data), direction='upload', peer='llm')
+        logger.debug("Sending prompt: %.200s...", text)
+        logger.debug("Image data size: %d bytes (%s)", len(image.data), image.mime_type)
+        
+        async for text in self._stream_content(
+            content,
+            model=model,
+            generation_config=genai.types.GenerationConfig(**generation_config),
+            safety_settings=SAFETY_SETTINGS
+        ):
+            yield text
+            
     async def analyze_image(
         self,
         image_url: str,
-        prompt: str,
-        expect_json: bool = False
+        prompt: Union[str, RenderedPrompt],
+        expect_json: bool = False,
+        image: Optional[PreparedImage] = None,
+        response_schema: Optional[Dict[str, Any]] = None
     ) -> Union[str, Dict[str, Any]]:
         """Analyze an image using Gemini"""
         try:
-            # Fetch image data
-            image_data = await self._fetch_image(image_url)
-            
-            # Create content parts
-            content = [
-                {"text": prompt},
-                {"mime_type": "image/jpeg", "data": image_data}
-            ]
-            
-            logger.debug(f"Sending prompt: {prompt[:200]}...")
-            logger.debug(f"Image data size: {len(image_data)} bytes")
-            
-            # Configure the model
-            response = self.model.generate_content(
-                contents=content,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.1,
-                    top_p=0.99,
-                    top_k=10,
-                    max_output_tokens=2048,
-                    candidate_count=1
-                ),
-                safety_settings=[
-                    {
-                        "category": "HARM_CATEGORY_HARASSMENT",
-                        "threshold": "BLOCK_ONLY_HIGH"
-                    },
-                    {
-                        "category": "HARM_CATEGORY_HATE_SPEECH",
-                        "threshold": "BLOCK_ONLY_HIGH"
-                    },
-                    {
-                        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        "threshold": "BLOCK_ONLY_HIGH"
-                    },
-                    {
-                        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                        "threshold": "BLOCK_ONLY_HIGH"
-                    }
-                ],
-                stream=True
-            )
-            
-            # Collect response chunks
-            chunks = []
-            for chunk in response:
-                if chunk.text:
-                    chunks.append(chunk.text)
-                    logger.debug(f"Received chunk: {chunk.text[:100]}...")
+            stream = self._stream_image_analysis(image_url, prompt, image, response_schema)
             
-            # Process chunks into JSON if requested
+            # Parse chunks into JSON as they arrive if requested
             if expect_json:
-                return self._process_json_stream(chunks)
+                return await self._parse_stream(stream)
             
             # Otherwise return raw text
-            return ''.join(chunks)
+            return ''.join([text async for text in stream])
             
         except Exception as e:
             logger.error(f"Image analysis failed: {str(e)}")
             raise
             
+    async def analyze_image_stream(
+        self,
+        image_url: str,
+        prompt: Union[str, RenderedPrompt],
+        expect_json: bool = False,
+        image: Optional[PreparedImage] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> AsyncGenerator[Union[str, Dict[str, Any]], None]:
+        """Stream image analysis results from Gemini
+        
+        Yields raw text chunks as they arrive; when expect_json is set the
+        parsed object is yielded once the stream completes.
+        """
+        try:
+            stream = self._stream_image_analysis(image_url, prompt, image, response_schema)
+            if expect_json:
+                yield await self._parse_stream(stream)
+            else:
+                async for text in stream:
+                    yield text
+                
+        except Exception as e:
+            logger.error(f"Streaming image analysis failed: {str(e)}")
+            raise
+            
     async def generate(
         self,
         prompt: str,
@@ -210,22 +427,14 @@ class GeminiClient(BaseLLMClient):
     ) -> Union[str, Dict[str, Any]]:
         """Generate text using Gemini"""
         try:
-            # Generate content with streaming
-            response = self.model.generate_content(prompt, stream=True)
-            
-            # Collect response chunks
-            chunks = []
-            for chunk in response:
-                if chunk.text:
-                    chunks.append(chunk.text)
-                    logger.debug(f"Received chunk: {chunk.text[:100]}...")
+            stream = self._stream_content(prompt)
             
-            # Process chunks into JSON if requested
+            # Parse chunks into JSON as they arrive if requested
             if expect_json:
-                return self._process_json_stream(chunks)
+                return await self._parse_stream(stream)
             
             # Otherwise return raw text
-            return ''.join(chunks)
+            return ''.join([text async for text in stream])
             
         except Exception as e:
             logger.error(f"Text generation failed: {str(e)}")
@@ -0,0 +1,318 @@
+"""Load-balanced pool of LLM clients with hedged requests and failover"""
+import os
+import time
+import asyncio
+import logging
+import itertools
+from collections import deque
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Deque, Dict, List, Optional, Union
+import aiohttp
+from .llm_base import BaseLLMClient, LLMError
+from .image_preprocess import PreparedImage
+from .prompt_registry import RenderedPrompt
+
+logger = logging.getLogger(__name__)
+
+# Hedging: when a call has produced nothing after the HEDGE_PERCENTILE
+# latency of recent calls, send a duplicate to another member and use
+# whichever answers first. Until MIN_HEDGE_SAMPLES calls have been seen the
+# threshold is LLM_POOL_HEDGE_DELAY seconds. Hedges are capped at
+# LLM_POOL_HEDGE_BUDGET of requests so a slow provider is not hit twice as hard.
+HEDGE_PERCENTILE = 0.95
+MIN_HEDGE_SAMPLES = 20
+LATENCY_WINDOW = 200
+DEFAULT_HEDGE_DELAY = 5.0
+DEFAULT_HEDGE_BUDGET = 0.1
+
+# Members failing with a retryable error sit out for a doubling cooldown
+COOLDOWN_BASE_SECONDS = 1.0
+COOLDOWN_CAP_SECONDS = 30.0
+
+_DONE = object()
+
+
+class _Member:
+    """A pooled client and its health"""
+
+    def __init__(self, client: BaseLLMClient, index: int):
+        self.client = client
+        self.name = f"{client.model_name}#{index}"
+        self.outstanding = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def available(self, now: float) -> bool:
+        return self.cooldown_until <= now
+
+    def on_success(self) -> None:
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def on_failure(self) -> None:
+        cooldown = min(COOLDOWN_CAP_SECONDS, COOLDOWN_BASE_SECONDS * 2 ** self.failures)
+        self.failures += 1
+        self.cooldown_until = time.monotonic() + cooldown
+
+
+class LLMPool(BaseLLMClient):
+    """Spread calls over several clients (API keys, models or providers)
+
+    Each call goes to the available member with the fewest calls in flight.
+    A call that fails with a retryable error before producing output fails
+    over to another member; one that is slower than usual is hedged. Once a
+    streamed call has yielded output it stays on that member.
+    """
+
+    def __init__(
+        self,
+        members: List[BaseLLMClient],
+        hedge_delay: Optional[float] = None,
+        hedge_budget: Optional[float] = None,
+        http_session: Optional[aiohttp.ClientSession] = None
+    ):
+        if not members:
+            raise ValueError("LLMPool needs at least one member")
+        super().__init__(None, http_session)
+        self.members = [_Member(client, i) for i, client in enumerate(members)]
+        primary = members[0]
+        self.model_name = "pool:" + ",".join(sorted({client.model_name for client in members}))
+        self.generation_config = primary.generation_config
+        self.max_image_edge = primary.max_image_edge
+        self.hedge_delay = hedge_delay if hedge_delay is not None else float(
+            os.environ.get("LLM_POOL_HEDGE_DELAY", DEFAULT_HEDGE_DELAY)
+        )
+        self.hedge_budget = hedge_budget if hedge_budget is not None else float(
+            os.environ.get("LLM_POOL_HEDGE_BUDGET", DEFAULT_HEDGE_BUDGET)
+        )
+        # Time to first output per kind of call, e.g. streamed text vs whole JSON
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._rotation = itertools.count()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def set_http_session(self, http_session: Optional[aiohttp.ClientSession]) -> None:
+        """Share the connection pool with every member"""
+        self.http_session = http_session
+        for member in self.members:
+            member.client.set_http_session(http_session)
+
+    async def warm_up(self) -> None:
+        """Warm every member; one failing member does not stop the others"""
+        results = await asyncio.gather(
+            *[member.client.warm_up() for member in self.members], return_exceptions=True
+        )
+        for member, result in zip(self.members, results):
+            if isinstance(result, Exception):
+                logger.warning("Warm-up of pool member %s failed: %s", member.name, result)
+
+    async def fetch_image(self, image_url: str) -> bytes:
+        return await self.members[0].client.fetch_image(image_url)
+
+    async def prepare_image(self, image_url: str) -> PreparedImage:
+        # Prepared once, then shared by every member the call is sent to
+        return await self.members[0].client.prepare_image(image_url)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'failovers': self.failovers,
+            'hedge_thresholds': {kind: self._hedge_threshold(kind) for kind in self._latencies},
+            'members': {
+                member.name: {
+                    'outstanding': member.outstanding,
+                    'failures': member.failures,
+                    'cooling_down': not member.available(time.monotonic())
+                }
+                for member in self.members
+            }
+        }
+
+    def _pick(self, exclude: List[_Member], hedge: bool = False) -> Optional[_Member]:
+        """Least outstanding available member, rotating between ties"""
+        candidates = [member for member in self.members if member not in exclude]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        available = [member for member in candidates if member.available(now)]
+        if not available:
+            # Hedges are optional; a first try or failover takes the member recovering first
+            return None if hedge else min(candidates, key=lambda member: member.cooldown_until)
+        offset = next(self._rotation)
+        n = len(self.members)
+        return min(
+            available,
+            key=lambda member: (member.outstanding, (self.members.index(member) - offset) % n)
+        )
+
+    def _hedge_threshold(self, kind: str) -> float:
+        samples = self._latencies.get(kind)
+        if not samples or len(samples) < MIN_HEDGE_SAMPLES:
+            return self.hedge_delay
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE))]
+
+    def _record_latency(self, kind: str, latency: float) -> None:
+        if kind not in self._latencies:
+            self._latencies[kind] = deque(maxlen=LATENCY_WINDOW)
+        self._latencies[kind].append(latency)
+
+    def _can_hedge(self) -> bool:
+        return len(self.members) > 1 and self.hedges < self.hedge_budget * self.requests
+
+    async def _pump(
+        self,
+        attempt: int,
+        stream: AsyncIterator[Any],
+        queue: asyncio.Queue
+    ) -> None:
+        """Forward a member's output (then _DONE, or its error) to the race queue"""
+        try:
+            async for item in stream:
+                queue.put_nowait((attempt, item, None))
+            queue.put_nowait((attempt, _DONE, None))
+        except Exception as e:
+            queue.put_nowait((attempt, _DONE, e))
+
+    async def _race(
+        self,
+        kind: str,
+        call: Callable[[BaseLLMClient], AsyncIterator[Any]]
+    ) -> AsyncGenerator[Any, None]:
+        """Yield the output of call(member) from whichever member answers first"""
+        self.requests += 1
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks: Dict[int, asyncio.Task] = {}
+        members: Dict[int, _Member] = {}
+        started: Dict[int, float] = {}
+        tried: List[_Member] = []
+        winner: Optional[int] = None
+        hedge: Optional[int] = None
+        hedged = False
+
+        def launch(member: _Member) -> None:
+            attempt = len(tried)
+            tried.append(member)
+            members[attempt] = member
+            started[attempt] = time.monotonic()
+            # Counted from launch so concurrent calls see it before the task runs
+            member.outstanding += 1
+            tasks[attempt] = asyncio.create_task(self._pump(attempt, call(member.client), queue))
+            tasks[attempt].add_done_callback(lambda _: setattr(member, 'outstanding', member.outstanding - 1))
+
+        def settle(attempt: int) -> None:
+            nonlocal winner
+            winner = attempt
+            members[attempt].on_success()
+            self._record_latency(kind, time.monotonic() - started[attempt])
+            if attempt == hedge:
+                self.hedge_wins += 1
+            for other, task in tasks.items():
+                if other != attempt:
+                    task.cancel()
+
+        launch(self._pick(tried))
+        try:
+            while True:
+                timeout = None
+                if winner is None and not hedged and len(tasks) == 1 and self._can_hedge():
+                    (only,) = tasks
+                    timeout = max(0.0, started[only] + self._hedge_threshold(kind) - time.monotonic())
+                try:
+                    attempt, item, error = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    member = self._pick(tried, hedge=True)
+                    hedged = True
+                    if member is not None:
+                        self.hedges += 1
+                        hedge = len(tried)
+                        logger.info(f"Hedging slow {kind} call on {member.name}")
+                        launch(member)
+                    continue
+
+                if winner is not None and attempt != winner:
+                    continue
+                if error is not None:
+                    if winner is not None:
+                        raise error
+                    del tasks[attempt]
+                    if not getattr(error, 'retryable', False):
+                        raise error
+                    members[attempt].on_failure()
+                    if tasks:
+                        continue
+                    member = self._pick(tried)
+                    if member is None:
+                        raise error
+                    self.failovers += 1
+                    logger.warning(f"{members[attempt].name} failed, failing over to {member.name}: {str(error)}")
+                    launch(member)
+                    continue
+
+                if winner is None:
+                    settle(attempt)
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    async def _first(self, kind: str, call: Callable[[BaseLLMClient], Any]) -> Any:
+        """Race a non-streaming call; its completion is its first output"""
+        async def once(client: BaseLLMClient) -> AsyncGenerator[Any, None]:
+            yield await call(client)
+
+        race = self._race(kind, once)
+        try:
+            async for result in race:
+                return result
+        finally:
+            await race.aclose()
+        raise LLMError(f"No result from {self.model_name}")
+
+    async def analyze_image(
+        self,
+        image_url: str,
+        prompt: Union[str, RenderedPrompt],
+        expect_json: bool = False,
+        image: Optional[PreparedImage] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> Union[str, Dict[str, Any]]:
+        """Analyze an image on the first member to finish"""
+        if image is None:
+            image = await self.prepare_image(image_url)
+        return await self._first(
+            'analyze_image',
+            lambda client: client.analyze_image(image_url, prompt, expect_json, image, response_schema)
+        )
+
+    async def analyze_image_stream(
+        self,
+        image_url: str,
+        prompt: Union[str, RenderedPrompt],
+        expect_json: bool = False,
+        image: Optional[PreparedImage] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> AsyncGenerator[Union[str, Dict[str, Any]], None]:
+        """Stream from the first member to produce output"""
+        if image is None:
+            image = await self.prepare_image(image_url)
+        kind = 'analyze_image_stream:json' if expect_json else 'analyze_image_stream'
+        async for item in self._race(
+            kind,
+            lambda client: client.analyze_image_stream(image_url, prompt, expect_json, image, response_schema)
+        ):
+            yield item
+
+    async def generate(
+        self,
+        prompt: str,
+        expect_json: bool = False
+    ) -> Union[str, Dict[str, Any]]:
+        """Generate text on the first member to finish"""
+        return await self._first('generate', lambda client: client.generate(prompt, expect_json))
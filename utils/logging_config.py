@@ -0,0 +1,148 @@
+"""Non-blocking structured logging for the service
+
+Records are handed to a queue and formatted and written by a background
+thread, so request handlers never wait on stdout. Messages use logging's
+lazy %-style arguments; large payloads should be wrapped in brief() so at
+most a bounded prefix of them is ever rendered.
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import reprlib
+import logging
+import datetime
+import logging.handlers
+from typing import Any, Optional
+
+# Logging defaults, overridable through the environment:
+# LOG_LEVEL, LOG_FORMAT ("json" or "text"), LOG_MAX_MESSAGE_CHARS and
+# LOG_SAMPLE_RATE, the share of verbose per-request records (logged with
+# sampled()) that are kept
+DEFAULT_LEVEL = "INFO"
+DEFAULT_FORMAT = "json"
+DEFAULT_MAX_MESSAGE_CHARS = 2000
+DEFAULT_SAMPLE_RATE = 0.1
+# Bound on the rendered size of a brief() payload
+DEFAULT_BRIEF_CHARS = 500
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_sample_rate = DEFAULT_SAMPLE_RATE
+
+
+class _Brief:
+    """Log argument rendered with bounded size, and only if the record is emitted"""
+
+    _repr = reprlib.Repr()
+    _repr.maxstring = 200
+    _repr.maxother = 200
+    _repr.maxlevel = 4
+
+    def __init__(self, value: Any, limit: int = DEFAULT_BRIEF_CHARS):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else self._repr.repr(self.value)
+        if len(text) > self.limit:
+            return f"{text[:self.limit]}... [{len(text) - self.limit} more chars]"
+        return text
+
+    __repr__ = __str__
+
+
+def brief(value: Any, limit: int = DEFAULT_BRIEF_CHARS) -> _Brief:
+    """Wrap a log argument so at most about limit characters of it are rendered"""
+    return _Brief(value, limit)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records as they are; the listener thread does the formatting"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message and extra fields"""
+
+    def __init__(self, max_message_chars: int = DEFAULT_MAX_MESSAGE_CHARS):
+        super().__init__()
+        self.max_message_chars = max_message_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = _truncate(record.getMessage(), self.max_message_chars)
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': message
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic single-line format, with long messages truncated"""
+
+    def __init__(self, max_message_chars: int = DEFAULT_MAX_MESSAGE_CHARS):
+        super().__init__(TEXT_FORMAT)
+        self.max_message_chars = max_message_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = _truncate(record.message, self.max_message_chars)
+        return super().formatMessage(record)
+
+
+def _truncate(message: str, limit: int) -> str:
+    if limit and len(message) > limit:
+        return f"{message[:limit]}... [{len(message) - limit} more chars]"
+    return message
+
+
+def configure_logging() -> None:
+    """Route the root logger through a background writer thread; safe to call repeatedly"""
+    global _listener, _sample_rate
+    if _listener is not None:
+        return
+    _sample_rate = float(os.environ.get("LOG_SAMPLE_RATE", DEFAULT_SAMPLE_RATE))
+    max_chars = int(os.environ.get("LOG_MAX_MESSAGE_CHARS", DEFAULT_MAX_MESSAGE_CHARS))
+    if os.environ.get("LOG_FORMAT", DEFAULT_FORMAT).lower() == "text":
+        formatter: logging.Formatter = TextFormatter(max_chars)
+    else:
+        formatter = JSONFormatter(max_chars)
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(formatter)
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    root = logging.getLogger()
+    root.handlers = [_DeferredQueueHandler(records)]
+    root.setLevel(os.environ.get("LOG_LEVEL", DEFAULT_LEVEL).upper())
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def sampled() -> bool:
+    """Whether to emit this verbose per-request record (LOG_SAMPLE_RATE)"""
+    return _sample_rate >= 1 or random.random() < _sample_rate
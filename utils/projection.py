@@ -0,0 +1,46 @@
+"""Field projection for API responses"""
+from typing import Any, Dict, Iterable, List, Optional
+
+# Marks a path that is selected in full
+_ALL: Any = object()
+
+
+def parse_fields(values: Optional[Iterable[str]]) -> List[str]:
+    """Split comma-separated field lists (e.g. from repeated query parameters) into paths"""
+    paths = []
+    for value in values or []:
+        paths.extend(path.strip() for path in value.split(',') if path.strip())
+    return paths
+
+
+def _build_tree(paths: Iterable[str]) -> Dict[str, Any]:
+    tree: Dict[str, Any] = {}
+    for path in paths:
+        node = tree
+        parts = path.split('.')
+        for i, part in enumerate(parts):
+            child = node.get(part)
+            if child is _ALL:
+                break  # An ancestor is already selected in full
+            if i == len(parts) - 1:
+                node[part] = _ALL
+            else:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def _select(value: Any, tree: Dict[str, Any]) -> Any:
+    if tree is _ALL or not isinstance(value, dict):
+        return value
+    return {key: _select(value[key], subtree) for key, subtree in tree.items() if key in value}
+
+
+def project(data: Dict[str, Any], paths: Iterable[str], always: Iterable[str] = ()) -> Dict[str, Any]:
+    """Keep only the dotted paths of data (plus the top-level keys in always)
+
+    Selected values are shared with data, not copied; unknown paths are ignored.
+    """
+    tree = _build_tree(paths)
+    for key in always:
+        tree[key] = _ALL
+    return _select(data, tree)
@@ -0,0 +1,169 @@
+"""Registry of precompiled prompt templates from the prompts/ directory"""
+import os
+import re
+import time
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROMPTS_DIR = Path(__file__).parent.parent / "prompts"
+# Minimum seconds between mtime checks of a template file
+DEFAULT_RELOAD_INTERVAL = 2.0
+# Substituted for variables that are missing or None
+MISSING_VALUE = "Not specified"
+
+# Templates use ${name}; those without any fall back to {name}. A template
+# with ${name} placeholders keeps literal {name} text (e.g. examples) as-is.
+_DOLLAR_PLACEHOLDER = re.compile(r'\$\{(\w+)\}')
+_BRACE_PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+
+@dataclass(frozen=True)
+class RenderedPrompt:
+    """A rendered prompt split into its static prefix and per-request tail
+
+    The prefix is identical for every render of a template version, so it
+    can be cached provider-side; only the tail varies between requests.
+    """
+    prefix: str
+    tail: str
+
+    def __str__(self) -> str:
+        return self.prefix + self.tail
+
+
+class PromptTemplate:
+    """A prompt compiled once into literal segments and variable slots"""
+
+    def __init__(self, name: str, text: str, bound: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.source = text
+        bound = bound or {}
+        pattern = _DOLLAR_PLACEHOLDER if _DOLLAR_PLACEHOLDER.search(text) else _BRACE_PLACEHOLDER
+
+        # re.split with one group alternates literal, name, literal, ...
+        pieces = pattern.split(text)
+        literals = [pieces[0]]
+        names = []
+        for name_, literal in zip(pieces[1::2], pieces[2::2]):
+            if name_ in bound:
+                # Bound values are static: fold them into the literal text
+                literals[-1] += str(bound[name_]) + literal
+            else:
+                names.append(name_)
+                literals.append(literal)
+
+        self.prefix = literals[0]
+        self.variables: List[str] = names
+        self._literals = literals[1:]
+
+    def render(self, values: Optional[Dict[str, Any]] = None) -> RenderedPrompt:
+        """Fill the variable slots; missing or None values become MISSING_VALUE"""
+        values = values or {}
+        parts = []
+        for name, literal in zip(self.variables, self._literals):
+            value = values.get(name)
+            parts.append(MISSING_VALUE if value is None else str(value))
+            parts.append(literal)
+        return RenderedPrompt(self.prefix, ''.join(parts))
+
+
+class PromptRegistry:
+    """Load every template in a directory once, reloading files that change"""
+
+    def __init__(self, prompts_dir: Optional[Path] = None, reload_interval: Optional[float] = None):
+        self.prompts_dir = Path(prompts_dir or os.environ.get("PROMPTS_DIR", DEFAULT_PROMPTS_DIR))
+        if reload_interval is None:
+            reload_interval = float(os.environ.get("PROMPT_RELOAD_INTERVAL", DEFAULT_RELOAD_INTERVAL))
+        self.reload_interval = reload_interval
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._paths: Dict[str, Path] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._checked: Dict[str, float] = {}
+        self._bound: Dict[str, Dict[str, Any]] = {}
+
+        for path in sorted(self.prompts_dir.glob("*.md")):
+            self._paths[path.stem] = path
+            self._load(path.stem)
+        logger.info(f"Loaded {len(self._templates)} prompt templates from {self.prompts_dir}")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._templates
+
+    def names(self) -> List[str]:
+        return list(self._templates)
+
+    def add(self, name: str, text: str) -> None:
+        """Register an in-memory template that is not backed by a file"""
+        self._paths.pop(name, None)
+        self._compile(name, text)
+
+    def bind(self, name: str, **values: Any) -> None:
+        """Fix static variables of a template; they become part of its prefix"""
+        self._bound[name] = {**self._bound.get(name, {}), **values}
+        if name in self._templates:
+            self._compile(name, self._templates[name].source)
+
+    def derive(self, alias: str, name: str, **values: Any) -> None:
+        """Register alias as a variant of template name with extra static values
+
+        The variant reloads together with the original's file.
+        """
+        self._bound[alias] = {**self._bound.get(name, {}), **values}
+        if name in self._paths:
+            self._paths[alias] = self._paths[name]
+            self._load(alias)
+        else:
+            self._compile(alias, self._templates[name].source)
+
+    def get(self, name: str) -> PromptTemplate:
+        """Return the compiled template, reloading it if its file changed
+
+        Raises:
+            KeyError: If no template with that name exists
+        """
+        if name in self._paths:
+            now = time.monotonic()
+            if now - self._checked.get(name, 0.0) >= self.reload_interval:
+                self._checked[name] = now
+                try:
+                    mtime = self._paths[name].stat().st_mtime
+                except OSError:
+                    mtime = self._mtimes.get(name)
+                if mtime != self._mtimes.get(name):
+                    logger.info(f"Prompt changed on disk, reloading: {name}")
+                    self._load(name)
+        return self._templates[name]
+
+    def render(self, name: str, values: Optional[Dict[str, Any]] = None) -> RenderedPrompt:
+        return self.get(name).render(values)
+
+    def _load(self, name: str) -> None:
+        path = self._paths[name]
+        try:
+            mtime = path.stat().st_mtime
+            text = path.read_text(encoding='utf-8')
+        except OSError as e:
+            # Keep serving the last good version
+            logger.error(f"Failed to load prompt {path}: {str(e)}")
+            return
+        self._compile(name, text)
+        self._mtimes[name] = mtime
+        self._checked[name] = time.monotonic()
+
+    def _compile(self, name: str, text: str) -> None:
+        self._templates[name] = PromptTemplate(name, text, self._bound.get(name))
+
+
+_default_registry: Optional[PromptRegistry] = None
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """Process-wide registry of the templates in prompts/"""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = PromptRegistry()
+    return _default_registry
@@ -0,0 +1,255 @@
+"""Adaptive, priority-aware admission control for outbound LLM calls"""
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Limiter defaults
+DEFAULT_MAX_CONCURRENCY = 50
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_INITIAL_CONCURRENCY = 10
+
+# AIMD tuning: halve on throttling, shrink gently on latency spikes
+THROTTLE_BACKOFF_FACTOR = 0.5
+LATENCY_BACKOFF_FACTOR = 0.9
+LATENCY_SPIKE_FACTOR = 2.0
+LATENCY_EWMA_WEIGHT = 0.2
+# Pause new calls after a 429 so the quota window can recover
+THROTTLE_PAUSE_SECONDS = 1.0
+
+
+# Live limiters, read by the metrics gauges below
+_limiters: "weakref.WeakSet[AdaptiveRateLimiter]" = weakref.WeakSet()
+
+
+def _collect(field: str) -> Dict[Tuple[str, ...], float]:
+    values: Dict[Tuple[str, ...], float] = {}
+    for limiter in list(_limiters):
+        # Limiters sharing a name (e.g. one per API key) are summed
+        key = (limiter.name,)
+        values[key] = values.get(key, 0.0) + limiter.stats()[field]
+    return values
+
+
+REGISTRY.gauge('seo_llm_concurrency_limit', 'Current adaptive concurrency limit', ['limiter'],
+               collect=lambda: _collect('limit'))
+REGISTRY.gauge('seo_llm_queued', 'Calls waiting for admission', ['limiter'],
+               collect=lambda: _collect('queued'))
+REGISTRY.gauge('seo_llm_throttled', 'Calls throttled by the provider since startup', ['limiter'],
+               collect=lambda: _collect('throttled'))
+
+
+class Priority(IntEnum):
+    """Scheduling classes; lower values are admitted first"""
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+_current_priority: ContextVar[Priority] = ContextVar('llm_priority', default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: Priority) -> Iterator[None]:
+    """Run LLM calls made in this context (and tasks it creates) at priority"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class _TokenBucket:
+    """Per-minute budget refilled continuously"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """Refund (positive) or charge (negative) once the real cost is known"""
+        self.level = min(self.capacity, self.level + delta)
+
+
+class Permit:
+    """Admission to make one call; set tokens_used once the real usage is known"""
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+        self.tokens_used: Optional[int] = None
+
+
+class AdaptiveRateLimiter:
+    """AIMD concurrency limit plus request/token budgets in front of a provider
+
+    The concurrency limit grows by about one per round trip while calls
+    succeed, is halved when the provider throttles (HTTP 429) and shrinks
+    gently when latency spikes above its running average. Callers wait in
+    priority order (see llm_priority), FIFO within a class.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        min_concurrency: int = DEFAULT_MIN_CONCURRENCY,
+        initial_concurrency: int = DEFAULT_INITIAL_CONCURRENCY,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        name: str = "llm"
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = max(1, min_concurrency)
+        self.limit = float(max(self.min_concurrency, min(initial_concurrency, max_concurrency)))
+        # A budget of 0 means unlimited
+        self._requests = _TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+        self.in_flight = 0
+        self.throttled = 0
+        self._waiters: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._latency_ewma: Optional[float] = None
+        self._last_decrease = 0.0
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        _limiters.add(self)
+
+    @asynccontextmanager
+    async def acquire(self, tokens: int = 0, priority: Optional[Priority] = None) -> AsyncIterator[Permit]:
+        """Wait for admission, then hold a slot for the duration of the call
+
+        An exception with status 429 leaving the block counts as throttling.
+        """
+        if priority is None:
+            priority = _current_priority.get()
+        await self._wait_turn(int(priority), tokens)
+        permit = Permit(tokens)
+        started = time.monotonic()
+        try:
+            yield permit
+        except BaseException as e:
+            if getattr(e, 'status', None) == 429:
+                self._on_throttled()
+            raise
+        else:
+            self._on_success(time.monotonic() - started)
+        finally:
+            self.in_flight -= 1
+            if self._tokens is not None and permit.tokens_used is not None:
+                self._tokens.adjust(tokens - permit.tokens_used)
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'limit': round(self.limit, 2),
+            'in_flight': self.in_flight,
+            'queued': sum(1 for *_, future in self._waiters if not future.done()),
+            'throttled': self.throttled,
+            'latency_ewma': self._latency_ewma
+        }
+
+    async def _wait_turn(self, priority: int, tokens: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the caller was cancelled: give the slot back
+                self.in_flight -= 1
+                self._dispatch()
+            raise
+
+    def _dispatch(self) -> None:
+        """Admit waiters in priority order while capacity and budgets allow"""
+        now = time.monotonic()
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= int(self.limit):
+                return
+            # The head waits for budget rather than letting cheaper calls starve it
+            delay = self._paused_until - now
+            if self._requests is not None:
+                delay = max(delay, self._requests.delay(1, now))
+            if self._tokens is not None and tokens:
+                delay = max(delay, self._tokens.delay(tokens, now))
+            if delay > 0:
+                self._schedule_wakeup(delay)
+                return
+            heapq.heappop(self._waiters)
+            if self._requests is not None:
+                self._requests.take(1)
+            if self._tokens is not None:
+                self._tokens.take(tokens)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _schedule_wakeup(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._wakeup is not None and not self._wakeup.cancelled() and self._wakeup.when() <= when:
+            return
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+        self._wakeup = loop.call_at(when, self._on_wakeup)
+
+    def _on_wakeup(self) -> None:
+        self._wakeup = None
+        self._dispatch()
+
+    def _on_success(self, latency: float) -> None:
+        spike = self._latency_ewma is not None and latency > self._latency_ewma * LATENCY_SPIKE_FACTOR
+        if self._latency_ewma is None:
+            self._latency_ewma = latency
+        else:
+            self._latency_ewma += LATENCY_EWMA_WEIGHT * (latency - self._latency_ewma)
+        if spike:
+            self._decrease(LATENCY_BACKOFF_FACTOR, f"latency spike ({latency:.1f}s)")
+        else:
+            # Additive increase: about +1 per limit's worth of successful calls
+            self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+
+    def _on_throttled(self) -> None:
+        self.throttled += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + THROTTLE_PAUSE_SECONDS)
+        self._decrease(THROTTLE_BACKOFF_FACTOR, "throttled by provider")
+
+    def _decrease(self, factor: float, reason: str) -> None:
+        now = time.monotonic()
+        # Calls already in flight report the same congestion; react once per round trip
+        if now - self._last_decrease < max(1.0, self._latency_ewma or 0.0):
+            return
+        self._last_decrease = now
+        limit = max(float(self.min_concurrency), self.limit * factor)
+        if limit == self.limit:
+            return
+        self.limit = limit
+        logger.warning(f"{self.name} concurrency limit lowered to {self.limit:.1f}: {reason}")
@@ -0,0 +1,171 @@
+"""Fast response serialization with content and encoding negotiation
+
+Large analysis payloads skip FastAPI's jsonable_encoder: they are
+serialized once, straight to bytes, in the format the client asked for in
+Accept (JSON, MessagePack or CBOR), and compressed with zstd or gzip per
+Accept-Encoding once they are big enough to benefit.
+
+orjson, msgpack, cbor2 and zstandard are optional; without them responses
+fall back to stdlib JSON and gzip.
+"""
+import os
+import gzip
+import json
+import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+from .metrics import stage
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; stdlib json is used instead
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack is only offered when installed
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # CBOR is only offered when installed
+    cbor2 = None
+
+try:
+    import zstandard
+except ImportError:  # zstd is only offered when installed
+    zstandard = None
+
+# Compression defaults, overridable through the environment:
+# RESPONSE_COMPRESSION_MIN_BYTES (0 disables compression) and the levels,
+# chosen for speed since compression runs on the event loop
+DEFAULT_COMPRESSION_MIN_BYTES = 1024
+DEFAULT_GZIP_LEVEL = 5
+DEFAULT_ZSTD_LEVEL = 3
+
+JSON_MEDIA_TYPE = 'application/json'
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+CBOR_MEDIA_TYPE = 'application/cbor'
+
+COMPRESSION_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", DEFAULT_COMPRESSION_MIN_BYTES))
+GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", DEFAULT_GZIP_LEVEL))
+ZSTD_LEVEL = int(os.environ.get("RESPONSE_ZSTD_LEVEL", DEFAULT_ZSTD_LEVEL))
+
+
+def _default(value: Any) -> Any:
+    """Convert what the serializers don't handle natively"""
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def dumps_json(content: Any) -> bytes:
+    """Serialize content to compact JSON bytes, with orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _dumps_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, default=_default, use_bin_type=True)
+
+
+def _dumps_cbor(content: Any) -> bytes:
+    return cbor2.dumps(content, default=lambda encoder, value: encoder.encode(_default(value)))
+
+
+# Media types in order of preference, with the serializer for each
+_SERIALIZERS: List[Tuple[str, Callable[[Any], bytes]]] = [(JSON_MEDIA_TYPE, dumps_json)]
+if msgpack is not None:
+    _SERIALIZERS.append((MSGPACK_MEDIA_TYPE, _dumps_msgpack))
+if cbor2 is not None:
+    _SERIALIZERS.append((CBOR_MEDIA_TYPE, _dumps_cbor))
+
+# Aliases clients send for the same formats
+_MEDIA_ALIASES = {'application/x-msgpack': MSGPACK_MEDIA_TYPE, 'application/vnd.msgpack': MSGPACK_MEDIA_TYPE}
+
+# Content codings in order of preference
+_ENCODINGS = ['zstd', 'gzip'] if zstandard is not None else ['gzip']
+
+
+def _parse_header(value: Optional[str]) -> Dict[str, float]:
+    """Map each token of an Accept-style header to its quality"""
+    qualities: Dict[str, float] = {}
+    for part in (value or '').split(','):
+        token, *params = [piece.strip() for piece in part.split(';')]
+        if not token:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, raw = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(raw)
+                except ValueError:
+                    quality = 0.0
+        token = token.lower()
+        qualities[_MEDIA_ALIASES.get(token, token)] = quality
+    return qualities
+
+
+def _negotiate(header: Optional[str], offered: List[str], wildcard: str) -> Optional[str]:
+    """Highest-quality offered token, ties going to the earlier offer"""
+    qualities = _parse_header(header)
+    best, best_quality = None, 0.0
+    for token in offered:
+        quality = qualities.get(token, qualities.get(wildcard, 0.0))
+        if quality > best_quality:
+            best, best_quality = token, quality
+    return best
+
+
+def choose_media_type(accept: Optional[str]) -> Tuple[str, Callable[[Any], bytes]]:
+    """Serializer for an Accept header; JSON unless another format is preferred"""
+    media_type = _negotiate(accept, [media for media, _ in _SERIALIZERS], '*/*')
+    for media, serializer in _SERIALIZERS:
+        if media == media_type:
+            return media, serializer
+    return _SERIALIZERS[0]
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Content coding for an Accept-Encoding header, or None for identity"""
+    return _negotiate(accept_encoding, _ENCODINGS, '*')
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when available"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
+
+
+def negotiated_response(
+    request: Request,
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """Serialize content in the format the client accepts, compressed when worthwhile"""
+    with stage('response_serialize'):
+        media_type, serializer = choose_media_type(request.headers.get('accept'))
+        body = serializer(content)
+        response_headers = {'Vary': 'Accept, Accept-Encoding', **(headers or {})}
+        if COMPRESSION_MIN_BYTES and len(body) >= COMPRESSION_MIN_BYTES:
+            encoding = choose_encoding(request.headers.get('accept-encoding'))
+            if encoding is not None:
+                body = compress(body, encoding)
+                response_headers['Content-Encoding'] = encoding
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=response_headers)
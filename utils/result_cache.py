@@ -0,0 +1,226 @@
+"""Persistent cache of LLM analysis results"""
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, Any, Optional
+from .metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Cache defaults, overridable through the environment
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / ".cache" / "results.sqlite3"
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# How often a worker waiting on another worker's lease checks for the result
+LEASE_POLL_SECONDS = 0.25
+
+
+class ResultCache:
+    """SQLite-backed result cache with TTL and size-based LRU eviction
+
+    Keys combine the image content hash, the rendered prompt hash, the
+    model name and the generation config, so any change to what would be
+    sent to the provider produces a miss.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        ttl_seconds: Optional[float] = None,
+        max_bytes: Optional[int] = None
+    ):
+        self.path = Path(path or os.environ.get("RESULT_CACHE_PATH", DEFAULT_CACHE_PATH))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(
+            os.environ.get("RESULT_CACHE_TTL", DEFAULT_TTL_SECONDS)
+        )
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.environ.get("RESULT_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+        )
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # Identifies this process's leases in the shared database
+        self._owner = uuid.uuid4().hex
+
+    @staticmethod
+    def make_key(
+        image_data: bytes,
+        prompt: str,
+        model_name: str,
+        generation_config: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Build the cache key for an image/prompt/model combination"""
+        parts = [
+            hashlib.sha256(image_data).hexdigest(),
+            hashlib.sha256(prompt.encode('utf-8')).hexdigest(),
+            model_name,
+            json.dumps(generation_config or {}, sort_keys=True)
+        ]
+        return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def _put(self, key: str, result: Dict[str, Any]) -> None:
+        value = json.dumps(result, separators=(',', ':')).encode('utf-8')
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """Drop expired rows, then least recently used rows over the size budget"""
+        conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY accessed_at"):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM results WHERE key = ?", doomed)
+        logger.info(f"Evicted {len(doomed)} cached results over the {self.max_bytes} byte budget")
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached result, or None on a miss or cache failure"""
+        try:
+            result = await asyncio.to_thread(self._get, key)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Result cache read failed: {str(e)}")
+            result = None
+        if result is None:
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache='result', outcome='miss')
+        else:
+            self.hits += 1
+            CACHE_LOOKUPS.inc(cache='result', outcome='hit')
+        return result
+
+    async def put(self, key: str, result: Dict[str, Any]) -> None:
+        """Store a validated result; failures are logged and ignored"""
+        try:
+            await asyncio.to_thread(self._put, key, result)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Result cache write failed: {str(e)}")
+
+    def _acquire_lease(self, key: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            # Take the lease if it is free or its holder's lease ran out
+            rows = conn.execute(
+                "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.expires_at < ? RETURNING owner",
+                (key, self._owner, now + ttl_seconds, now)
+            ).fetchall()
+        return bool(rows)
+
+    def _release_lease(self, key: str) -> None:
+        with self._lock:
+            self._connect().execute(
+                "DELETE FROM leases WHERE key = ? AND owner = ?", (key, self._owner)
+            )
+
+    def _lease_held(self, key: str) -> bool:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT 1 FROM leases WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return row is not None
+
+    async def acquire_lease(self, key: str, ttl_seconds: float) -> bool:
+        """Claim the right to compute key across worker processes
+
+        Returns False while another worker holds an unexpired lease. Cache
+        failures grant the lease, so computation is never blocked on them.
+        """
+        try:
+            return await asyncio.to_thread(self._acquire_lease, key, ttl_seconds)
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache lease failed: {str(e)}")
+            return True
+
+    async def release_lease(self, key: str) -> None:
+        try:
+            await asyncio.to_thread(self._release_lease, key)
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache lease release failed: {str(e)}")
+
+    async def wait_for(self, key: str) -> Optional[Dict[str, Any]]:
+        """Wait for the lease holder to store key's result
+
+        Returns None once the lease is released or expires without a
+        result (the holder failed), so the caller can compute it itself.
+        """
+        while True:
+            # Polls bypass get() so they do not count as cache misses
+            try:
+                result = await asyncio.to_thread(self._get, key)
+                held = result is None and await asyncio.to_thread(self._lease_held, key)
+            except (sqlite3.Error, ValueError):
+                return None
+            if result is not None:
+                self.hits += 1
+                CACHE_LOOKUPS.inc(cache='result', outcome='hit')
+                return result
+            if not held:
+                # The result may have landed just before the release
+                return await self.get(key)
+            await asyncio.sleep(LEASE_POLL_SECONDS)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters since startup"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0
+        }
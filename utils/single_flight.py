@@ -0,0 +1,96 @@
+"""Coalesce concurrent identical calls into one in-flight execution"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class EventFanout:
+    """Progress callback that forwards events to every subscriber
+
+    Events are recorded, so a subscriber joining late first receives
+    everything it missed.
+    """
+
+    def __init__(self):
+        self.history: List[Tuple[str, Dict[str, Any]]] = []
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+
+    def __call__(self, event: str, data: Dict[str, Any]) -> None:
+        self.history.append((event, data))
+        for listener in list(self._listeners):
+            listener(event, data)
+
+    def subscribe(self, listener: Callable[[str, Dict[str, Any]], None]) -> Callable[[], None]:
+        """Replay past events to listener and keep it subscribed; returns an unsubscribe function"""
+        for event, data in self.history:
+            listener(event, data)
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task, fanout: EventFanout):
+        self.task = task
+        self.fanout = fanout
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its outcome
+
+    The call runs in its own task, so a caller going away (e.g. a client
+    disconnect cancelling its request) does not cancel the work for the
+    others; the call is cancelled only once every caller has gone.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._flights
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def run(
+        self,
+        key: str,
+        fn: Callable[[EventFanout], Awaitable[T]],
+        on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None
+    ) -> T:
+        """Await fn(fanout) for key, joining the in-flight call if there is one
+
+        fn receives the flight's EventFanout to report progress through;
+        on_event, if given, is subscribed to it.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            fanout = EventFanout()
+            task = asyncio.create_task(fn(fanout))
+            flight = _Flight(task, fanout)
+            self._flights[key] = flight
+            task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            logger.info(f"Joining in-flight call: {key[:16]}")
+
+        unsubscribe = flight.fanout.subscribe(on_event) if on_event is not None else None
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                logger.info(f"Last caller went away, cancelling call: {key[:16]}")
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+            if unsubscribe is not None:
+                unsubscribe()
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
@@ -1,73 +1,229 @@
 # url_converter.py
+import os
 import re
+import time
+import base64
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import aiohttp
+from .metrics import CACHE_LOOKUPS
+from .single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Resolved-URL cache defaults, overridable through the environment
+# (URL_CACHE_SIZE entries, URL_CACHE_TTL seconds). Redirect targets of
+# share links can be temporary, so entries expire.
+DEFAULT_CACHE_SIZE = 4096
+DEFAULT_CACHE_TTL = 900
+# Size variant requested from Google's image servers when the caller has no
+# target edge; clients pass the longest edge their model uses
+DEFAULT_TARGET_EDGE = 3000
+# Seconds allowed for following a share link's redirects
+RESOLVE_TIMEOUT_SECONDS = 10.0
+# Redirect chains followed per resolution: a short link (db.tt) lands on a
+# share page, whose converted link redirects to the file
+MAX_LINK_HOPS = 3
+
+# Drive file ids: /d/{id}, /file/d/{id} or ?id={id}
+_DRIVE_ID_RE = re.compile(r"/d/([^/?#]+)|[?&]id=([^&#]+)")
+# Size suffix of a googleusercontent URL, e.g. =w3000, =s1600 or =w800-h600
+_GOOGLE_SIZE_RE = re.compile(r"=[ws]\d+(?:-h\d+)?$")
+
+# Hosts whose converted links answer with redirects to the file itself
+_REDIRECTING_HOSTS = frozenset({'dropbox.com', 'db.tt', 'api.onedrive.com', '1drv.ms'})
+
+
+def _host(url: str) -> str:
+    host = (urlsplit(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
 
 class URLConverter:
-    def convert_url(self, viewer_url):
+    """Turns share/viewer links into direct image URLs, caching the results
+
+    Conversion dispatches on the host; resolve() additionally follows the
+    redirects of share links once and caches the final URL, so repeated
+    fetches of the same image go straight to the file.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entries = max_entries or int(os.environ.get("URL_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+        self.ttl = ttl if ttl is not None else float(os.environ.get("URL_CACHE_TTL", DEFAULT_CACHE_TTL))
+        # (url, target edge) -> (resolved url, expires at)
+        self._resolved: "OrderedDict[Tuple[str, int], Tuple[Optional[str], float]]" = OrderedDict()
+        self._resolving = SingleFlight()
+        self._handlers: Dict[str, Callable[[str, int], Optional[str]]] = {
+            'lh3.googleusercontent.com': self._resize_google_url,
+            'drive.google.com': self._convert_google_drive_url,
+            'docs.google.com': self._convert_google_drive_url,
+            'dropbox.com': self._convert_dropbox_url,
+            'db.tt': self._expand_short_link,
+            'onedrive.live.com': self._convert_onedrive_url,
+            '1drv.ms': self._convert_onedrive_url
+        }
+
+    def convert_url(self, viewer_url, max_edge=None):
         """
         Converts a URL to a direct download URL, automatically detecting the service.
-        Supports Google Drive, Dropbox, and basic OneDrive conversion.
+        Supports Google Drive, Dropbox and OneDrive share links; Google-hosted
+        images are requested at a size variant fitting max_edge.
         Returns the direct download URL if successful, otherwise None.
         """
-        if "lh3.googleusercontent.com" in viewer_url:
-            # Already a direct URL
+        key = (viewer_url, max_edge or DEFAULT_TARGET_EDGE)
+        if self._is_direct(viewer_url):
+            return self._convert(*key)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached[0]
+        direct_url = self._convert(*key)
+        self._remember(key, direct_url)
+        return direct_url
+
+    async def resolve(
+        self,
+        viewer_url: str,
+        session: Optional[aiohttp.ClientSession] = None,
+        max_edge: Optional[int] = None
+    ) -> Optional[str]:
+        """Direct URL of viewer_url with share-link redirects followed, or None
+
+        Redirects are followed once per cache lifetime; concurrent resolutions
+        of the same URL share one request. URLs that are direct already, such
+        as ones this method returned, come back as they are (bar a Google size
+        suffix) without touching the cache.
+        """
+        key = (viewer_url, max_edge or DEFAULT_TARGET_EDGE)
+        if self._is_direct(viewer_url):
+            return self._convert(*key)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached[0]
+        return await self._resolving.run(repr(key), lambda _: self._resolve(key, session))
+
+    async def _resolve(self, key: Tuple[str, int], session: Optional[aiohttp.ClientSession]) -> Optional[str]:
+        direct_url = self._convert(*key)
+        for _ in range(MAX_LINK_HOPS):
+            if direct_url is None or _host(direct_url) not in _REDIRECTING_HOSTS:
+                break
+            final_url = await self._follow_redirects(direct_url, session)
+            if final_url is None:
+                # Not cached: the next request tries again
+                return direct_url
+            next_url = None if self._is_direct(final_url) else self._convert(final_url, key[1])
+            if next_url is None or next_url == direct_url:
+                direct_url = final_url
+                break
+            # Landed on another share link (e.g. db.tt -> dropbox.com); convert it in turn
+            direct_url = next_url
+        self._remember(key, direct_url)
+        return direct_url
+
+    async def _follow_redirects(self, url: str, session: Optional[aiohttp.ClientSession]) -> Optional[str]:
+        """Final URL after redirects, or None if it could not be determined"""
+        timeout = aiohttp.ClientTimeout(total=RESOLVE_TIMEOUT_SECONDS)
+        try:
+            if session is not None:
+                async with session.head(url, allow_redirects=True, timeout=timeout) as response:
+                    return str(response.url) if response.status < 400 else None
+            async with aiohttp.ClientSession(timeout=timeout) as own_session:
+                async with own_session.head(url, allow_redirects=True) as response:
+                    return str(response.url) if response.status < 400 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Could not resolve redirects of %s: %s", url, str(e) or type(e).__name__)
+            return None
+
+    def _cached(self, key: Tuple[str, int]) -> Optional[Tuple[Optional[str], float]]:
+        entry = self._resolved.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            self._resolved.move_to_end(key)
+            CACHE_LOOKUPS.inc(cache='url', outcome='hit')
+            return entry
+        CACHE_LOOKUPS.inc(cache='url', outcome='miss')
+        return None
+
+    def _remember(self, key: Tuple[str, int], direct_url: Optional[str]) -> None:
+        self._resolved[key] = (direct_url, time.monotonic() + self.ttl)
+        self._resolved.move_to_end(key)
+        while len(self._resolved) > self.max_entries:
+            self._resolved.popitem(last=False)
+
+    def _handler(self, url: str) -> Optional[Callable[[str, int], Optional[str]]]:
+        host = _host(url)
+        handler = self._handlers.get(host)
+        if handler is None and host.endswith('.dropbox.com'):
+            handler = self._convert_dropbox_url
+        return handler
+
+    def _is_direct(self, url: str) -> bool:
+        """Whether url needs no share-link conversion, only a cheap rewrite at most"""
+        handler = self._handler(url)
+        return handler is None or handler == self._resize_google_url
+
+    def _convert(self, viewer_url: str, max_edge: int) -> Optional[str]:
+        handler = self._handler(viewer_url)
+        if handler is None:
+            # Most URLs (CDNs, shops) are direct already
+            logger.debug("URL service not recognized, using URL as-is: %s", viewer_url)
             return viewer_url
-        elif "drive.google.com" in viewer_url:
-            return self._convert_google_drive_url(viewer_url)
-        elif "dropbox.com" in viewer_url:
-            return self._convert_dropbox_url(viewer_url)
-        elif "onedrive.live.com" in viewer_url or "1drv.ms" in viewer_url:
-            return self._convert_onedrive_url(viewer_url)
-        else:
-            print(f"Warning: URL service not recognized for: {viewer_url}.  Returning original URL (may not be direct download).")
-            return viewer_url # Return original URL as fallback if service is not recognized
-
-    def _convert_google_drive_url(self, viewer_url):
+        return handler(viewer_url, max_edge)
+
+    def _resize_google_url(self, url, max_edge):
+        """
+        Requests a Google-hosted image at the size variant fitting max_edge. (Private method)
+        """
+        size = f"=w{max_edge}-h{max_edge}"
+        if _GOOGLE_SIZE_RE.search(url):
+            return _GOOGLE_SIZE_RE.sub(size, url)
+        if urlsplit(url).path.startswith('/d/') and '=' not in url:
+            return url + size
+        return url  # Other parameter forms are left as the caller gave them
+
+    def _convert_google_drive_url(self, viewer_url, max_edge):
         """
         Converts a Google Drive viewer URL to a direct download URL. (Private method)
         """
-        print(f"\nDebug - Converting Google Drive URL: {viewer_url}")
-        
-        # Try to find file ID in different URL formats
-        file_id = None
-        
-        # Format 1: /d/{file_id}/
-        file_id_match = re.search(r"/d/(.*?)/", viewer_url)
-        if file_id_match:
-            file_id = file_id_match.group(1)
-            print(f"Found file ID via /d/ format: {file_id}")
-        
-        # Format 2: open?id={file_id}
-        if not file_id:
-            file_id_match = re.search(r"[?&]id=([^&]+)", viewer_url)
-            if file_id_match:
-                file_id = file_id_match.group(1)
-                print(f"Found file ID via open?id format: {file_id}")
-        
-        # Format 3: /file/d/{file_id}/
-        if not file_id:
-            file_id_match = re.search(r"/file/d/(.*?)/", viewer_url)
-            if file_id_match:
-                file_id = file_id_match.group(1)
-                print(f"Found file ID via /file/d/ format: {file_id}")
-        
-        if not file_id:
-            print("Could not extract file ID from URL")
+        match = _DRIVE_ID_RE.search(viewer_url)
+        if not match:
+            logger.warning("Could not extract Google Drive file ID from URL: %s", viewer_url)
             return None
-        
-        # Use high-res preview URL (w=3000 for large size)
-        direct_url = f"https://lh3.googleusercontent.com/d/{file_id}=w3000"
-        print(f"Generated direct URL: {direct_url}")
+        file_id = match.group(1) or match.group(2)
+        direct_url = f"https://lh3.googleusercontent.com/d/{file_id}=w{max_edge}-h{max_edge}"
+        logger.debug("Converted Google Drive URL %s to %s", viewer_url, direct_url)
         return direct_url
 
-    def _convert_dropbox_url(self, viewer_url):
+    def _convert_dropbox_url(self, viewer_url, max_edge):
         """
         Converts a Dropbox share URL to a direct download URL. (Private method)
         """
-        return viewer_url.replace("?dl=0", "?dl=1")
+        parts = urlsplit(viewer_url)
+        query = [(name, value) for name, value in parse_qsl(parts.query) if name not in ('dl', 'raw')]
+        query.append(('dl', '1'))
+        return urlunsplit(parts._replace(query=urlencode(query)))
+
+    def _expand_short_link(self, viewer_url, max_edge):
+        """
+        Short links (db.tt) are kept as they are; resolve() follows their redirects. (Private method)
+        """
+        return viewer_url
 
-    def _convert_onedrive_url(self, viewer_url):
+    def _convert_onedrive_url(self, viewer_url, max_edge):
         """
-        Placeholder for OneDrive URL conversion (needs more robust implementation). (Private method)
+        Converts a OneDrive share link (long or 1drv.ms) to the shares API download URL. (Private method)
         """
-        print("Warning: Basic OneDrive URL conversion - may not be reliable.")
-        return None  # Placeholder - needs improvement
\ No newline at end of file
+        token = base64.urlsafe_b64encode(viewer_url.encode('utf-8')).decode('ascii').rstrip('=')
+        return f"https://api.onedrive.com/v1.0/shares/u!{token}/root/content"
+
+
+_default_converter: Optional[URLConverter] = None
+
+
+def get_url_converter() -> URLConverter:
+    """Process-wide URL converter, so conversions are cached across callers"""
+    global _default_converter
+    if _default_converter is None:
+        _default_converter = URLConverter()
+    return _default_converter